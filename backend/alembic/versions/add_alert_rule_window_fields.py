@@ -0,0 +1,28 @@
+"""add windowed rule fields to alert_rules
+
+Revision ID: add_alert_rule_window_fields
+Revises: add_query_indexes
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_alert_rule_window_fields'
+down_revision = 'add_query_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 规则类型：threshold（默认，已有规则）、window_avg、consecutive、rate
+    op.add_column('alert_rules', sa.Column('rule_type', sa.String(20), nullable=False, server_default='threshold'))
+    op.add_column('alert_rules', sa.Column('window_seconds', sa.Integer(), nullable=True))
+    op.add_column('alert_rules', sa.Column('consecutive_count', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('alert_rules', 'consecutive_count')
+    op.drop_column('alert_rules', 'window_seconds')
+    op.drop_column('alert_rules', 'rule_type')
@@ -0,0 +1,39 @@
+"""add alert state fields for deduplicated alerts
+
+Revision ID: add_alert_state_fields
+Revises: add_alert_rule_window_fields
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_alert_state_fields'
+down_revision = 'add_alert_rule_window_fields'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 恢复滞回区间（已有规则为0，即越过阈值即恢复）
+    op.add_column('alert_rules', sa.Column('hysteresis', sa.Float(), nullable=False, server_default='0'))
+
+    # 告警未恢复期间的触发次数和最近触发时间
+    op.add_column('monitoring_alerts', sa.Column('occurrence_count', sa.Integer(), nullable=False, server_default='1'))
+    op.add_column('monitoring_alerts', sa.Column('last_seen_at', sa.DateTime(), nullable=True))
+    op.execute('UPDATE monitoring_alerts SET last_seen_at = created_at')
+
+    # 启动时加载未恢复的告警
+    op.create_index(
+        'ix_monitoring_alerts_open_device_id_rule_id',
+        'monitoring_alerts', ['device_id', 'rule_id'],
+        postgresql_where=sa.text("status <> 'resolved'")
+    )
+
+
+def downgrade():
+    op.drop_index('ix_monitoring_alerts_open_device_id_rule_id', table_name='monitoring_alerts')
+    op.drop_column('monitoring_alerts', 'last_seen_at')
+    op.drop_column('monitoring_alerts', 'occurrence_count')
+    op.drop_column('alert_rules', 'hysteresis')
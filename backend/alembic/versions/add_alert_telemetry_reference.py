@@ -0,0 +1,45 @@
+"""reference device_telemetry rows from monitoring alerts
+
+Revision ID: add_alert_telemetry_reference
+Revises: add_alert_state_fields
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_alert_telemetry_reference'
+down_revision = 'add_alert_state_fields'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # compact 存储模式的告警引用 device_telemetry 行和指标名，不再使用 metrics_id
+    op.add_column('monitoring_alerts', sa.Column('telemetry_id', sa.BigInteger(), nullable=True))
+    op.add_column('monitoring_alerts', sa.Column('metric_name', sa.String(), nullable=True))
+    op.alter_column('monitoring_alerts', 'metrics_id', existing_type=sa.String(), nullable=True)
+
+    # 迁移已写入的 "<telemetry_id>:<指标名>" 格式
+    op.execute(
+        "UPDATE monitoring_alerts SET telemetry_id = split_part(metrics_id, ':', 1)::bigint, "
+        "metric_name = split_part(metrics_id, ':', 2), metrics_id = NULL "
+        "WHERE metrics_id ~ '^[0-9]+:'"
+    )
+    # 其余告警按规则补全指标名
+    op.execute(
+        "UPDATE monitoring_alerts AS a SET metric_name = r.metric_name "
+        "FROM alert_rules AS r WHERE a.rule_id = r.id AND a.metric_name IS NULL"
+    )
+
+
+def downgrade():
+    op.execute(
+        "UPDATE monitoring_alerts SET metrics_id = telemetry_id::text || ':' || COALESCE(metric_name, '') "
+        "WHERE metrics_id IS NULL AND telemetry_id IS NOT NULL"
+    )
+    op.execute("UPDATE monitoring_alerts SET metrics_id = '' WHERE metrics_id IS NULL")
+    op.alter_column('monitoring_alerts', 'metrics_id', existing_type=sa.String(), nullable=False)
+    op.drop_column('monitoring_alerts', 'metric_name')
+    op.drop_column('monitoring_alerts', 'telemetry_id')
@@ -0,0 +1,76 @@
+"""add device_metric_rollups table
+
+Revision ID: add_device_metric_rollups
+Revises: partition_device_metrics
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'add_device_metric_rollups'
+down_revision = 'partition_device_metrics'
+branch_labels = None
+depends_on = None
+
+# 与 app.models.monitoring.ROLLUP_RESOLUTIONS 保持一致
+RESOLUTIONS = {'1m': 60, '5m': 300, '1h': 3600}
+TELEMETRY_NUMERIC_COLUMNS = ('temperature', 'humidity', 'voltage', 'battery', 'air_quality', 'uptime')
+
+
+def _bucket_expr(seconds):
+    return f"to_timestamp(floor(extract(epoch from timestamp) / {seconds}) * {seconds}) AT TIME ZONE 'UTC'"
+
+
+def upgrade():
+    # 创建降采样表
+    op.create_table(
+        'device_metric_rollups',
+        sa.Column('device_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('resolution', sa.String(4), nullable=False),
+        sa.Column('metric_name', sa.String(50), nullable=False),
+        sa.Column('bucket', sa.DateTime(), nullable=False),
+        sa.Column('min_value', sa.Float(), nullable=False),
+        sa.Column('max_value', sa.Float(), nullable=False),
+        sa.Column('sum_value', sa.Float(), nullable=False),
+        sa.Column('sample_count', sa.BigInteger(), nullable=False),
+        sa.Column('last_value', sa.Float(), nullable=False),
+        sa.Column('last_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['device_id'], ['devices.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('device_id', 'resolution', 'metric_name', 'bucket')
+    )
+
+    # 根据已有原始数据回填降采样数据
+    for resolution, seconds in RESOLUTIONS.items():
+        bucket = _bucket_expr(seconds)
+        for column in TELEMETRY_NUMERIC_COLUMNS:
+            op.execute(f"""
+                INSERT INTO device_metric_rollups
+                SELECT device_id, '{resolution}', '{column}', {bucket} AS bucket,
+                       min({column}), max({column}), sum({column}), count(*),
+                       (array_agg({column} ORDER BY timestamp DESC))[1], max(timestamp)
+                FROM device_telemetry
+                WHERE {column} IS NOT NULL
+                GROUP BY device_id, bucket
+            """)
+        # device_metrics 中 {"value": 数值} 形式的记录
+        op.execute(f"""
+            INSERT INTO device_metric_rollups
+            SELECT device_id, '{resolution}', left(metric_type, 50), bucket,
+                   min(v), max(v), sum(v), count(*),
+                   (array_agg(v ORDER BY timestamp DESC))[1], max(timestamp)
+            FROM (
+                SELECT device_id, metric_type, timestamp, {bucket} AS bucket,
+                       (metrics->>'value')::double precision AS v
+                FROM device_metrics
+                WHERE json_typeof(metrics->'value') = 'number'
+            ) AS samples
+            GROUP BY device_id, left(metric_type, 50), bucket
+            ON CONFLICT (device_id, resolution, metric_name, bucket) DO NOTHING
+        """)
+
+
+def downgrade():
+    op.drop_table('device_metric_rollups')
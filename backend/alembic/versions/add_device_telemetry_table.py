@@ -0,0 +1,48 @@
+"""add device_telemetry table
+
+Revision ID: add_device_telemetry
+Revises: add_ota_update_tasks, add_template_version
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'add_device_telemetry'
+# 同时合并此前的两个分支头
+down_revision = ('add_ota_update_tasks', 'add_template_version')
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 创建紧凑遥测表（每个采样一行）
+    op.create_table(
+        'device_telemetry',
+        sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('device_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('timestamp', sa.DateTime(), nullable=False),
+        sa.Column('temperature', sa.Float(), nullable=True),
+        sa.Column('humidity', sa.Float(), nullable=True),
+        sa.Column('voltage', sa.Float(), nullable=True),
+        sa.Column('battery', sa.Float(), nullable=True),
+        sa.Column('air_quality', sa.Float(), nullable=True),
+        sa.Column('uptime', sa.BigInteger(), nullable=True),
+        sa.Column('wifi_status', sa.String(20), nullable=True),
+        sa.Column('mqtt_status', sa.String(20), nullable=True),
+        sa.ForeignKeyConstraint(['device_id'], ['devices.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    
+    # 创建索引
+    op.create_index('ix_device_telemetry_device_id_timestamp', 'device_telemetry', ['device_id', 'timestamp'])
+
+
+def downgrade():
+    # 删除索引
+    op.drop_index('ix_device_telemetry_device_id_timestamp', table_name='device_telemetry')
+    
+    # 删除表
+    op.drop_table('device_telemetry')
@@ -0,0 +1,72 @@
+"""add composite and partial indexes for list queries
+
+Revision ID: add_query_indexes
+Revises: add_device_metric_rollups
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_query_indexes'
+down_revision = 'add_device_metric_rollups'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 设备指标：按设备 + 指标类型查询，按时间倒序（分区表上创建的索引会自动应用到各分区）
+    op.create_index(
+        'ix_device_metrics_device_id_metric_type_timestamp',
+        'device_metrics', ['device_id', 'metric_type', 'timestamp']
+    )
+
+    # 监控告警：按状态/级别筛选，按创建时间倒序
+    op.create_index(
+        'ix_monitoring_alerts_status_severity_created_at',
+        'monitoring_alerts', ['status', 'severity', 'created_at']
+    )
+    op.create_index(
+        'ix_monitoring_alerts_device_id_created_at',
+        'monitoring_alerts', ['device_id', 'created_at']
+    )
+    op.create_index('ix_monitoring_alerts_created_at', 'monitoring_alerts', ['created_at'])
+    # 未处理告警只占少数，单独建部分索引
+    op.create_index(
+        'ix_monitoring_alerts_active_created_at',
+        'monitoring_alerts', ['severity', 'created_at'],
+        postgresql_where=sa.text("status = 'active'")
+    )
+
+    # 安全事件：按级别/处理状态筛选，按创建时间倒序
+    op.create_index(
+        'ix_security_events_severity_handled_created_at',
+        'security_events', ['severity', 'handled', 'created_at']
+    )
+    op.create_index('ix_security_events_created_at', 'security_events', ['created_at'])
+    op.create_index(
+        'ix_security_events_unhandled_created_at',
+        'security_events', ['created_at'],
+        postgresql_where=sa.text('handled = false')
+    )
+
+    # 审计日志：按类型筛选，按创建时间倒序
+    op.create_index(
+        'ix_security_audit_logs_log_type_created_at',
+        'security_audit_logs', ['log_type', 'created_at']
+    )
+    op.create_index('ix_security_audit_logs_created_at', 'security_audit_logs', ['created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_security_audit_logs_created_at', table_name='security_audit_logs')
+    op.drop_index('ix_security_audit_logs_log_type_created_at', table_name='security_audit_logs')
+    op.drop_index('ix_security_events_unhandled_created_at', table_name='security_events')
+    op.drop_index('ix_security_events_created_at', table_name='security_events')
+    op.drop_index('ix_security_events_severity_handled_created_at', table_name='security_events')
+    op.drop_index('ix_monitoring_alerts_active_created_at', table_name='monitoring_alerts')
+    op.drop_index('ix_monitoring_alerts_created_at', table_name='monitoring_alerts')
+    op.drop_index('ix_monitoring_alerts_device_id_created_at', table_name='monitoring_alerts')
+    op.drop_index('ix_monitoring_alerts_status_severity_created_at', table_name='monitoring_alerts')
+    op.drop_index('ix_device_metrics_device_id_metric_type_timestamp', table_name='device_metrics')
@@ -0,0 +1,26 @@
+"""add index for pruning expired metric rollups
+
+Revision ID: add_rollup_retention_index
+Revises: add_alert_telemetry_reference
+Create Date: 2026-10-18 20:30:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'add_rollup_retention_index'
+down_revision = 'add_alert_telemetry_reference'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 分区维护任务按粒度删除过期的降采样数据
+    op.create_index(
+        'ix_device_metric_rollups_resolution_bucket',
+        'device_metric_rollups', ['resolution', 'bucket']
+    )
+
+
+def downgrade():
+    op.drop_index('ix_device_metric_rollups_resolution_bucket', table_name='device_metric_rollups')
@@ -0,0 +1,143 @@
+"""partition device_metrics and device_telemetry by timestamp
+
+Revision ID: partition_device_metrics
+Revises: add_device_telemetry
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from datetime import datetime, timedelta
+from alembic import op
+import sqlalchemy as sa
+
+from app.core.config import settings
+from app.services.partitions import iter_partition_ranges, create_partition_sql, period_start, period_end
+
+# revision identifiers, used by Alembic.
+revision = 'partition_device_metrics'
+down_revision = 'add_device_telemetry'
+branch_labels = None
+depends_on = None
+
+
+DEVICE_METRICS_COLUMNS = "id, device_id, metric_type, metrics, timestamp"
+DEVICE_TELEMETRY_COLUMNS = (
+    "id, device_id, timestamp, temperature, humidity, voltage, battery, "
+    "air_quality, uptime, wifi_status, mqtt_status"
+)
+
+
+def _create_partitions(table: str, old_table: str):
+    """创建覆盖旧表已有数据和后续一段时间的分区，以及兜底的默认分区"""
+    interval = settings.METRICS_PARTITION_INTERVAL
+    conn = op.get_bind()
+    min_ts = conn.execute(sa.text(f"SELECT min(timestamp) FROM {old_table}")).scalar()
+    now = datetime.utcnow()
+    end = period_start(now, interval)
+    for _ in range(settings.METRICS_PARTITION_PREMAKE + 1):
+        end = period_end(end, interval)
+    for start, upper in iter_partition_ranges(min(min_ts or now, now), end, interval):
+        op.execute(create_partition_sql(table, start, upper))
+    # 默认分区：接收超出已创建范围的数据，避免写入失败
+    op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+
+
+def upgrade():
+    # 分区表的唯一约束必须包含分区键，删除告警表指向 device_metrics.id 的外键
+    op.drop_constraint('monitoring_alerts_metrics_id_fkey', 'monitoring_alerts', type_='foreignkey')
+    
+    # device_metrics
+    op.execute("ALTER TABLE device_metrics RENAME TO device_metrics_old")
+    op.execute("ALTER TABLE device_metrics_old RENAME CONSTRAINT device_metrics_pkey TO device_metrics_old_pkey")
+    op.execute("""
+        CREATE TABLE device_metrics (
+            id VARCHAR NOT NULL,
+            device_id UUID NOT NULL REFERENCES devices (id),
+            metric_type VARCHAR NOT NULL,
+            metrics JSON NOT NULL,
+            timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    """)
+    _create_partitions('device_metrics', 'device_metrics_old')
+    op.execute(f"INSERT INTO device_metrics ({DEVICE_METRICS_COLUMNS}) SELECT {DEVICE_METRICS_COLUMNS} FROM device_metrics_old")
+    op.execute("DROP TABLE device_metrics_old")
+    op.create_index('ix_device_metrics_device_id_timestamp', 'device_metrics', ['device_id', 'timestamp'])
+    
+    # device_telemetry（沿用原有的id序列）
+    op.execute("ALTER TABLE device_telemetry RENAME TO device_telemetry_old")
+    op.execute("ALTER TABLE device_telemetry_old RENAME CONSTRAINT device_telemetry_pkey TO device_telemetry_old_pkey")
+    op.execute("ALTER INDEX ix_device_telemetry_device_id_timestamp RENAME TO ix_device_telemetry_old_device_id_timestamp")
+    op.execute("ALTER SEQUENCE device_telemetry_id_seq OWNED BY NONE")
+    op.execute("""
+        CREATE TABLE device_telemetry (
+            id BIGINT NOT NULL DEFAULT nextval('device_telemetry_id_seq'),
+            device_id UUID NOT NULL REFERENCES devices (id) ON DELETE CASCADE,
+            timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            temperature DOUBLE PRECISION,
+            humidity DOUBLE PRECISION,
+            voltage DOUBLE PRECISION,
+            battery DOUBLE PRECISION,
+            air_quality DOUBLE PRECISION,
+            uptime BIGINT,
+            wifi_status VARCHAR(20),
+            mqtt_status VARCHAR(20),
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    """)
+    _create_partitions('device_telemetry', 'device_telemetry_old')
+    op.execute(f"INSERT INTO device_telemetry ({DEVICE_TELEMETRY_COLUMNS}) SELECT {DEVICE_TELEMETRY_COLUMNS} FROM device_telemetry_old")
+    op.execute("DROP TABLE device_telemetry_old")
+    op.execute("ALTER SEQUENCE device_telemetry_id_seq OWNED BY device_telemetry.id")
+    op.create_index('ix_device_telemetry_device_id_timestamp', 'device_telemetry', ['device_id', 'timestamp'])
+
+
+def downgrade():
+    # device_telemetry 恢复为普通表
+    op.execute("ALTER TABLE device_telemetry RENAME TO device_telemetry_partitioned")
+    op.execute("ALTER INDEX ix_device_telemetry_device_id_timestamp RENAME TO ix_device_telemetry_partitioned_device_id_timestamp")
+    op.execute("ALTER TABLE device_telemetry_partitioned RENAME CONSTRAINT device_telemetry_pkey TO device_telemetry_partitioned_pkey")
+    op.execute("ALTER SEQUENCE device_telemetry_id_seq OWNED BY NONE")
+    op.execute("""
+        CREATE TABLE device_telemetry (
+            id BIGINT NOT NULL DEFAULT nextval('device_telemetry_id_seq') PRIMARY KEY,
+            device_id UUID NOT NULL REFERENCES devices (id) ON DELETE CASCADE,
+            timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            temperature DOUBLE PRECISION,
+            humidity DOUBLE PRECISION,
+            voltage DOUBLE PRECISION,
+            battery DOUBLE PRECISION,
+            air_quality DOUBLE PRECISION,
+            uptime BIGINT,
+            wifi_status VARCHAR(20),
+            mqtt_status VARCHAR(20)
+        )
+    """)
+    op.execute(f"INSERT INTO device_telemetry ({DEVICE_TELEMETRY_COLUMNS}) SELECT {DEVICE_TELEMETRY_COLUMNS} FROM device_telemetry_partitioned")
+    op.execute("DROP TABLE device_telemetry_partitioned")
+    op.execute("ALTER SEQUENCE device_telemetry_id_seq OWNED BY device_telemetry.id")
+    op.create_index('ix_device_telemetry_device_id_timestamp', 'device_telemetry', ['device_id', 'timestamp'])
+    
+    # device_metrics 恢复为普通表
+    op.execute("ALTER TABLE device_metrics RENAME TO device_metrics_partitioned")
+    op.execute("ALTER INDEX ix_device_metrics_device_id_timestamp RENAME TO ix_device_metrics_partitioned_device_id_timestamp")
+    op.execute("ALTER TABLE device_metrics_partitioned RENAME CONSTRAINT device_metrics_pkey TO device_metrics_partitioned_pkey")
+    op.execute("""
+        CREATE TABLE device_metrics (
+            id VARCHAR NOT NULL PRIMARY KEY,
+            device_id UUID NOT NULL REFERENCES devices (id),
+            metric_type VARCHAR NOT NULL,
+            metrics JSON NOT NULL,
+            timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL
+        )
+    """)
+    op.execute(f"INSERT INTO device_metrics ({DEVICE_METRICS_COLUMNS}) SELECT {DEVICE_METRICS_COLUMNS} FROM device_metrics_partitioned")
+    op.execute("DROP TABLE device_metrics_partitioned")
+    
+    # 恢复外键（保留期内被删除的指标会导致外键创建失败，先删除引用这些指标的告警）
+    op.execute(
+        "DELETE FROM monitoring_alerts WHERE metrics_id NOT IN (SELECT id FROM device_metrics)"
+    )
+    op.create_foreign_key(
+        'monitoring_alerts_metrics_id_fkey', 'monitoring_alerts',
+        'device_metrics', ['metrics_id'], ['id']
+    )
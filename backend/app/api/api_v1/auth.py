@@ -4,7 +4,9 @@ from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.database import get_db
 from app.core.security import create_access_token, create_refresh_token
-from app.services.user import UserService
+from app.services.user import UserService, current_user_cache, invalidate_user_cache
+from app.services.token_revocation import token_revocation
+from app.core.cache import MISSING
 from app.schemas.user import User, Token, UserCreate
 from jose import JWTError, jwt
 from app.core.config import settings
@@ -41,6 +43,15 @@ async def get_current_user(
         logger.warning(f"JWT decode error: {e}, token: {token[:20]}...")
         raise credentials_exception
     
+    # 已吊销的令牌（本地镜像查找，不访问Redis或数据库）
+    if token_revocation.is_revoked(payload):
+        raise credentials_exception
+    
+    # 已校验的用户在缓存有效期内直接返回，不查询数据库
+    cached = current_user_cache.get(username)
+    if cached is not MISSING:
+        return cached
+    
     try:
         user_service = UserService(db)
         user = await user_service.get_by_username(username=username)
@@ -51,7 +62,9 @@ async def get_current_user(
         # FastAPI can handle this automatically, but we need explicit conversion for dependencies
         try:
             # Pydantic v2: model_validate with from_attributes mode
-            return User.model_validate(user)
+            validated = User.model_validate(user)
+            current_user_cache.set(username, validated)
+            return validated
         except Exception as convert_error:
             # If Pydantic v2 fails, try manual conversion or Pydantic v1
             try:
@@ -156,6 +169,7 @@ async def login(
             user.last_login_at = datetime.now(timezone.utc)
             db.add(user)
             await db.commit()
+            invalidate_user_cache(user.username)
         except Exception as update_error:
             logger.warning(f"Failed to update last_login_at: {update_error}")
             # 不阻止登录，只是记录警告
@@ -220,6 +234,10 @@ async def refresh_token(
             logger.warning("Refresh token payload missing 'sub' field")
             raise credentials_exception
         
+        if token_revocation.is_revoked(payload):
+            logger.warning(f"Revoked refresh token used for: {username}")
+            raise credentials_exception
+        
         # 获取用户
         user_service = UserService(db)
         user = await user_service.get_by_username(username=username)
@@ -234,6 +252,11 @@ async def refresh_token(
                 detail="用户未激活"
             )
         
+        # 刷新令牌轮换：旧的刷新令牌立即吊销，并发使用同一刷新令牌时只有一个请求成功
+        if not await token_revocation.revoke_token(payload):
+            logger.warning(f"Refresh token reused for: {username}")
+            raise credentials_exception
+        
         # 创建新的access token和refresh token
         access_token = create_access_token(user.username)
         new_refresh_token = create_refresh_token(user.username)
@@ -254,6 +277,19 @@ async def refresh_token(
             detail=f"刷新令牌失败: {str(e)}"
     )
 
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
+    token: str = Depends(oauth2_scheme),
+    current_user: User = Depends(get_current_user)
+) -> None:
+    """退出登录：吊销当前访问令牌"""
+    payload = jwt.decode(
+        token,
+        settings.JWT_SECRET_KEY,
+        algorithms=[settings.JWT_ALGORITHM]
+    )
+    await token_revocation.revoke_token(payload)
+
 @router.post("/register", response_model=User)
 async def register(
     user_data: UserCreate,
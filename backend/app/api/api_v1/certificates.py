@@ -126,7 +126,7 @@ async def get_server_certificate(
             cert_dict = {
                 'id': str(row[0]),  # id
                 'certificate': decrypt_certificate_data(row[1]),  # certificate
-                'private_key': decrypt_certificate_data(row[2]),  # private_key
+                'private_key': decrypt_certificate_data(row[2], is_key=True),  # private_key
                 'common_name': row[3],  # common_name
                 'serial_number': row[4],  # serial_number
                 'issued_at': row[5],  # issued_at
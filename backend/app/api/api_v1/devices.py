@@ -1,4 +1,5 @@
 from typing import List, Optional
+import uuid
 from fastapi import APIRouter, Depends, HTTPException, status, Response, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.api.api_v1.auth import get_current_active_user
@@ -9,7 +10,8 @@ from app.schemas.device import (
     DeviceLog, DeviceLogCreate, DeviceStats,
     FirmwareGenerateRequest, FirmwareResponse
 )
-from app.services.device import DeviceService
+from app.services.device import DeviceService, invalidate_device_identity
+from app.core.pagination import parse_cursor, set_next_cursor
 from app.schemas.user import User
 from app.services.firmware import FirmwareService
 from app.services.certificate import CertificateService
@@ -33,6 +35,8 @@ async def create_device(
         )
     
     device = await device_service.create(device_in)
+    # 清除该device_id可能存在的“设备不存在”缓存
+    invalidate_device_identity(device.device_id)
     
     # 自动为新设备生成客户端证书
     try:
@@ -138,7 +142,9 @@ async def update_device(
             detail="设备不存在"
         )
     
+    old_device_id = device.device_id
     device = await device_service.update(device, device_in)
+    invalidate_device_identity(old_device_id, device.device_id)
     return device
 
 @router.delete("/{device_id}")
@@ -157,6 +163,7 @@ async def delete_device(
         )
     
     await device_service.delete(device)
+    invalidate_device_identity(device.device_id)
     return {"message": "设备已删除"}
 
 @router.get("/{device_id}/certificates", response_model=List[DeviceCertificate])
@@ -194,7 +201,7 @@ async def get_device_certificates(
             'certificate_type': cert.certificate_type,
             'serial_number': cert.serial_number,
             'certificate': decrypt_certificate_data(cert.certificate),
-            'private_key': decrypt_certificate_data(cert.private_key) if cert.private_key else None,
+            'private_key': decrypt_certificate_data(cert.private_key, is_key=True) if cert.private_key else None,
             'issued_at': cert.issued_at,
             'expires_at': cert.expires_at,
             'revoked_at': cert.revoked_at,
@@ -230,7 +237,7 @@ async def create_device_certificate(
         'certificate_type': cert.certificate_type,
         'serial_number': cert.serial_number,
         'certificate': decrypt_certificate_data(cert.certificate),
-        'private_key': decrypt_certificate_data(cert.private_key) if cert.private_key else None,
+        'private_key': decrypt_certificate_data(cert.private_key, is_key=True) if cert.private_key else None,
         'issued_at': cert.issued_at,
         'expires_at': cert.expires_at,
         'revoked_at': cert.revoked_at,
@@ -277,7 +284,7 @@ async def get_device_certificate(
         'certificate_type': cert.certificate_type,
         'serial_number': cert.serial_number,
         'certificate': decrypt_certificate_data(cert.certificate),
-        'private_key': decrypt_certificate_data(cert.private_key) if cert.private_key else None,
+        'private_key': decrypt_certificate_data(cert.private_key, is_key=True) if cert.private_key else None,
         'issued_at': cert.issued_at,
         'expires_at': cert.expires_at,
         'revoked_at': cert.revoked_at,
@@ -357,7 +364,7 @@ async def renew_device_certificate(
             'certificate_type': new_cert.certificate_type,
             'serial_number': new_cert.serial_number,
             'certificate': decrypt_certificate_data(new_cert.certificate),
-            'private_key': decrypt_certificate_data(new_cert.private_key) if new_cert.private_key else None,
+            'private_key': decrypt_certificate_data(new_cert.private_key, is_key=True) if new_cert.private_key else None,
             'issued_at': new_cert.issued_at,
             'expires_at': new_cert.expires_at,
             'revoked_at': new_cert.revoked_at,
@@ -451,10 +458,12 @@ async def get_device_logs(
     device_id: str,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = Query(None, description="分页游标，取上一页响应头 X-Next-Cursor 的值"),
+    response: Response = None,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ) -> List[DeviceLog]:
-    """获取设备日志"""
+    """获取设备日志（下一页游标在响应头 X-Next-Cursor 中返回）"""
     device_service = DeviceService(db)
     device = await device_service.get_by_id(device_id)
     if not device:
@@ -463,7 +472,8 @@ async def get_device_logs(
             detail="设备不存在"
         )
     
-    logs = await device_service.get_device_logs(device, skip=skip, limit=limit)
+    logs = await device_service.get_device_logs(device, skip=skip, limit=limit, cursor=parse_cursor(cursor, uuid.UUID))
+    set_next_cursor(response, logs, limit)
     return logs
 
 @router.get("/{device_id}/stats", response_model=DeviceStats)
@@ -1,5 +1,5 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from typing import List, Optional, Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 
@@ -16,6 +16,7 @@ from app.schemas.monitoring import (
     SystemStatus
 )
 from app.services.monitoring import MonitoringService
+from app.core.pagination import parse_cursor, set_next_cursor
 
 router = APIRouter()
 
@@ -38,10 +39,12 @@ async def get_device_metrics(
     end_time: Optional[datetime] = None,
     metric_type: Optional[str] = None,
     limit: int = Query(100, gt=0, le=1000),
+    resolution: Optional[str] = Query(None, pattern="^(raw|auto|1m|5m|1h)$", description="为空时返回原始数据；auto 按时间范围自动选择"),
+    max_points: int = Query(500, gt=0, le=5000, description="每个指标的最大数据点数（降采样数据）"),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ) -> List[DeviceMetrics]:
-    """获取设备指标历史数据"""
+    """获取设备指标历史数据（指定 resolution 时返回降采样数据）"""
     try:
         # 转换为无时区的时间
         def remove_timezone(dt: datetime) -> datetime:
@@ -58,7 +61,9 @@ async def get_device_metrics(
             start_time=start or datetime.utcnow() - timedelta(hours=24),
             end_time=end or datetime.utcnow(),
             metric_type=metric_type,
-            limit=limit
+            limit=limit,
+            resolution=resolution,
+            max_points=max_points
         )
         return metrics
     except Exception as e:
@@ -113,7 +118,13 @@ async def update_alert_rule(
             detail="告警规则不存在"
         )
     
-    updated_rule = await monitoring_service.update_alert_rule(rule, rule_in)
+    try:
+        updated_rule = await monitoring_service.update_alert_rule(rule, rule_in)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     return updated_rule
 
 @router.delete("/alert-rules/{rule_id}")
@@ -143,10 +154,12 @@ async def get_alerts(
     severity: Optional[str] = None,
     status: Optional[str] = None,
     limit: int = Query(100, gt=0, le=1000),
+    cursor: Optional[str] = Query(None, description="分页游标，取上一页响应头 X-Next-Cursor 的值"),
+    response: Response = None,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ) -> List[MonitoringAlert]:
-    """获取告警列表"""
+    """获取告警列表（下一页游标在响应头 X-Next-Cursor 中返回）"""
     monitoring_service = MonitoringService(db)
     alerts = await monitoring_service.get_alerts(
         device_id=device_id,
@@ -154,8 +167,10 @@ async def get_alerts(
         end_time=end_time,
         severity=severity,
         status=status,
-        limit=limit
+        limit=limit,
+        cursor=parse_cursor(cursor)
     )
+    set_next_cursor(response, alerts, limit)
     return alerts
 
 @router.post("/alerts/{alert_id}/acknowledge")
@@ -184,4 +199,12 @@ async def get_system_status(
     """获取系统整体状态"""
     monitoring_service = MonitoringService(db)
     status = await monitoring_service.get_system_status()
-    return status
\ No newline at end of file
+    return status
+
+@router.get("/runtime-stats")
+async def get_runtime_stats(
+    current_user: User = Depends(get_current_active_user)
+) -> Dict[str, Any]:
+    """获取后端运行时统计（消息缓冲区、缓存命中率等）"""
+    from app.core.events import get_runtime_stats as collect_runtime_stats
+    return collect_runtime_stats()
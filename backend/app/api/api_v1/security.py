@@ -1,5 +1,7 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+import uuid
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 from app.api.api_v1.auth import get_current_active_user
@@ -12,6 +14,9 @@ from app.schemas.security import (
     SecurityStats
 )
 from app.services.security import SecurityService
+from app.core.pagination import parse_cursor, set_next_cursor
+from app.services.export import stream_export, MEDIA_TYPES
+from app.models.security import SecurityAuditLog as SecurityAuditLogModel, SecurityEvent as SecurityEventModel
 from app.schemas.user import User
 
 router = APIRouter()
@@ -34,17 +39,41 @@ async def get_security_events(
     limit: int = 100,
     severity: Optional[str] = None,
     handled: Optional[bool] = None,
+    cursor: Optional[str] = Query(None, description="分页游标，取上一页响应头 X-Next-Cursor 的值"),
+    response: Response = None,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ) -> List[SecurityEvent]:
-    """获取安全事件列表"""
+    """获取安全事件列表（下一页游标在响应头 X-Next-Cursor 中返回）"""
     security_service = SecurityService(db)
     events = await security_service.get_events(
         skip=skip, limit=limit,
-        severity=severity, handled=handled
+        severity=severity, handled=handled,
+        cursor=parse_cursor(cursor, uuid.UUID)
     )
+    set_next_cursor(response, events, limit)
     return events
 
+@router.get("/events/export")
+async def export_security_events(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    severity: Optional[str] = None,
+    handled: Optional[bool] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    current_user: User = Depends(get_current_active_user)
+) -> StreamingResponse:
+    """流式导出安全事件（NDJSON 或 CSV），使用服务端游标逐块读取"""
+    return StreamingResponse(
+        stream_export(
+            SecurityEventModel, format,
+            start_time=start_time, end_time=end_time,
+            severity=severity, handled=handled
+        ),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="security_events.{format}"'}
+    )
+
 @router.post("/events/{event_id}/handle")
 async def handle_security_event(
     event_id: str,
@@ -142,10 +171,12 @@ async def get_audit_logs(
     log_type: Optional[str] = None,
     start_time: Optional[datetime] = None,
     end_time: Optional[datetime] = None,
+    cursor: Optional[str] = Query(None, description="分页游标，取上一页响应头 X-Next-Cursor 的值"),
+    response: Response = None,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ) -> List[SecurityAuditLog]:
-    """获取审计日志"""
+    """获取审计日志（下一页游标在响应头 X-Next-Cursor 中返回）"""
     import logging
     logger = logging.getLogger(__name__)
     
@@ -155,8 +186,10 @@ async def get_audit_logs(
             skip=skip, limit=limit,
             log_type=log_type,
             start_time=start_time,
-            end_time=end_time
+            end_time=end_time,
+            cursor=parse_cursor(cursor, uuid.UUID)
         )
+        set_next_cursor(response, logs, limit)
         
         # 将SQLAlchemy模型转换为Pydantic schema
         result = []
@@ -203,6 +236,25 @@ async def get_audit_logs(
             detail=f"获取审计日志失败: {str(e)}"
         )
 
+@router.get("/audit-logs/export")
+async def export_audit_logs(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    log_type: Optional[str] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    current_user: User = Depends(get_current_active_user)
+) -> StreamingResponse:
+    """流式导出审计日志（NDJSON 或 CSV），使用服务端游标逐块读取，内存占用与时间范围无关"""
+    return StreamingResponse(
+        stream_export(
+            SecurityAuditLogModel, format,
+            start_time=start_time, end_time=end_time,
+            log_type=log_type
+        ),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="security_audit_logs.{format}"'}
+    )
+
 # IP黑名单管理
 @router.post("/blacklist", response_model=BlacklistedIP)
 async def add_to_blacklist(
@@ -215,13 +267,13 @@ async def add_to_blacklist(
     blacklist = await security_service.add_to_blacklist(blacklist_in)
     return blacklist
 
-@router.delete("/blacklist/{ip}")
+@router.delete("/blacklist/{ip:path}")
 async def remove_from_blacklist(
     ip: str,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """从黑名单中移除IP"""
+    """从黑名单中移除IP或CIDR网段（如 10.0.0.0/8）"""
     security_service = SecurityService(db)
     await security_service.remove_from_blacklist(ip)
     return {"message": "IP已从黑名单中移除"}
@@ -251,45 +303,11 @@ async def get_security_stats(
         security_service = SecurityService(db)
         stats = await security_service.get_security_stats()
         
-        # 将SQLAlchemy模型转换为Pydantic schema
-        recent_events = []
-        events_list = stats.get("recent_events", [])
-        
-        if events_list:
-            try:
-                from app.schemas.security import SecurityEvent
-                for event in events_list:
-                    try:
-                        # 如果是SQLAlchemy模型，转换为schema
-                        if hasattr(event, '__table__'):  # 检查是否是SQLAlchemy模型
-                            # 处理source_ip可能为None的情况
-                            event_dict = {
-                                'id': event.id,
-                                'event_type': event.event_type,
-                                'severity': event.severity,
-                                'source_ip': str(event.source_ip) if event.source_ip else None,
-                                'device_id': event.device_id,
-                                'description': event.description,
-                                'raw_data': event.raw_data,
-                                'handled': event.handled,
-                                'handler_id': event.handler_id,
-                                'handled_at': event.handled_at,
-                                'created_at': event.created_at
-                            }
-                            recent_events.append(SecurityEvent(**event_dict))
-                        else:
-                            recent_events.append(event)
-                    except Exception as conv_error:
-                        logger.warning(f"Error converting security event: {conv_error}, event: {event}")
-                        continue
-            except Exception as import_error:
-                logger.error(f"Error importing SecurityEvent schema: {import_error}")
-        
         # 构造符合SecurityStats schema的响应
         return SecurityStats(
             total_events=stats.get("total_events", 0),
             severity_distribution=stats.get("severity_distribution", {}),
-            recent_events=recent_events,
+            recent_events=stats.get("recent_events", []),
             top_threats=[],  # TODO: 实现top_threats逻辑
             active_blacklist_count=stats.get("active_blacklist_count", 0)
         )
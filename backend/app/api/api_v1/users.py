@@ -138,7 +138,14 @@ async def update_user_me(
                 detail="邮箱已被使用"
             )
     
-    user = await user_service.update(current_user, user_in)
+    # current_user 是（可能被缓存共享的）schema 对象，更新数据库中的用户
+    db_user = await user_service.get_by_id(str(current_user.id))
+    if not db_user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="用户不存在"
+        )
+    user = await user_service.update(db_user, user_in)
     return user
 
 @router.get("/{user_id}", response_model=UserResponse)
@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic_settings import BaseSettings
 from pydantic import AnyHttpUrl, validator
 
@@ -62,14 +62,72 @@ class Settings(BaseSettings):
     MQTT_CLIENT_ID: str
     MQTT_USERNAME: str
     MQTT_PASSWORD: str
+    MQTT_TRANSPORT: str = "paho"  # MQTT客户端实现：paho（网络线程）或 asyncio（aiomqtt，运行在主事件循环）
+    
+    # MQTT遥测批量写入配置
+    MQTT_INGEST_BATCH_SIZE: int = 200  # 单批最多处理的消息数
+    MQTT_INGEST_FLUSH_INTERVAL_MS: int = 200  # 攒批最长等待时间（毫秒）
+    MQTT_INGEST_MAX_IN_FLIGHT: int = 4  # 同时处理中的批次数上限
+    MQTT_INGEST_QUEUE_SIZE: int = 10000  # 待处理消息缓冲区上限
+    MQTT_INGEST_OVERFLOW_POLICY: str = "coalesce"  # 溢出策略：drop_oldest / coalesce / block
+    MQTT_INGEST_SHUTDOWN_TIMEOUT: int = 10  # 应用关闭时等待剩余消息处理完成的最长时间（秒）
+    PRESENCE_FLUSH_INTERVAL: int = 15  # 设备最近在线时间批量写库间隔（秒）
+    PRESENCE_CHECK_INTERVAL: int = 5  # 设备离线判定周期（秒）
+    DEVICE_OFFLINE_TIMEOUT: int = 90  # 设备离线超时时间（秒）：心跳间隔30秒 + 60秒容差
+    
+    # 设备标识缓存配置（MQTT消息中的device_id -> 设备主键）
+    DEVICE_CACHE_SIZE: int = 100000  # 最大缓存设备数
+    DEVICE_CACHE_TTL: int = 300  # 缓存过期时间（秒）
+    DEVICE_CACHE_NEGATIVE_TTL: int = 60  # 不存在设备的缓存时间（秒）
+    
+    # 遥测存储配置
+    TELEMETRY_STORAGE_MODE: str = "compact"  # compact：每个采样一行写入device_telemetry；legacy：每个指标一行写入device_metrics
+    METRICS_PARTITION_INTERVAL: str = "daily"  # 指标表分区粒度：daily / weekly
+    METRICS_PARTITION_PREMAKE: int = 7  # 提前创建的分区数量
+    METRICS_RETENTION_DAYS: int = 90  # 指标保留天数，过期分区整体删除；0表示永久保留
+    METRICS_PARTITION_CHECK_INTERVAL: int = 3600  # 分区维护任务执行间隔（秒）
+    METRICS_ROLLUP_RETENTION_DAYS: Dict[str, int] = {"1m": 7, "5m": 30, "1h": 365}  # 各粒度降采样数据保留天数，0表示永久保留
+    METRICS_RAW_MAX_RANGE: int = 3600  # resolution=auto 时，查询范围不超过该值（秒）返回原始指标，否则返回降采样数据
+    
+    # 仪表盘统计缓存配置
+    SECURITY_STATS_CACHE_TTL: int = 10  # 安全统计快照缓存时间（秒），0表示不缓存
+    SYSTEM_STATUS_REFRESH_INTERVAL: int = 10  # 系统状态快照刷新间隔（秒）
+    
+    # 告警评估配置
+    ALERT_VECTORIZE_MIN_BATCH: int = 512  # 批次采样数不少于该值时使用NumPy向量化评估，0表示始终逐条评估
+    ALERT_WINDOW_MAX_SAMPLES: int = 1024  # 窗口类规则每个时间窗口最多保留的采样数
+    ALERT_STATE_FLUSH_INTERVAL: int = 15  # 告警发生次数/最近触发时间批量写库间隔（秒）
+
+    # IP黑名单配置
+    IP_BLACKLIST_SYNC_CHANNEL: str = "security:ip_blacklist"  # 黑名单增量更新的Redis发布/订阅频道
+    IP_BLACKLIST_RELOAD_INTERVAL: int = 300  # 从数据库全量重新加载黑名单的间隔（秒），兜底丢失的同步消息并清除过期条目
+    IP_BLACKLIST_ENFORCE: bool = True  # 是否在中间件中拦截黑名单IP的请求
+    IP_BLACKLIST_TRUST_FORWARDED: bool = False  # 部署在反向代理之后时，按 X-Forwarded-For 的第一个地址判断客户端IP
+
+    # 审计日志批量写入配置
+    AUDIT_QUEUE_SIZE: int = 10000  # 待写入审计日志/安全事件队列上限，队列满时由提交方同步写出
+    AUDIT_BATCH_SIZE: int = 500  # 单条INSERT最多写入的记录数
+    AUDIT_FLUSH_INTERVAL_MS: int = 200  # 批量写入间隔（毫秒）
+    AUDIT_MAX_ATTEMPTS: int = 3  # 单条记录写入失败的最大次数，超过后记录到错误日志并丢弃，不阻塞后续记录
+    EXPORT_CHUNK_SIZE: int = 2000  # 审计日志/安全事件导出时每次从服务端游标读取的行数
+
+    # 认证用户缓存配置（令牌sub -> 已校验的用户）
+    USER_CACHE_SIZE: int = 10000  # 最大缓存用户数
+    USER_CACHE_TTL: int = 30  # 缓存过期时间（秒），多实例部署时其他实例上的用户变更最多延迟该时间生效
+    PASSWORD_HASH_WORKERS: int = 4  # bcrypt 哈希/校验专用线程数，同时进行的计算超出该数量时排队
     
     # JWT配置
     JWT_SECRET_KEY: str
     JWT_ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 7  # 刷新令牌有效期（天），每次刷新都会换发新的刷新令牌
+    TOKEN_REVOCATION_CHANNEL: str = "auth:token_revocations"  # 令牌吊销的Redis发布/订阅频道
     
     # 证书加密配置
     CERT_ENCRYPTION_KEY: Optional[str] = None  # 可选：专门的证书加密密钥（base64编码的32字节密钥）
+    DECRYPT_CACHE_SIZE: int = 1024  # 解密结果缓存条目数（按密文哈希），0表示不缓存
+    DECRYPT_CACHE_TTL: int = 600  # 解密结果缓存过期时间（秒），0表示不过期
+    DECRYPT_CACHE_KEYS: bool = True  # 是否缓存解密后的私钥/加密密钥，关闭后明文私钥不在内存中保留
     
     class Config:
         case_sensitive = True
@@ -8,14 +8,20 @@ from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 import base64
+import hashlib
 import os
 import logging
+from app.core.cache import TTLCache, MISSING
+from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
 # 全局加密器实例
 _fernet_instance: Optional[Fernet] = None
 
+# 解密结果缓存（密文SHA-256 -> 明文）：密文写入后不再变化，列表和固件生成时重复解密同一份数据
+decrypt_cache = TTLCache(maxsize=settings.DECRYPT_CACHE_SIZE, ttl=settings.DECRYPT_CACHE_TTL or None)
+
 
 def get_encryption_key() -> bytes:
     """
@@ -23,8 +29,6 @@ def get_encryption_key() -> bytes:
     优先使用环境变量 CERT_ENCRYPTION_KEY
     如果没有，则使用 JWT_SECRET_KEY 派生密钥
     """
-    from app.core.config import settings
-    
     # 优先使用专门的证书加密密钥
     if hasattr(settings, 'CERT_ENCRYPTION_KEY') and settings.CERT_ENCRYPTION_KEY:
         key_str = settings.CERT_ENCRYPTION_KEY
@@ -101,13 +105,15 @@ def encrypt_certificate_data(data: str) -> str:
         raise ValueError(f"证书加密失败: {str(e)}")
 
 
-def decrypt_certificate_data(encrypted_data: str) -> str:
+def decrypt_certificate_data(encrypted_data: str, is_key: bool = False) -> str:
     """
     解密证书数据（证书或私钥）
     如果数据未加密（旧数据），直接返回
+    解密结果按密文哈希缓存在内存中；DECRYPT_CACHE_KEYS 关闭时私钥/密钥不进入缓存
     
     Args:
         encrypted_data: 加密后的base64编码字符串或原始数据
+        is_key: 数据是私钥或密钥
     
     Returns:
         解密后的原始证书数据
@@ -115,6 +121,13 @@ def decrypt_certificate_data(encrypted_data: str) -> str:
     if not encrypted_data:
         return encrypted_data
     
+    use_cache = settings.DECRYPT_CACHE_SIZE > 0 and (settings.DECRYPT_CACHE_KEYS or not is_key)
+    if use_cache:
+        cache_key = hashlib.sha256(encrypted_data.encode()).digest()
+        cached = decrypt_cache.get(cache_key)
+        if cached is not MISSING:
+            return cached
+    
     # 检查是否是加密数据（简单判断：如果包含证书特征，可能是未加密的）
     # PEM格式的证书通常以 "-----BEGIN" 开头
     if encrypted_data.strip().startswith('-----BEGIN'):
@@ -134,8 +147,10 @@ def decrypt_certificate_data(encrypted_data: str) -> str:
         
         # 尝试解密
         try:
-            decrypted_data = fernet.decrypt(encrypted_bytes)
-            return decrypted_data.decode()
+            decrypted_data = fernet.decrypt(encrypted_bytes).decode()
+            if use_cache:
+                decrypt_cache.set(cache_key, decrypted_data)
+            return decrypted_data
         except:
             # 如果解密失败，可能是未加密的原始数据（base64编码的证书）
             logger.debug("Failed to decrypt, treating as unencrypted data")
@@ -1,13 +1,31 @@
 import asyncio
-import json
 from paho.mqtt import client as mqtt_client
 from app.core.config import settings
-from app.core.database import AsyncSessionLocal
-from app.services.device import DeviceService
+from app.core.database import AsyncSessionLocal, close_pool
+from app.services.device import device_identity_cache
+from app.services.telemetry import TelemetryService
+from app.core.ingest_buffer import IngestBuffer
+from app.services.presence import presence_tracker
+from app.services.partitions import PartitionManager
+from app.services.rollups import RollupService
+from app.services.security import security_stats_cache
+from app.services.monitoring import MonitoringService
+from app.services.alert_engine import alert_rule_index
+from app.services.alert_state import alert_state_tracker
+from app.services.ip_blacklist import ip_blacklist
+from app.services.token_revocation import token_revocation
+from app.core.middleware import ip_filter_stats
+from app.services.audit_sink import audit_sink
+from app.services.user import current_user_cache
+from app.core.security import password_executor, password_hash_stats
+from app.core.encryption import decrypt_cache
 import redis.asyncio as redis
 import logging
-from queue import Queue
-import threading
+
+try:
+    import aiomqtt
+except ImportError:  # 仅在 MQTT_TRANSPORT=asyncio 时需要
+    aiomqtt = None
 
 # 初始化日志
 logger = logging.getLogger(__name__)
@@ -18,17 +36,43 @@ mqtt = None
 # Redis客户端
 redis_client = None
 
-# MQTT消息队列
-mqtt_message_queue = Queue()
+# 后端订阅的主题
+MQTT_TOPICS = [
+    ("devices/+/status", 0),
+    ("devices/+/data", 0),
+    ("devices/+/sensor", 0),
+    ("devices/+/heartbeat", 0)
+]
+
+# MQTT消息有界缓冲区（位于主事件循环上，元素为 (topic, payload)）
+mqtt_ingest_buffer: IngestBuffer = None
 
-# 主事件循环引用（用于在新线程中运行异步任务）
+# 主事件循环引用（paho网络线程通过它把消息投递到队列）
 main_event_loop = None
 
+# 后台任务
+mqtt_client_task = None
+mqtt_ingest_task = None
+presence_flush_task = None
+presence_expiry_task = None
+partition_task = None
+system_status_task = None
+alert_state_task = None
+ip_blacklist_sync_task = None
+ip_blacklist_reload_task = None
+token_revocation_sync_task = None
+audit_flush_task = None
+
 async def startup_handler():
     """应用启动时的处理函数"""
-    global main_event_loop
-    # 保存主事件循环引用，供MQTT消息处理线程使用
+    global main_event_loop, mqtt_ingest_buffer, mqtt_ingest_task, presence_flush_task, presence_expiry_task, partition_task, system_status_task, alert_state_task
+    global ip_blacklist_sync_task, ip_blacklist_reload_task, audit_flush_task, token_revocation_sync_task
+    # 保存主事件循环引用，供paho网络线程投递消息使用
     main_event_loop = asyncio.get_event_loop()
+    mqtt_ingest_buffer = IngestBuffer(
+        maxsize=settings.MQTT_INGEST_QUEUE_SIZE,
+        policy=settings.MQTT_INGEST_OVERFLOW_POLICY
+    )
     
     # Redis和MQTT连接失败不应该阻止应用启动
     # 这样可以先测试API功能，MQTT可以稍后配置
@@ -38,39 +82,117 @@ async def startup_handler():
         logger.warning(f"Redis connection failed, continuing without Redis: {e}")
     
     try:
-        await init_mqtt()
-        # 启动MQTT消息处理线程
-        start_mqtt_message_processor()
-        logger.info("[MQTT] MQTT client and message processor initialized successfully")
+        if settings.MQTT_TRANSPORT == "asyncio":
+            await init_mqtt_asyncio()
+        else:
+            await init_mqtt()
+        # 启动MQTT消息批处理任务
+        mqtt_ingest_task = asyncio.create_task(mqtt_ingest_worker())
+        logger.info(f"[MQTT] MQTT client ({settings.MQTT_TRANSPORT}) and ingest worker initialized successfully")
     except Exception as e:
         logger.warning(f"[MQTT] MQTT connection failed, continuing without MQTT: {e}")
         logger.warning("[MQTT] MQTT features will be unavailable until broker is configured")
         import traceback
         logger.error(f"[MQTT] MQTT initialization error traceback: {traceback.format_exc()}")
 
-    # 启动设备状态检查任务（无论MQTT是否连接成功都启动）
+    # 加载在线设备并启动在线时间批量刷新任务
+    try:
+        async with AsyncSessionLocal() as db:
+            await presence_tracker.load(db)
+    except Exception as e:
+        logger.warning(f"Failed to load device presence state: {e}")
+    presence_flush_task = asyncio.create_task(presence_flusher())
+
+    # 加载告警规则索引（失败时在首次评估时重试）
+    try:
+        async with AsyncSessionLocal() as db:
+            await alert_rule_index.reload(db)
+    except Exception as e:
+        logger.warning(f"Failed to load alert rule index: {e}")
+
+    # 加载未恢复的告警并启动告警状态批量刷新任务（加载失败时在首次评估时重试）
+    try:
+        async with AsyncSessionLocal() as db:
+            await alert_state_tracker.load(db)
+    except Exception as e:
+        logger.warning(f"Failed to load open alerts: {e}")
+    alert_state_task = asyncio.create_task(alert_state_flusher())
+
+    # 加载IP黑名单，Redis可用时订阅其他实例的增量更新
     try:
-        # 在后台任务中启动状态检查器
-        asyncio.create_task(device_status_checker())
+        async with AsyncSessionLocal() as db:
+            await ip_blacklist.load(db)
     except Exception as e:
-        logger.warning(f"Failed to start device status checker: {e}")
+        logger.warning(f"Failed to load IP blacklist: {e}")
+    if redis_client:
+        ip_blacklist.redis = redis_client
+        ip_blacklist_sync_task = asyncio.create_task(ip_blacklist_subscriber())
+    ip_blacklist_reload_task = asyncio.create_task(ip_blacklist_reloader())
+
+    # 加载已吊销的令牌，并订阅其他实例的吊销（Redis不可用时吊销只在本实例生效）
+    if redis_client:
+        token_revocation.redis = redis_client
+        try:
+            await token_revocation.load()
+        except Exception as e:
+            logger.warning(f"Failed to load revoked tokens: {e}")
+        token_revocation_sync_task = asyncio.create_task(token_revocation_subscriber())
+
+    # 启动审计日志/安全事件批量写入任务
+    audit_flush_task = asyncio.create_task(audit_log_flusher())
+
+    # 启动设备离线判定任务（无论MQTT是否连接成功都启动）
+    presence_expiry_task = asyncio.create_task(presence_expiry_worker())
+
+    # 启动指标分区维护任务
+    partition_task = asyncio.create_task(partition_maintenance_worker())
+
+    # 启动系统状态快照刷新任务
+    system_status_task = asyncio.create_task(system_status_refresher())
 
 async def shutdown_handler():
     """应用关闭时的处理函数"""
+    # 先停止MQTT接收并处理完已接收的消息，再停止其他后台任务（在线时间、告警状态随后刷新）
+    await drain_mqtt_ingest()
+
+    for task in (mqtt_client_task, mqtt_ingest_task, presence_flush_task, presence_expiry_task, partition_task, system_status_task, alert_state_task,
+                 ip_blacklist_sync_task, ip_blacklist_reload_task, audit_flush_task, token_revocation_sync_task):
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+    
+    # 写出队列中剩余的审计日志和安全事件
+    written = await audit_sink.drain()
+    if written:
+        logger.info(f"Drained {written} audit record(s) on shutdown")
+
+    # 写入尚未刷新的设备在线时间
+    try:
+        async with AsyncSessionLocal() as db:
+            await presence_tracker.flush(db)
+    except Exception as e:
+        logger.warning(f"Error flushing device presence on shutdown: {e}")
+
+    # 写入尚未刷新的告警发生次数
+    try:
+        async with AsyncSessionLocal() as db:
+            await alert_state_tracker.flush(db)
+    except Exception as e:
+        logger.warning(f"Error flushing alert state on shutdown: {e}")
+    
+    password_executor.shutdown(wait=False)
+    
     if redis_client:
         try:
             await redis_client.close()
             logger.info("Redis connection closed")
         except Exception as e:
             logger.warning(f"Error closing Redis connection: {e}")
-    
-    if mqtt:
-        try:
-            mqtt.loop_stop()
-            mqtt.disconnect()
-            logger.info("MQTT client disconnected")
-        except Exception as e:
-            logger.warning(f"Error disconnecting MQTT client: {e}")
+
+    await close_pool()
 
 async def init_redis():
     """初始化Redis连接"""
@@ -84,8 +206,32 @@ async def init_redis():
         redis_client = None
         raise
 
+def _mqtt_tls_options():
+    """
+    获取MQTT TLS参数
+    如果端口是8883或18883，使用TLS连接；否则返回None
+    """
+    if settings.MQTT_BROKER_PORT not in [8883, 18883]:
+        return None
+    import ssl
+    from pathlib import Path
+    
+    # 获取CA证书路径
+    cert_dir = Path(__file__).parent.parent.parent / "data" / "certs"
+    ca_cert_path = cert_dir / "ca.crt"
+    
+    if ca_cert_path.exists():
+        logger.info(f"[MQTT] Using TLS connection with CA certificate: {ca_cert_path}")
+        return {"ca_certs": str(ca_cert_path), "tls_version": ssl.PROTOCOL_TLSv1_2}
+    logger.warning(f"[MQTT] CA certificate not found at {ca_cert_path}, using insecure TLS")
+    return {"tls_version": ssl.PROTOCOL_TLSv1_2}
+
+def _enqueue_mqtt_message(topic: str, payload: bytes):
+    """将消息放入有界缓冲区（只能在主事件循环中调用，永不等待）"""
+    mqtt_ingest_buffer.put_nowait(topic, payload)
+
 async def init_mqtt():
-    """初始化MQTT客户端"""
+    """初始化MQTT客户端（paho网络线程）"""
     global mqtt
     
     def on_connect(client, userdata, flags, rc, properties=None):
@@ -93,54 +239,31 @@ async def init_mqtt():
         if rc == 0:
             logger.info(f"[MQTT] Connected to broker at {settings.MQTT_BROKER_HOST}:{settings.MQTT_BROKER_PORT}")
             # 订阅必要的主题
-            topics = [
-                ("devices/+/status", 0),
-                ("devices/+/data", 0),
-                ("devices/+/sensor", 0),
-                ("devices/+/heartbeat", 0)
-            ]
-            for topic, qos in topics:
+            for topic, qos in MQTT_TOPICS:
                 result = client.subscribe(topic, qos)
                 logger.info(f"[MQTT] Subscribed to {topic} with QoS {qos}, result: {result}")
         else:
             logger.error(f"[MQTT] Failed to connect to broker with code: {rc}")
     
     def on_message(client, userdata, msg):
-        logger.info(f"[MQTT] Received message on topic: {msg.topic}, qos: {msg.qos}, payload length: {len(msg.payload)}")
-        # 将消息添加到队列，由专门的处理线程处理
+        logger.debug(f"[MQTT] Received message on topic: {msg.topic}, qos: {msg.qos}, payload length: {len(msg.payload)}")
+        # 直接投递到主事件循环上的队列，不阻塞paho网络线程
         try:
-            mqtt_message_queue.put(msg, timeout=5)
-            logger.debug(f"[MQTT] Message queued successfully: {msg.topic}")
+            main_event_loop.call_soon_threadsafe(_enqueue_mqtt_message, msg.topic, msg.payload)
         except Exception as e:
             logger.error(f"[MQTT] Failed to queue message: {e}")
-            import traceback
-            logger.error(f"[MQTT] Queue error traceback: {traceback.format_exc()}")
     
     mqtt = mqtt_client.Client(client_id=settings.MQTT_CLIENT_ID, protocol=mqtt_client.MQTTv5)
     mqtt.username_pw_set(settings.MQTT_USERNAME, settings.MQTT_PASSWORD)
     mqtt.on_connect = on_connect
     mqtt.on_message = on_message
     
-    # 如果端口是8883或18883，使用TLS连接
-    use_tls = settings.MQTT_BROKER_PORT in [8883, 18883]
+    tls_options = _mqtt_tls_options()
+    use_tls = tls_options is not None
     if use_tls:
-        import ssl
-        import os
-        from pathlib import Path
-        
-        # 获取CA证书路径
-        cert_dir = Path(__file__).parent.parent.parent / "data" / "certs"
-        ca_cert_path = cert_dir / "ca.crt"
-        
-        if ca_cert_path.exists():
-            logger.info(f"[MQTT] Using TLS connection with CA certificate: {ca_cert_path}")
-            mqtt.tls_set(ca_certs=str(ca_cert_path), tls_version=ssl.PROTOCOL_TLSv1_2)
-            # 禁用主机名验证（因为使用IP地址连接）
-            mqtt.tls_insecure_set(True)
-        else:
-            logger.warning(f"[MQTT] CA certificate not found at {ca_cert_path}, using insecure TLS")
-            mqtt.tls_set(tls_version=ssl.PROTOCOL_TLSv1_2)
-            mqtt.tls_insecure_set(True)
+        mqtt.tls_set(**tls_options)
+        # 禁用主机名验证（因为使用IP地址连接）
+        mqtt.tls_insecure_set(True)
     
     try:
         logger.info(f"[MQTT] Attempting to connect to {settings.MQTT_BROKER_HOST}:{settings.MQTT_BROKER_PORT} (TLS: {use_tls})")
@@ -163,188 +286,340 @@ async def init_mqtt():
         mqtt = None
         raise
 
-def mqtt_message_processor():
-    """MQTT消息处理线程"""
-    import queue
-    import traceback
+async def init_mqtt_asyncio():
+    """初始化asyncio原生MQTT客户端（消息直接在主事件循环中入队）"""
+    global mqtt_client_task
+    if aiomqtt is None:
+        raise RuntimeError("MQTT_TRANSPORT=asyncio requires the 'aiomqtt' package")
+    mqtt_client_task = asyncio.create_task(mqtt_asyncio_client_loop())
+
+async def mqtt_asyncio_client_loop():
+    """asyncio MQTT客户端主循环，断线后自动重连"""
+    tls_options = _mqtt_tls_options()
+    use_tls = tls_options is not None
+    reconnect_interval = 5
+    
     while True:
         try:
-            message = mqtt_message_queue.get(timeout=1)
-            logger.info(f"[MQTT Processor] Got message from queue: {message.topic}")
-            
-            # 使用主事件循环来运行异步任务，而不是创建新的事件循环
-            # 这样可以避免数据库连接池的事件循环冲突
-            if main_event_loop and main_event_loop.is_running():
-                # 将任务提交到主事件循环
-                future = asyncio.run_coroutine_threadsafe(
-                    handle_mqtt_message(message),
-                    main_event_loop
-                )
-                # 等待任务完成（最多30秒）
-                try:
-                    future.result(timeout=30)
-                except Exception as e:
-                    logger.error(f"[MQTT Processor] Error waiting for message handling: {e}")
-                    logger.error(f"[MQTT Processor] Traceback: {traceback.format_exc()}")
-            else:
-                logger.error("[MQTT Processor] Main event loop not available, cannot process message")
+            logger.info(f"[MQTT] Attempting to connect to {settings.MQTT_BROKER_HOST}:{settings.MQTT_BROKER_PORT} (TLS: {use_tls}, asyncio)")
+            async with aiomqtt.Client(
+                hostname=settings.MQTT_BROKER_HOST,
+                port=settings.MQTT_BROKER_PORT,
+                identifier=settings.MQTT_CLIENT_ID,
+                username=settings.MQTT_USERNAME,
+                password=settings.MQTT_PASSWORD,
+                protocol=aiomqtt.ProtocolVersion.V5,
+                tls_params=aiomqtt.TLSParameters(**tls_options) if use_tls else None,
+                # 禁用主机名验证（因为使用IP地址连接）
+                tls_insecure=True if use_tls else None,
+            ) as client:
+                logger.info(f"[MQTT] Connected to broker at {settings.MQTT_BROKER_HOST}:{settings.MQTT_BROKER_PORT}")
+                for topic, qos in MQTT_TOPICS:
+                    await client.subscribe(topic, qos)
+                    logger.info(f"[MQTT] Subscribed to {topic} with QoS {qos}")
                 
-        except queue.Empty:
-            # 超时是正常的，继续轮询
-            pass
+                async for message in client.messages:
+                    # block策略下缓冲区满时暂停读取，由TCP向broker施加背压
+                    await mqtt_ingest_buffer.put(str(message.topic), message.payload)
+        except asyncio.CancelledError:
+            raise
+        except aiomqtt.MqttError as e:
+            logger.warning(f"[MQTT] Connection lost: {e}, reconnecting in {reconnect_interval}s")
         except Exception as e:
-            logger.error(f"[MQTT Processor] Error in message processor: {e}")
-            logger.error(f"[MQTT Processor] Traceback: {traceback.format_exc()}")
-    
-def start_mqtt_message_processor():
-    """启动MQTT消息处理线程"""
-    thread = threading.Thread(target=mqtt_message_processor, daemon=True)
-    thread.start()
-    logger.info("MQTT message processor thread started")
-
-async def handle_mqtt_message(message):
-    """处理MQTT消息"""
+            logger.error(f"[MQTT] Unexpected error in asyncio MQTT client: {e}", exc_info=True)
+        await asyncio.sleep(reconnect_interval)
+
+async def mqtt_ingest_worker():
+    """MQTT消息批处理任务：攒批后并发处理，并限制同时处理中的批次数"""
+    in_flight = asyncio.Semaphore(max(1, settings.MQTT_INGEST_MAX_IN_FLIGHT))
+    batch_size = max(1, settings.MQTT_INGEST_BATCH_SIZE)
+    flush_interval = max(0, settings.MQTT_INGEST_FLUSH_INTERVAL_MS) / 1000
+    pending = set()
+
+    async def run_batch(batch):
+        try:
+            await handle_mqtt_batch(batch)
+        finally:
+            in_flight.release()
+
+    logger.info("MQTT ingest worker started")
+    while True:
+        try:
+            batch = await mqtt_ingest_buffer.get_batch(batch_size, flush_interval)
+            if not batch:
+                # 缓冲区已关闭且剩余消息已全部取出
+                if mqtt_ingest_buffer.closed:
+                    break
+                continue
+            logger.debug(f"[MQTT Processor] Got batch of {len(batch)} message(s) from queue")
+            # 达到并发上限时在此等待
+            await in_flight.acquire()
+            task = asyncio.create_task(run_batch(batch))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[MQTT Processor] Error in ingest worker: {e}", exc_info=True)
+
+    # 关闭时等待处理中的批次写库完成
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+    logger.info("MQTT ingest worker stopped")
+
+async def drain_mqtt_ingest():
+    """应用关闭时停止MQTT接收，处理完缓冲区中剩余的消息和处理中的批次（超时后放弃）"""
+    if mqtt:
+        try:
+            mqtt.loop_stop()
+            mqtt.disconnect()
+            logger.info("MQTT client disconnected")
+        except Exception as e:
+            logger.warning(f"Error disconnecting MQTT client: {e}")
+    if mqtt_client_task and not mqtt_client_task.done():
+        mqtt_client_task.cancel()
+        try:
+            await mqtt_client_task
+        except (asyncio.CancelledError, Exception):
+            pass
+    if mqtt_ingest_buffer is None or mqtt_ingest_task is None or mqtt_ingest_task.done():
+        return
+    remaining = len(mqtt_ingest_buffer)
+    mqtt_ingest_buffer.close()
     try:
-        topic = message.topic
-        payload = message.payload.decode()
-        logger.info(f"[MQTT] Received message on topic: {topic}, payload: {payload[:200]}")  # 限制日志长度
-        
-        # 解析topic获取device_id
-        topic_parts = topic.split('/')
-        if len(topic_parts) >= 2 and topic_parts[0] == 'devices':
-            device_id = topic_parts[1]
-            message_type = topic_parts[2] if len(topic_parts) > 2 else None
-            logger.info(f"[MQTT] Parsed device_id: {device_id}, message_type: {message_type}")
-            
-            # 根据消息类型处理
-            if message_type in ['status', 'heartbeat', 'sensor']:
-                # 更新设备状态为在线
-                async with AsyncSessionLocal() as db:
-                    device_service = DeviceService(db)
-                    device = await device_service.get_by_device_id(device_id)
-                    if device:
-                        logger.info(f"[MQTT] Found device in database: {device.name} (id: {device.id})")
-                        await device_service.update_status(device, "online")
-                        logger.info(f"[MQTT] Device {device_id} status updated to online")
-                        
-                        # 如果是传感器数据，保存到监控表
-                        if message_type == 'sensor':
-                            try:
-                                from app.models.monitoring import DeviceMetrics
-                                from datetime import datetime
-                                import uuid
-                                
-                                # 解析JSON数据
-                                sensor_data = json.loads(payload) if payload else {}
-                                logger.info(f"[MQTT] Parsed sensor data: {sensor_data}")
-                                
-                                # 提取温度、湿度等指标（支持设备发送的所有字段）
-                                metrics = {}
-                                # 基础传感器数据
-                                if 'temperature' in sensor_data:
-                                    metrics['temperature'] = sensor_data['temperature']
-                                if 'humidity' in sensor_data:
-                                    metrics['humidity'] = sensor_data['humidity']
-                                if 'voltage' in sensor_data:
-                                    metrics['voltage'] = sensor_data['voltage']
-                                if 'battery' in sensor_data:
-                                    metrics['battery'] = sensor_data['battery']
-                                # 其他可选指标
-                                if 'air_quality' in sensor_data:
-                                    metrics['air_quality'] = sensor_data['air_quality']
-                                # 状态信息（如果有）
-                                if 'status' in sensor_data and isinstance(sensor_data['status'], dict):
-                                    if 'wifi' in sensor_data['status']:
-                                        metrics['wifi_status'] = sensor_data['status']['wifi']
-                                    if 'mqtt' in sensor_data['status']:
-                                        metrics['mqtt_status'] = sensor_data['status']['mqtt']
-                                    if 'uptime' in sensor_data['status']:
-                                        metrics['uptime'] = sensor_data['status']['uptime']
-                                
-                                # 保存每种指标的记录
-                                saved_count = 0
-                                for metric_name, metric_value in metrics.items():
-                                    metric_record = DeviceMetrics(
-                                        device_id=device.id,
-                                        metric_type=metric_name,
-                                        metrics={'value': metric_value},
-                                        timestamp=datetime.utcnow()
-                                    )
-                                    db.add(metric_record)
-                                    saved_count += 1
-                                
-                                await db.commit()
-                                logger.info(f"[MQTT] Saved {saved_count} sensor metrics for device {device_id}: {metrics}")
-                            except json.JSONDecodeError as e:
-                                logger.error(f"[MQTT] Failed to parse JSON payload: {e}, payload: {payload}")
-                                await db.rollback()
-                            except Exception as e:
-                                logger.error(f"[MQTT] Error saving sensor metrics: {e}", exc_info=True)
-                                await db.rollback()
-                        elif message_type == 'heartbeat':
-                            logger.info(f"[MQTT] Heartbeat received from device {device_id}, status updated")
-                    else:
-                        logger.warning(f"[MQTT] Device {device_id} not found in database")
-            else:
-                logger.debug(f"[MQTT] Unhandled message type: {message_type}")
-    except UnicodeDecodeError as e:
-        logger.error(f"[MQTT] Failed to decode message payload: {e}")
+        await asyncio.wait_for(mqtt_ingest_task, timeout=max(1, settings.MQTT_INGEST_SHUTDOWN_TIMEOUT))
+        logger.info(f"Drained MQTT ingest buffer ({remaining} queued message(s)) on shutdown")
+    except asyncio.TimeoutError:
+        logger.error(
+            f"MQTT ingest did not finish within {settings.MQTT_INGEST_SHUTDOWN_TIMEOUT}s on shutdown, "
+            f"{len(mqtt_ingest_buffer)} message(s) left unprocessed"
+        )
     except Exception as e:
-        logger.error(f"[MQTT] Error processing MQTT message: {e}", exc_info=True)
+        logger.error(f"Error draining MQTT ingest buffer: {e}", exc_info=True)
 
-async def device_status_checker():
-    """定期检查设备在线状态，将超时的设备标记为离线"""
-    from datetime import datetime, timedelta, timezone
-    from sqlalchemy import select
-    
-    # 设备离线超时时间：90秒（心跳间隔30秒 + 60秒容差）
-    OFFLINE_TIMEOUT = timedelta(seconds=90)
-    
-    logger.info("Device status checker started")
+def get_runtime_stats() -> dict:
+    """运行时统计信息（供监控接口使用）"""
+    return {
+        "mqtt_ingest": mqtt_ingest_buffer.stats() if mqtt_ingest_buffer else None,
+        "presence": presence_tracker.stats(),
+        "device_identity_cache": device_identity_cache.stats(),
+        "security_stats_cache": security_stats_cache.stats(),
+        "alert_rules": alert_rule_index.stats(),
+        "alert_state": alert_state_tracker.stats(),
+        "ip_blacklist": ip_blacklist.stats(),
+        "ip_filter": ip_filter_stats.stats(),
+        "audit_sink": audit_sink.stats(),
+        "user_cache": current_user_cache.stats(),
+        "password_hashing": password_hash_stats.stats(),
+        "token_revocation": token_revocation.stats(),
+        "decrypt_cache": decrypt_cache.stats(),
+    }
+
+async def handle_mqtt_batch(messages):
+    """
+    批量处理MQTT消息（messages 为 (topic, payload) 列表）
+    整批失败（事务已回滚）时对半拆分重试，避免一条坏消息拖垮整批；单条消息仍失败时丢弃并计入 ingest 统计
+    """
+    try:
+        async with AsyncSessionLocal() as db:
+            try:
+                stats = await TelemetryService(db).ingest_batch(messages)
+                logger.info(
+                    f"[MQTT] Batch processed: {stats['messages']} message(s), "
+                    f"{stats['devices']} device(s), {stats['metrics']} metric(s)"
+                )
+                return
+            except Exception:
+                await db.rollback()
+                raise
+    except Exception as e:
+        if len(messages) <= 1:
+            logger.error(f"[MQTT] Dropping {len(messages)} message(s) that failed processing: {e}", exc_info=True)
+            if mqtt_ingest_buffer is not None:
+                mqtt_ingest_buffer.record_failed(len(messages))
+            return
+        logger.warning(f"[MQTT] Error processing batch of {len(messages)} message(s), retrying in halves: {e}")
+    middle = len(messages) // 2
+    await handle_mqtt_batch(messages[:middle])
+    await handle_mqtt_batch(messages[middle:])
+
+async def presence_flusher():
+    """周期性地将设备最近在线时间批量写入数据库"""
+    interval = max(1, settings.PRESENCE_FLUSH_INTERVAL)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with AsyncSessionLocal() as db:
+                count = await presence_tracker.flush(db)
+                if count:
+                    logger.debug(f"Flushed last_online_at for {count} device(s)")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error flushing device presence: {e}", exc_info=True)
+
+async def alert_state_flusher():
+    """周期性地将告警发生次数和最近触发时间批量写入数据库"""
+    interval = max(1, settings.ALERT_STATE_FLUSH_INTERVAL)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with AsyncSessionLocal() as db:
+                count = await alert_state_tracker.flush(db)
+                if count:
+                    logger.debug(f"Flushed occurrence counts for {count} alert(s)")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error flushing alert state: {e}", exc_info=True)
+
+async def presence_expiry_worker():
+    """
+    设备离线判定任务
+    每个周期只处理离线截止时间已到的设备，并用一条UPDATE批量标记为离线
+    """
+    interval = max(1, settings.PRESENCE_CHECK_INTERVAL)
+    pending_offline = []
     
-    # 等待一下，确保数据库连接已建立
-    await asyncio.sleep(5)
+    logger.info("Device presence expiry worker started")
     
     while True:
         try:
-            # 每30秒检查一次
-            await asyncio.sleep(30)
+            await asyncio.sleep(interval)
             
             async with AsyncSessionLocal() as db:
-                device_service = DeviceService(db)
-                
-                # 获取所有状态为online的设备
-                from app.models.device import Device
-                result = await db.execute(
-                    select(Device).filter(Device.status == "online")
-                )
-                online_devices = result.scalars().all()
+                # 启动时加载失败则重试，未加载前不做离线判定
+                if not presence_tracker.loaded:
+                    await presence_tracker.load(db)
                 
-                now = datetime.now(timezone.utc)
-                offline_count = 0
+                pending_offline.extend(presence_tracker.expire())
+                if not pending_offline:
+                    continue
                 
-                for device in online_devices:
-                    # 如果设备没有last_online_at时间，或者超过超时时间，标记为离线
-                    if device.last_online_at is None:
-                        await device_service.update_status(device, "offline")
-                        offline_count += 1
-                        logger.info(f"Device {device.device_id} marked offline (no last_online_at)")
-                    else:
-                        # 处理时区问题：确保last_online_at是timezone-aware的
-                        last_online = device.last_online_at
-                        if last_online.tzinfo is None:
-                            # 如果是naive datetime，假设是UTC
-                            last_online = last_online.replace(tzinfo=timezone.utc)
-                        
-                        time_diff = now - last_online
-                        if time_diff > OFFLINE_TIMEOUT:
-                            await device_service.update_status(device, "offline")
-                            offline_count += 1
-                            logger.info(f"Device {device.device_id} marked offline (timeout: {time_diff.total_seconds():.0f}s)")
-                
-                if offline_count > 0:
-                    logger.info(f"Marked {offline_count} device(s) as offline")
+                # 先写入最近在线时间，再标记离线
+                await presence_tracker.flush(db)
+                await presence_tracker.apply_offline(db, pending_offline)
+                logger.info(f"Marked {len(pending_offline)} device(s) as offline")
+                pending_offline = []
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            logger.error(f"Error in device status checker: {e}", exc_info=True)
-            # 出错后等待更长时间再重试
-            await asyncio.sleep(60)
\ No newline at end of file
+            # 未写入的离线设备保留到下个周期重试
+            logger.error(f"Error in device presence expiry worker: {e}", exc_info=True)
+
+async def partition_maintenance_worker():
+    """指标分区维护任务：提前创建后续分区，删除超过保留期的分区和降采样数据"""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                summary = await PartitionManager(db).maintain(
+                    interval=settings.METRICS_PARTITION_INTERVAL,
+                    ahead=settings.METRICS_PARTITION_PREMAKE,
+                    retention_days=settings.METRICS_RETENTION_DAYS
+                )
+            for table, changes in summary.items():
+                if changes["created"] or changes["dropped"]:
+                    logger.info(f"Partition maintenance for {table}: created {changes['created']}, dropped {changes['dropped']}")
+            async with AsyncSessionLocal() as db:
+                pruned = await RollupService(db).prune(settings.METRICS_ROLLUP_RETENTION_DAYS)
+            if any(pruned.values()):
+                logger.info(f"Pruned expired metric rollups: {pruned}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in partition maintenance: {e}", exc_info=True)
+        await asyncio.sleep(max(60, settings.METRICS_PARTITION_CHECK_INTERVAL))
+
+async def system_status_refresher():
+    """周期性刷新系统状态快照，仪表盘轮询直接读取快照"""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                await MonitoringService(db).refresh_system_status()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error refreshing system status: {e}", exc_info=True)
+        await asyncio.sleep(max(1, settings.SYSTEM_STATUS_REFRESH_INTERVAL))
+
+async def ip_blacklist_subscriber():
+    """订阅其他API实例发布的黑名单增量更新；断线重连后全量重新加载，避免遗漏期间的更新"""
+    while True:
+        pubsub = redis_client.pubsub()
+        try:
+            await pubsub.subscribe(settings.IP_BLACKLIST_SYNC_CHANNEL)
+            logger.info(f"Subscribed to IP blacklist updates on {settings.IP_BLACKLIST_SYNC_CHANNEL}")
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    ip_blacklist.apply_message(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in IP blacklist subscriber: {e}", exc_info=True)
+        finally:
+            try:
+                await pubsub.close()
+            except Exception:
+                pass
+        await asyncio.sleep(5)
+        try:
+            async with AsyncSessionLocal() as db:
+                await ip_blacklist.load(db)
+        except Exception as e:
+            logger.error(f"Error reloading IP blacklist: {e}", exc_info=True)
+
+async def ip_blacklist_reloader():
+    """周期性从数据库全量重新加载黑名单：清除过期条目，并兜底丢失的同步消息"""
+    while True:
+        await asyncio.sleep(max(10, settings.IP_BLACKLIST_RELOAD_INTERVAL))
+        try:
+            async with AsyncSessionLocal() as db:
+                await ip_blacklist.load(db)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error reloading IP blacklist: {e}", exc_info=True)
+
+async def token_revocation_subscriber():
+    """订阅其他API实例的令牌吊销；断线重连后从Redis全量重新加载，避免遗漏期间的吊销"""
+    while True:
+        pubsub = redis_client.pubsub()
+        try:
+            await pubsub.subscribe(settings.TOKEN_REVOCATION_CHANNEL)
+            logger.info(f"Subscribed to token revocations on {settings.TOKEN_REVOCATION_CHANNEL}")
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    token_revocation.apply_message(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in token revocation subscriber: {e}", exc_info=True)
+        finally:
+            try:
+                await pubsub.close()
+            except Exception:
+                pass
+        await asyncio.sleep(5)
+        try:
+            await token_revocation.load()
+        except Exception as e:
+            logger.error(f"Error reloading revoked tokens: {e}", exc_info=True)
+
+async def audit_log_flusher():
+    """批量写入审计日志和安全事件：每隔 AUDIT_FLUSH_INTERVAL_MS 毫秒或攒满一批时写出队列"""
+    interval = max(10, settings.AUDIT_FLUSH_INTERVAL_MS) / 1000
+    audit_sink.running = True
+    try:
+        while True:
+            await audit_sink.wait(interval)
+            try:
+                await audit_sink.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 写入失败的记录保留在队列中，下个周期重试
+                logger.error(f"Error writing audit records: {e}", exc_info=True)
+                await asyncio.sleep(1)
+    finally:
+        # 任务停止后提交的记录直接写入，剩余队列由 shutdown_handler 清空
+        audit_sink.running = False
@@ -0,0 +1,160 @@
+"""
+MQTT消息有界缓冲区
+在主事件循环中使用，限制积压消息数量，溢出时按策略丢弃或合并，保证broker连接不被后端处理速度拖住
+"""
+from typing import Dict, Any, List, Tuple
+from collections import OrderedDict, deque
+import asyncio
+import itertools
+
+# 溢出策略
+OVERFLOW_POLICIES = ("drop_oldest", "coalesce", "block")
+
+# 可合并的低优先级消息类型（只关心最新一条）；其余类型（sensor/data）优先保留
+COALESCABLE_TYPES = ("status", "heartbeat")
+
+
+class IngestBuffer:
+    """
+    有界MQTT消息缓冲区
+
+    - drop_oldest: 缓冲区满时丢弃最旧的消息，优先丢弃状态/心跳消息
+    - coalesce: 状态/心跳消息按 (设备, 类型) 只保留最新一条；仍然溢出时按 drop_oldest 处理
+    - block: 缓冲区满时 put() 等待空位；put_nowait() 无法等待，直接丢弃新消息
+    """
+
+    def __init__(self, maxsize: int = 10000, policy: str = "coalesce"):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}, expected one of {OVERFLOW_POLICIES}")
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        # 低优先级消息（状态/心跳），coalesce策略下键为 (device_id, message_type)
+        self._low: "OrderedDict[Any, Tuple[str, bytes]]" = OrderedDict()
+        # 高优先级消息（传感器数据等）
+        self._high: "deque[Tuple[str, bytes]]" = deque()
+        self._seq = itertools.count()
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+        # 关闭后 get_batch 不再等待新消息，取完剩余消息后返回空批次
+        self.closed = False
+        # 计数器
+        self.received = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.peak_depth = 0
+        # 取出后处理失败（拆分重试后仍失败）而丢弃的消息，由处理方通过 record_failed 记录
+        self.failed = 0
+
+    def __len__(self) -> int:
+        return len(self._low) + len(self._high)
+
+    def put_nowait(self, topic: str, payload: bytes) -> bool:
+        """放入消息，不等待；返回消息是否被保留（被合并也视为保留）"""
+        self.received += 1
+        parts = topic.split('/')
+        message_type = parts[2] if len(parts) > 2 else None
+        low = message_type in COALESCABLE_TYPES
+
+        if low and self.policy == "coalesce":
+            key = (parts[1], message_type)
+            if key in self._low:
+                self._low[key] = (topic, payload)
+                self.coalesced += 1
+                return True
+        else:
+            key = next(self._seq)
+
+        if len(self) >= self.maxsize and not self._make_room(low):
+            self.dropped += 1
+            return False
+
+        if low:
+            self._low[key] = (topic, payload)
+        else:
+            self._high.append((topic, payload))
+        depth = len(self)
+        if depth > self.peak_depth:
+            self.peak_depth = depth
+        if depth >= self.maxsize:
+            self._not_full.clear()
+        self._not_empty.set()
+        return True
+
+    async def put(self, topic: str, payload: bytes) -> bool:
+        """放入消息；block策略下缓冲区满时等待空位"""
+        if self.policy == "block":
+            while len(self) >= self.maxsize:
+                self._not_full.clear()
+                await self._not_full.wait()
+        return self.put_nowait(topic, payload)
+
+    def _make_room(self, incoming_low: bool) -> bool:
+        """为新消息腾出空位，返回是否成功"""
+        if self.policy == "block":
+            return False
+        if self._low:
+            self._low.popitem(last=False)
+            self.dropped += 1
+            return True
+        if incoming_low:
+            # 不为状态/心跳消息挤掉传感器数据
+            return False
+        self._high.popleft()
+        self.dropped += 1
+        return True
+
+    def _take(self, count: int) -> List[Tuple[str, bytes]]:
+        """取出最多 count 条消息，传感器数据优先"""
+        items = []
+        while self._high and len(items) < count:
+            items.append(self._high.popleft())
+        while self._low and len(items) < count:
+            items.append(self._low.popitem(last=False)[1])
+        if not self:
+            self._not_empty.clear()
+        if len(self) < self.maxsize:
+            self._not_full.set()
+        return items
+
+    def record_failed(self, count: int) -> None:
+        """记录处理失败而丢弃的消息数"""
+        self.failed += count
+
+    def close(self) -> None:
+        """停止接收后调用：唤醒等待中的 get_batch，剩余消息不再等待攒批"""
+        self.closed = True
+        self._not_empty.set()
+
+    async def get_batch(self, max_size: int, flush_interval: float) -> List[Tuple[str, bytes]]:
+        """攒批：最多 max_size 条，或自第一条消息起等待 flush_interval 秒；已关闭且为空时返回空列表"""
+        while not self:
+            if self.closed:
+                return []
+            await self._not_empty.wait()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + flush_interval
+        batch = self._take(max_size)
+        while len(batch) < max_size and not self.closed:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(self._not_empty.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            batch.extend(self._take(max_size - len(batch)))
+        return batch
+
+    def stats(self) -> Dict[str, Any]:
+        """缓冲区统计信息"""
+        return {
+            "policy": self.policy,
+            "maxsize": self.maxsize,
+            "depth": len(self),
+            "peak_depth": self.peak_depth,
+            "received": self.received,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "failed": self.failed,
+        }
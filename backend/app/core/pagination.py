@@ -0,0 +1,80 @@
+"""
+游标（keyset）分页
+列表按 (created_at, id) 倒序排列，游标编码上一页最后一条记录的 (created_at, id)，
+下一页从该位置之后继续读取，不使用 OFFSET，任意页的查询代价与第一页相同
+"""
+from typing import Any, Callable, NamedTuple, Optional, Sequence
+from datetime import datetime, timezone
+import base64
+import json
+from fastapi import HTTPException, Response, status
+from sqlalchemy import and_, or_
+from sqlalchemy.sql import Select
+
+# 下一页游标通过响应头返回，列表响应体保持不变
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class Cursor(NamedTuple):
+    created_at: datetime
+    id: Any
+
+
+def encode_cursor(created_at: datetime, id: Any) -> str:
+    raw = json.dumps([created_at.isoformat(), str(id)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(value: str, id_type: Callable[[str], Any] = str) -> Cursor:
+    """
+    解析游标，格式错误时抛出 ValueError
+    id 按 id_type 转换为主键列的类型（如 uuid.UUID）；时间统一转换为不带时区的UTC时间，
+    与 datetime.utcnow 写入的 created_at 一致
+    """
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+        created_at, id = json.loads(raw)
+        created_at = datetime.fromisoformat(created_at)
+        if created_at.tzinfo is not None:
+            created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+        return Cursor(created_at, id_type(str(id)))
+    except (TypeError, ValueError, AttributeError) as e:
+        raise ValueError(f"Invalid cursor: {value}") from e
+
+
+def parse_cursor(value: Optional[str], id_type: Callable[[str], Any] = str) -> Optional[Cursor]:
+    """路由层使用：解析查询参数中的游标，格式错误返回400"""
+    if not value:
+        return None
+    try:
+        return decode_cursor(value, id_type)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="无效的分页游标"
+        )
+
+
+def apply_keyset(query: Select, created_at_column, id_column, cursor: Optional[Cursor]) -> Select:
+    """
+    按 (created_at, id) 倒序排序，有游标时只取游标之后的记录
+    条件写成 created_at <= c AND (created_at < c OR id < i)，可以直接使用 created_at 上的已有索引
+    """
+    if cursor is not None:
+        created_at = cursor.created_at
+        if getattr(created_at_column.type, "timezone", False):
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        query = query.filter(
+            and_(
+                created_at_column <= created_at,
+                or_(created_at_column < created_at, id_column < cursor.id)
+            )
+        )
+    return query.order_by(created_at_column.desc(), id_column.desc())
+
+
+def set_next_cursor(response: Response, items: Sequence[Any], limit: int) -> None:
+    """本页已满时，把最后一条记录的位置作为下一页游标写入响应头"""
+    if items and len(items) >= limit:
+        last = items[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last.created_at, last.id)
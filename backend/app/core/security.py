@@ -1,5 +1,9 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import time
+import uuid
 from jose import jwt
 from passlib.context import CryptContext
 from app.core.config import settings
@@ -19,6 +23,58 @@ def get_password_hash(password: str) -> str:
     """获取密码哈希"""
     return pwd_context.hash(password)
 
+
+# bcrypt 计算耗时数十到数百毫秒，放在专用的有界线程池中执行，避免阻塞事件循环（及其上的MQTT接入）
+PASSWORD_HASH_WORKERS = max(1, settings.PASSWORD_HASH_WORKERS)
+password_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS,
+    thread_name_prefix="password-hash"
+)
+
+
+class PasswordHashStats:
+    """密码哈希线程池计数"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        # 已提交但尚未完成的任务数（排队 + 执行中）
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.completed = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queue_depth": max(0, self.in_flight - self.workers),
+            "peak_in_flight": self.peak_in_flight,
+            "completed": self.completed,
+        }
+
+
+password_hash_stats = PasswordHashStats(PASSWORD_HASH_WORKERS)
+
+
+async def _run_password_task(func, *args):
+    password_hash_stats.in_flight += 1
+    if password_hash_stats.in_flight > password_hash_stats.peak_in_flight:
+        password_hash_stats.peak_in_flight = password_hash_stats.in_flight
+    try:
+        return await asyncio.get_running_loop().run_in_executor(password_executor, func, *args)
+    finally:
+        password_hash_stats.in_flight -= 1
+        password_hash_stats.completed += 1
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """验证密码（在密码哈希线程池中执行）"""
+    return await _run_password_task(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """获取密码哈希（在密码哈希线程池中执行）"""
+    return await _run_password_task(get_password_hash, password)
+
 def create_access_token(subject: str, expires_delta: Optional[timedelta] = None) -> str:
     """创建访问令牌"""
     if expires_delta:
@@ -28,7 +84,10 @@ def create_access_token(subject: str, expires_delta: Optional[timedelta] = None)
             minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
         )
     
-    to_encode = {"exp": expire, "sub": str(subject), "type": "access"}
+    to_encode = {
+        "exp": expire, "iat": time.time(), "jti": uuid.uuid4().hex,
+        "sub": str(subject), "type": "access"
+    }
     encoded_jwt = jwt.encode(
         to_encode,
         settings.JWT_SECRET_KEY,
@@ -38,8 +97,11 @@ def create_access_token(subject: str, expires_delta: Optional[timedelta] = None)
 
 def create_refresh_token(subject: str) -> str:
     """创建刷新令牌"""
-    expire = datetime.utcnow() + timedelta(days=7)
-    to_encode = {"exp": expire, "sub": str(subject), "type": "refresh"}
+    expire = datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+    to_encode = {
+        "exp": expire, "iat": time.time(), "jti": uuid.uuid4().hex,
+        "sub": str(subject), "type": "refresh"
+    }
     encoded_jwt = jwt.encode(
         to_encode,
         settings.JWT_SECRET_KEY,
@@ -1,6 +1,6 @@
 from datetime import datetime
 from typing import Dict, Any, Optional
-from sqlalchemy import Column, String, Float, Boolean, DateTime, Integer, JSON, ForeignKey
+from sqlalchemy import Column, String, Float, Boolean, DateTime, Integer, BigInteger, JSON, ForeignKey, Index, Sequence, text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 import uuid
@@ -8,18 +8,79 @@ from app.core.database import Base
 from app.core.id import generate_id
 
 class DeviceMetrics(Base):
-    """设备指标数据模型"""
+    """设备指标数据模型（按 timestamp 范围分区，见 app/services/partitions.py）"""
     __tablename__ = "device_metrics"
 
     id = Column(String, primary_key=True, default=generate_id)
     device_id = Column(UUID(as_uuid=True), ForeignKey("devices.id"), nullable=False)
     metric_type = Column(String, nullable=False)  # system, performance, security 等
     metrics = Column(JSON, nullable=False)  # 存储具体的指标数据
-    timestamp = Column(DateTime, nullable=False, default=datetime.utcnow)
+    # 分区键，必须包含在主键中
+    timestamp = Column(DateTime, primary_key=True, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_device_metrics_device_id_timestamp", "device_id", "timestamp"),
+        Index("ix_device_metrics_device_id_metric_type_timestamp", "device_id", "metric_type", "timestamp"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
 
     # 关联 - 改用 backref 以避免循环导入问题
     device = relationship("Device", backref="device_metrics")
-    alerts = relationship("MonitoringAlert", back_populates="metrics")
+    # 分区表无法被外键引用，告警通过 metrics_id 逻辑关联
+    alerts = relationship(
+        "MonitoringAlert", back_populates="metrics", viewonly=True,
+        primaryjoin="DeviceMetrics.id == foreign(MonitoringAlert.metrics_id)"
+    )
+
+# 紧凑遥测表中的指标列（与MQTT传感器数据字段对应）
+TELEMETRY_NUMERIC_COLUMNS = ("temperature", "humidity", "voltage", "battery", "air_quality", "uptime")
+TELEMETRY_TEXT_COLUMNS = ("wifi_status", "mqtt_status")
+TELEMETRY_METRIC_COLUMNS = TELEMETRY_NUMERIC_COLUMNS + TELEMETRY_TEXT_COLUMNS
+
+class DeviceTelemetry(Base):
+    """设备遥测数据模型（每个采样一行，指标按类型存储在独立列中；按 timestamp 范围分区）"""
+    __tablename__ = "device_telemetry"
+
+    id = Column(BigInteger, Sequence("device_telemetry_id_seq"), primary_key=True)
+    device_id = Column(UUID(as_uuid=True), ForeignKey("devices.id", ondelete="CASCADE"), nullable=False)
+    # 分区键，必须包含在主键中
+    timestamp = Column(DateTime, primary_key=True, nullable=False, default=datetime.utcnow)
+    temperature = Column(Float)
+    humidity = Column(Float)
+    voltage = Column(Float)
+    battery = Column(Float)
+    air_quality = Column(Float)
+    uptime = Column(BigInteger)
+    wifi_status = Column(String(20))
+    mqtt_status = Column(String(20))
+
+    __table_args__ = (
+        Index("ix_device_telemetry_device_id_timestamp", "device_id", "timestamp"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+
+# 降采样粒度 -> 桶宽度（秒）
+ROLLUP_RESOLUTIONS = {"1m": 60, "5m": 300, "1h": 3600}
+
+class DeviceMetricRollup(Base):
+    """设备指标降采样数据（每个设备、指标、粒度、时间桶一行，写入时增量更新）"""
+    __tablename__ = "device_metric_rollups"
+
+    device_id = Column(UUID(as_uuid=True), ForeignKey("devices.id", ondelete="CASCADE"), primary_key=True)
+    resolution = Column(String(4), primary_key=True)  # 1m, 5m, 1h
+    metric_name = Column(String(50), primary_key=True)
+    bucket = Column(DateTime, primary_key=True)  # 时间桶起点（UTC）
+    min_value = Column(Float, nullable=False)
+    max_value = Column(Float, nullable=False)
+    sum_value = Column(Float, nullable=False)  # 平均值 = sum_value / sample_count
+    sample_count = Column(BigInteger, nullable=False)
+    last_value = Column(Float, nullable=False)
+    last_at = Column(DateTime, nullable=False)  # last_value 对应的采样时间
+
+    __table_args__ = (
+        # 按粒度清理过期数据
+        Index("ix_device_metric_rollups_resolution_bucket", "resolution", "bucket"),
+    )
 
 class AlertRule(Base):
     """告警规则模型"""
@@ -33,6 +94,10 @@ class AlertRule(Base):
     metric_name = Column(String, nullable=False)
     condition = Column(String, nullable=False)  # gt, lt, gte, lte, eq, neq
     threshold = Column(Float, nullable=False)
+    rule_type = Column(String(20), nullable=False, default="threshold", server_default="threshold")  # threshold, window_avg, consecutive, rate
+    window_seconds = Column(Integer)  # window_avg：时间窗口（秒）
+    consecutive_count = Column(Integer)  # consecutive：连续满足条件的采样数
+    hysteresis = Column(Float, nullable=False, default=0, server_default="0")  # 恢复滞回区间：值越过阈值该幅度后告警恢复
     severity = Column(String, nullable=False)  # critical, high, medium, low
     message = Column(String, nullable=False)  # 告警消息模板
     enabled = Column(Boolean, default=True)
@@ -51,19 +116,38 @@ class MonitoringAlert(Base):
     id = Column(String, primary_key=True, default=generate_id)
     device_id = Column(UUID(as_uuid=True), ForeignKey("devices.id"), nullable=False)
     rule_id = Column(String, ForeignKey("alert_rules.id"), nullable=False)
-    metrics_id = Column(String, ForeignKey("device_metrics.id"), nullable=False)
+    metrics_id = Column(String, nullable=True)  # 对应 device_metrics.id（分区表，无外键约束；legacy 存储模式）
+    telemetry_id = Column(BigInteger, nullable=True)  # 对应 device_telemetry.id（分区表，无外键约束；compact 存储模式）
+    metric_name = Column(String, nullable=True)  # 触发告警的指标名
     severity = Column(String, nullable=False)  # critical, high, medium, low
     message = Column(String, nullable=False)
     status = Column(String, nullable=False)  # active, acknowledged, resolved
+    occurrence_count = Column(Integer, nullable=False, default=1, server_default="1")  # 告警未恢复期间的触发次数
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_seen_at = Column(DateTime)  # 最近一次触发时间
     acknowledged_at = Column(DateTime)
     acknowledged_by = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=True)
     resolved_at = Column(DateTime)
     resolved_by = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=True)
 
+    __table_args__ = (
+        Index("ix_monitoring_alerts_status_severity_created_at", "status", "severity", "created_at"),
+        Index("ix_monitoring_alerts_device_id_created_at", "device_id", "created_at"),
+        Index("ix_monitoring_alerts_created_at", "created_at"),
+        Index("ix_monitoring_alerts_active_created_at", "severity", "created_at", postgresql_where=text("status = 'active'")),
+        Index("ix_monitoring_alerts_open_device_id_rule_id", "device_id", "rule_id", postgresql_where=text("status <> 'resolved'")),
+    )
+
     # 关联 - 改用 backref 以避免循环导入问题
     device = relationship("Device", backref="monitoring_alerts")
     rule = relationship("AlertRule", back_populates="alerts")
-    metrics = relationship("DeviceMetrics", back_populates="alerts")
+    metrics = relationship(
+        "DeviceMetrics", back_populates="alerts", viewonly=True,
+        primaryjoin="DeviceMetrics.id == foreign(MonitoringAlert.metrics_id)"
+    )
+    telemetry = relationship(
+        "DeviceTelemetry", viewonly=True,
+        primaryjoin="DeviceTelemetry.id == foreign(MonitoringAlert.telemetry_id)"
+    )
     acknowledger = relationship("User", foreign_keys=[acknowledged_by])
     resolver = relationship("User", foreign_keys=[resolved_by])
\ No newline at end of file
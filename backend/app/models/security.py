@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, String, JSON, DateTime, ForeignKey, Boolean, Integer
+from sqlalchemy import Column, String, JSON, DateTime, ForeignKey, Boolean, Integer, Index, text
 from sqlalchemy.dialects.postgresql import UUID, INET
 from sqlalchemy.orm import relationship
 import uuid
@@ -20,6 +20,12 @@ class SecurityEvent(Base):
     handled_at = Column(DateTime(timezone=True))
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
 
+    __table_args__ = (
+        Index("ix_security_events_severity_handled_created_at", "severity", "handled", "created_at"),
+        Index("ix_security_events_created_at", "created_at"),
+        Index("ix_security_events_unhandled_created_at", "created_at", postgresql_where=text("handled = false")),
+    )
+
     device = relationship("Device", backref="security_events")
     handler = relationship("User", backref="handled_events")
 
@@ -57,6 +63,11 @@ class SecurityAuditLog(Base):
     details = Column(JSON)
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
 
+    __table_args__ = (
+        Index("ix_security_audit_logs_log_type_created_at", "log_type", "created_at"),
+        Index("ix_security_audit_logs_created_at", "created_at"),
+    )
+
 class BlacklistedIP(Base):
     __tablename__ = "blacklisted_ips"
 
@@ -18,6 +18,12 @@ class AlertCondition(str, Enum):
     EQ = "eq"   # 等于
     NEQ = "neq" # 不等于
 
+class AlertRuleType(str, Enum):
+    THRESHOLD = "threshold"      # 单个采样与阈值比较
+    WINDOW_AVG = "window_avg"    # 时间窗口内平均值与阈值比较
+    CONSECUTIVE = "consecutive"  # 连续 N 个采样满足条件
+    RATE = "rate"                # 每分钟变化量与阈值比较
+
 class AlertSeverity(str, Enum):
     CRITICAL = "critical"
     HIGH = "high"
@@ -46,6 +52,13 @@ class DeviceMetrics(DeviceMetricsBase):
         from_attributes = True
 
 # 告警规则相关模式
+def check_rule_parameters(rule_type, window_seconds, consecutive_count) -> None:
+    """检查规则类型所需的参数（创建规则和更新后的完整规则使用同一检查），不满足时抛出 ValueError"""
+    if rule_type == AlertRuleType.WINDOW_AVG and not window_seconds:
+        raise ValueError("window_avg 规则必须设置 window_seconds")
+    if rule_type == AlertRuleType.CONSECUTIVE and not consecutive_count:
+        raise ValueError("consecutive 规则必须设置 consecutive_count")
+
 class AlertRuleBase(BaseModel):
     name: str
     description: Optional[str] = None
@@ -54,6 +67,10 @@ class AlertRuleBase(BaseModel):
     metric_name: str
     condition: AlertCondition
     threshold: float
+    rule_type: AlertRuleType = AlertRuleType.THRESHOLD
+    window_seconds: Optional[int] = Field(None, gt=0, le=86400, description="window_avg 规则的时间窗口（秒）")
+    consecutive_count: Optional[int] = Field(None, ge=1, le=1000, description="consecutive 规则需要连续满足条件的采样数")
+    hysteresis: float = Field(default=0, ge=0, description="恢复滞回区间：值越过阈值该幅度后告警恢复")
     severity: AlertSeverity
     message: str = Field(..., description="支持 {value} 和 {threshold} 占位符")
     enabled: bool = True
@@ -65,6 +82,16 @@ class AlertRuleBase(BaseModel):
             raise ValueError("消息模板必须包含 {value} 和 {threshold} 占位符")
         return v
 
+    @validator("window_seconds", always=True)
+    def validate_window_seconds(cls, v, values):
+        check_rule_parameters(values.get("rule_type"), v, True)
+        return v
+
+    @validator("consecutive_count", always=True)
+    def validate_consecutive_count(cls, v, values):
+        check_rule_parameters(values.get("rule_type"), True, v)
+        return v
+
 class AlertRuleCreate(AlertRuleBase):
     pass
 
@@ -73,6 +100,10 @@ class AlertRuleUpdate(BaseModel):
     description: Optional[str] = None
     condition: Optional[AlertCondition] = None
     threshold: Optional[float] = None
+    rule_type: Optional[AlertRuleType] = None
+    window_seconds: Optional[int] = Field(None, gt=0, le=86400)
+    consecutive_count: Optional[int] = Field(None, ge=1, le=1000)
+    hysteresis: Optional[float] = Field(None, ge=0)
     severity: Optional[AlertSeverity] = None
     message: Optional[str] = None
     enabled: Optional[bool] = None
@@ -84,6 +115,12 @@ class AlertRuleUpdate(BaseModel):
             raise ValueError("消息模板必须包含 {value} 和 {threshold} 占位符")
         return v
 
+    @validator("hysteresis")
+    def validate_hysteresis(cls, v):
+        if v is None:
+            raise ValueError("hysteresis 不能为空")
+        return v
+
 class AlertRule(AlertRuleBase):
     id: str
     created_at: datetime
@@ -96,14 +133,18 @@ class AlertRule(AlertRuleBase):
 class MonitoringAlertBase(BaseModel):
     device_id: UUID4
     rule_id: str
-    metrics_id: str
+    metrics_id: Optional[str] = None
+    telemetry_id: Optional[int] = None
+    metric_name: Optional[str] = None
     severity: AlertSeverity
     message: str
     status: AlertStatus
 
 class MonitoringAlert(MonitoringAlertBase):
     id: str
+    occurrence_count: int = 1
     created_at: datetime
+    last_seen_at: Optional[datetime] = None
     acknowledged_at: Optional[datetime] = None
     acknowledged_by: Optional[UUID4] = None
     resolved_at: Optional[datetime] = None
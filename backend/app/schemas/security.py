@@ -1,5 +1,5 @@
-from typing import Optional, Dict, Any, List
-from pydantic import BaseModel, UUID4, IPvAnyAddress
+from typing import Optional, Dict, Any, List, Union
+from pydantic import BaseModel, UUID4, IPvAnyAddress, IPvAnyNetwork
 from datetime import datetime
 
 class SecurityEventBase(BaseModel):
@@ -78,7 +78,7 @@ class SecurityAuditLog(SecurityAuditLogBase):
         from_attributes = True
 
 class BlacklistedIPBase(BaseModel):
-    ip_address: IPvAnyAddress
+    ip_address: Union[IPvAnyAddress, IPvAnyNetwork]  # 单个IP或CIDR网段
     reason: Optional[str] = None
     expiry_at: Optional[datetime] = None
 
@@ -0,0 +1,494 @@
+"""
+告警规则索引
+启用的告警规则按 (设备 | 全局, 指标名) 建立内存索引，条件预编译为比较函数；
+每个采样只检查可能匹配的规则，不读取数据库。告警规则增删改后重建索引；
+批量采样可按列（设备下标、指标编号、数值）用 NumPy 向量化评估
+
+窗口类规则（window_avg / consecutive / rate）依赖每个 (设备, 指标) 的内存状态，
+每个采样 O(1) 增量更新，不查询历史指标
+
+注意：索引只在当前进程内维护，部署时规则修改与指标写入需在同一进程
+"""
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from collections import deque
+from datetime import datetime
+import logging
+import operator
+import time
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from app.models.monitoring import AlertRule
+from app.core.config import settings
+from app.core.id import generate_id
+
+try:
+    import numpy as np
+except ImportError:  # 未安装numpy时只使用逐条评估
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# 告警条件 -> 比较运算（指标值 OP 阈值）
+CONDITION_OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "lt": operator.lt,
+    "lte": operator.le,
+    "eq": operator.eq,
+    "neq": operator.ne,
+}
+
+
+# 告警条件 -> 恢复判断（值回到阈值另一侧并超出滞回区间）
+RECOVERY_CHECKS: Dict[str, Callable[[float, float, float], bool]] = {
+    "gt": lambda value, threshold, band: value <= threshold - band,
+    "gte": lambda value, threshold, band: value < threshold - band,
+    "lt": lambda value, threshold, band: value >= threshold + band,
+    "lte": lambda value, threshold, band: value > threshold + band,
+    "eq": lambda value, threshold, band: abs(value - threshold) > band,
+    "neq": lambda value, threshold, band: value == threshold,
+}
+
+
+def compile_condition(condition: str, threshold: float) -> Optional[Callable[[Any], bool]]:
+    """将条件和阈值编译为比较函数，未知条件返回 None"""
+    op = CONDITION_OPERATORS.get(condition)
+    if op is None:
+        return None
+
+    def check(value: Any) -> bool:
+        if value is None:
+            return False
+        try:
+            return bool(op(value, threshold))
+        except TypeError:
+            return False
+
+    return check
+
+
+# 需要维护采样状态的规则类型
+STATEFUL_RULE_TYPES = ("window_avg", "consecutive", "rate")
+
+
+class AlertSample(NamedTuple):
+    """待评估的采样（timestamp 为 Unix 时间戳，为空时取评估时间）"""
+    device_id: Any
+    metric_name: str
+    value: Any
+    timestamp: Optional[float] = None
+
+
+class CompiledRule(NamedTuple):
+    """预编译的告警规则（与ORM对象解耦，可跨会话使用）"""
+    id: str
+    device_id: Any
+    metric_name: str
+    condition: str
+    threshold: float
+    severity: str
+    message: str
+    priority: int
+    check: Callable[[Any], bool]
+    rule_type: str = "threshold"
+    window_seconds: Optional[int] = None
+    consecutive_count: Optional[int] = None
+    hysteresis: float = 0.0
+
+    def format_message(self, value: Any) -> str:
+        return self.message.format(value=value, threshold=self.threshold)
+
+    def recovered(self, value: Any) -> bool:
+        """值是否已恢复（越过阈值并超出滞回区间）"""
+        check = RECOVERY_CHECKS.get(self.condition)
+        if check is None or value is None or isinstance(value, bool):
+            return False
+        try:
+            return bool(check(value, self.threshold, self.hysteresis))
+        except TypeError:
+            return False
+
+
+def build_alert_row(
+    rule: CompiledRule, device_id, value: Any, source: Dict[str, Any], now: datetime
+) -> Dict[str, Any]:
+    """
+    生成告警记录（用于批量INSERT）
+
+    Args:
+        source: 触发告警的指标行引用，legacy 模式为 {"metrics_id": ...}，compact 模式为 {"telemetry_id": ...}
+    """
+    return {
+        "id": generate_id(),
+        "device_id": device_id,
+        "rule_id": rule.id,
+        "severity": rule.severity,
+        "message": rule.format_message(value),
+        "metrics_id": None,
+        "telemetry_id": None,
+        "metric_name": rule.metric_name,
+        **source,
+        "status": "active",
+        "occurrence_count": 1,
+        "created_at": now,
+        "last_seen_at": now,
+    }
+
+
+class SlidingWindow:
+    """时间窗口内的采样（环形缓冲区 + 累计和），求平均值为 O(1)"""
+
+    __slots__ = ("seconds", "samples", "total")
+
+    def __init__(self, seconds: float, max_samples: int):
+        self.seconds = seconds
+        self.samples: "deque[Tuple[float, float]]" = deque(maxlen=max_samples)
+        self.total = 0.0
+
+    def add(self, ts: float, value: float) -> float:
+        """加入采样并返回窗口内平均值"""
+        samples = self.samples
+        if len(samples) == samples.maxlen:
+            self.total -= samples[0][1]
+        samples.append((ts, value))
+        self.total += value
+        cutoff = ts - self.seconds
+        while samples[0][0] <= cutoff:
+            self.total -= samples.popleft()[1]
+        return self.total / len(samples)
+
+
+class MetricState:
+    """单个 (设备, 指标) 的窗口类规则状态"""
+
+    __slots__ = ("windows", "streaks", "last", "values")
+
+    def __init__(self):
+        # 窗口长度 -> 滑动窗口（相同窗口长度的规则共用）
+        self.windows: Dict[int, SlidingWindow] = {}
+        # 规则ID -> 连续满足条件的采样数
+        self.streaks: Dict[str, int] = {}
+        # 上一个采样 (时间, 值)，用于计算变化率
+        self.last: Optional[Tuple[float, float]] = None
+        # 规则ID -> 最近一次用于比较的值（判断告警恢复）
+        self.values: Dict[str, float] = {}
+
+    def observe(self, ts: float, value: float, rules: List[CompiledRule], max_samples: int) -> List[Tuple[CompiledRule, Any]]:
+        """用新采样更新状态，返回触发的 (规则, 用于比较的值)"""
+        triggered = []
+        averages: Dict[int, float] = {}
+        rate = None
+        if self.last is not None and ts > self.last[0]:
+            rate = (value - self.last[1]) / (ts - self.last[0]) * 60
+
+        for rule in rules:
+            if rule.rule_type == "window_avg":
+                average = averages.get(rule.window_seconds)
+                if average is None:
+                    window = self.windows.get(rule.window_seconds)
+                    if window is None:
+                        window = self.windows[rule.window_seconds] = SlidingWindow(rule.window_seconds, max_samples)
+                    average = averages[rule.window_seconds] = window.add(ts, value)
+                self.values[rule.id] = average
+                if rule.check(average):
+                    triggered.append((rule, average))
+            elif rule.rule_type == "consecutive":
+                streak = self.streaks.get(rule.id, 0) + 1 if rule.check(value) else 0
+                self.streaks[rule.id] = streak
+                self.values[rule.id] = value
+                if streak >= rule.consecutive_count:
+                    triggered.append((rule, value))
+            elif rule.rule_type == "rate":
+                if rate is not None:
+                    self.values[rule.id] = rate
+                    if rule.check(rate):
+                        triggered.append((rule, rate))
+
+        # 同一时间戳的多个采样（同一批次）不更新变化率基准
+        if self.last is None or ts > self.last[0]:
+            self.last = (ts, value)
+        return triggered
+
+
+class AlertRuleIndex:
+    """告警规则内存索引"""
+
+    def __init__(self):
+        # (device_id 或 None, metric_name) -> 按优先级降序排列的阈值规则
+        self._rules: Dict[Tuple[Any, str], List[CompiledRule]] = {}
+        # 窗口类规则，索引结构相同
+        self._stateful: Dict[Tuple[Any, str], List[CompiledRule]] = {}
+        # (device_id, metric_name) -> 窗口类规则状态
+        self._states: Dict[Tuple[Any, str], MetricState] = {}
+        # 规则ID -> 规则
+        self._by_id: Dict[str, CompiledRule] = {}
+        # 向量化评估使用的列式规则表：指标名 -> 指标编号，指标编号 -> (规则列表, 规则设备, 条件分组)
+        self._metric_ids: Dict[str, int] = {}
+        self._vector_rules: Dict[int, Tuple[List[CompiledRule], List[Any], Dict[str, Tuple[Any, Any]]]] = {}
+        self.loaded = False
+        self.rule_count = 0
+        self.rebuilds = 0
+        self.evaluations = 0
+        self.matches = 0
+
+    def build(self, rules: Iterable[AlertRule]) -> None:
+        """根据规则列表重建索引（只包含启用且条件有效的规则）"""
+        index: Dict[Tuple[Any, str], List[CompiledRule]] = {}
+        stateful: Dict[Tuple[Any, str], List[CompiledRule]] = {}
+        count = 0
+        for rule in rules:
+            if not rule.enabled:
+                continue
+            rule_type = getattr(rule, "rule_type", None) or "threshold"
+            if rule_type != "threshold" and rule_type not in STATEFUL_RULE_TYPES:
+                logger.warning(f"Alert rule {rule.id} has unknown rule type {rule_type!r}, skipped")
+                continue
+            if (rule_type == "window_avg" and not rule.window_seconds) or \
+                    (rule_type == "consecutive" and not rule.consecutive_count):
+                logger.warning(f"Alert rule {rule.id} ({rule_type}) is missing its window parameter, skipped")
+                continue
+            check = compile_condition(rule.condition, rule.threshold)
+            if check is None:
+                logger.warning(f"Alert rule {rule.id} has unknown condition {rule.condition!r}, skipped")
+                continue
+            compiled = CompiledRule(
+                id=rule.id,
+                device_id=rule.device_id,
+                metric_name=rule.metric_name,
+                condition=rule.condition,
+                threshold=rule.threshold,
+                severity=rule.severity,
+                message=rule.message,
+                priority=rule.priority or 0,
+                check=check,
+                rule_type=rule_type,
+                window_seconds=getattr(rule, "window_seconds", None),
+                consecutive_count=getattr(rule, "consecutive_count", None),
+                hysteresis=getattr(rule, "hysteresis", None) or 0.0,
+            )
+            target = index if rule_type == "threshold" else stateful
+            target.setdefault((rule.device_id, rule.metric_name), []).append(compiled)
+            count += 1
+        for compiled_rules in list(index.values()) + list(stateful.values()):
+            compiled_rules.sort(key=lambda r: r.priority, reverse=True)
+        # 整体替换，评估过程中不会看到构建到一半的索引
+        self._rules = index
+        self._stateful = stateful
+        self._by_id = {
+            compiled.id: compiled
+            for compiled_rules in list(index.values()) + list(stateful.values())
+            for compiled in compiled_rules
+        }
+        # 已有窗口状态继续使用；不再有窗口类规则的指标丢弃状态
+        stateful_metrics = {metric_name for _, metric_name in stateful}
+        self._states = {key: state for key, state in self._states.items() if key[1] in stateful_metrics}
+        self._build_vector_rules(index)
+        self.rule_count = count
+        self.loaded = True
+        self.rebuilds += 1
+
+    async def reload(self, db: AsyncSession) -> None:
+        """从数据库加载启用的规则并重建索引"""
+        result = await db.execute(select(AlertRule).filter(AlertRule.enabled == True))  # noqa: E712
+        self.build(result.scalars().all())
+        logger.info(f"Alert rule index rebuilt with {self.rule_count} rule(s)")
+
+    async def ensure_loaded(self, db: AsyncSession) -> None:
+        if not self.loaded:
+            await self.reload(db)
+
+    @staticmethod
+    def _lookup(index: Dict[Tuple[Any, str], List[CompiledRule]], device_id, metric_name: str) -> List[CompiledRule]:
+        device_rules = index.get((device_id, metric_name))
+        global_rules = index.get((None, metric_name))
+        if device_rules and global_rules:
+            return device_rules + global_rules
+        return device_rules or global_rules or []
+
+    def get_rule(self, rule_id: str) -> Optional[CompiledRule]:
+        return self._by_id.get(rule_id)
+
+    def compared_value(self, rule: CompiledRule, sample: "AlertSample") -> Any:
+        """规则最近一次用于比较的值：阈值规则为采样值，窗口类规则取窗口状态"""
+        if rule.rule_type == "threshold":
+            return sample.value
+        state = self._states.get((sample.device_id, sample.metric_name))
+        return state.values.get(rule.id) if state else None
+
+    def rules_for(self, device_id, metric_name: str) -> List[CompiledRule]:
+        """可能匹配该设备指标的阈值规则（设备专属规则 + 全局规则）"""
+        return self._lookup(self._rules, device_id, metric_name)
+
+    def evaluate(self, device_id, metric_name: str, value: Any, ts: Optional[float] = None) -> List[Tuple[CompiledRule, Any]]:
+        """返回被该采样触发的 (规则, 用于比较的值)"""
+        triggered = []
+        rules = self.rules_for(device_id, metric_name)
+        if rules:
+            self.evaluations += len(rules)
+            triggered = [(rule, value) for rule in rules if rule.check(value)]
+            self.matches += len(triggered)
+        if self._stateful:
+            triggered.extend(self._evaluate_stateful(device_id, metric_name, value, ts))
+        return triggered
+
+    def _evaluate_stateful(self, device_id, metric_name: str, value: Any, ts: Optional[float]) -> List[Tuple[CompiledRule, Any]]:
+        """更新 (设备, 指标) 的窗口状态并评估窗口类规则"""
+        rules = self._lookup(self._stateful, device_id, metric_name)
+        if not rules or isinstance(value, bool) or not isinstance(value, (int, float)):
+            return []
+        key = (device_id, metric_name)
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = MetricState()
+        self.evaluations += len(rules)
+        triggered = state.observe(
+            time.time() if ts is None else ts, float(value), rules, settings.ALERT_WINDOW_MAX_SAMPLES
+        )
+        self.matches += len(triggered)
+        return triggered
+
+    def _build_vector_rules(self, index: Dict[Tuple[Any, str], List[CompiledRule]]) -> None:
+        """按指标整理规则，每个指标下按条件分组保存 (规则下标数组, 阈值数组)"""
+        if np is None:
+            return
+        by_metric: Dict[str, List[CompiledRule]] = {}
+        for (_, metric_name), compiled_rules in index.items():
+            by_metric.setdefault(metric_name, []).extend(compiled_rules)
+        metric_ids = {}
+        vector_rules = {}
+        for metric_id, (metric_name, rules) in enumerate(by_metric.items()):
+            metric_ids[metric_name] = metric_id
+            groups = {}
+            for condition in CONDITION_OPERATORS:
+                positions = [i for i, rule in enumerate(rules) if rule.condition == condition]
+                if positions:
+                    groups[condition] = (
+                        np.array(positions, dtype=np.int64),
+                        np.array([rules[i].threshold for i in positions], dtype=np.float64),
+                    )
+            vector_rules[metric_id] = (rules, [rule.device_id for rule in rules], groups)
+        self._metric_ids = metric_ids
+        self._vector_rules = vector_rules
+
+    def metric_id(self, metric_name: str) -> int:
+        """指标名对应的编号，没有规则的指标返回 -1"""
+        return self._metric_ids.get(metric_name, -1)
+
+    def evaluate_columns(self, devices: List[Any], device_idx, metric_ids, values) -> List[Tuple[int, CompiledRule]]:
+        """
+        向量化评估一批采样
+
+        Args:
+            devices: 批次中的设备主键列表
+            device_idx: 每个采样的设备下标（对应 devices）
+            metric_ids: 每个采样的指标编号（metric_id() 的返回值）
+            values: 每个采样的数值
+
+        Returns:
+            触发的 (采样下标, 规则) 列表
+        """
+        device_idx = np.asarray(device_idx, dtype=np.int64)
+        metric_ids = np.asarray(metric_ids, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        device_positions = {device_id: i for i, device_id in enumerate(devices)}
+        pairs: List[Tuple[int, CompiledRule]] = []
+
+        for metric_id in np.unique(metric_ids):
+            entry = self._vector_rules.get(int(metric_id))
+            if entry is None:
+                continue
+            rules, rule_devices, groups = entry
+            sample_idx = np.flatnonzero(metric_ids == metric_id)
+            sample_values = values[sample_idx][:, None]
+            # 规则所属设备在本批次中的下标：全局规则为 -1，不在本批次中的设备为 -2
+            rule_device_idx = np.array(
+                [-1 if device is None else device_positions.get(device, -2) for device in rule_devices],
+                dtype=np.int64
+            )
+            sample_devices = device_idx[sample_idx][:, None]
+            self.evaluations += len(sample_idx) * len(rules)
+
+            for condition, (positions, thresholds) in groups.items():
+                rule_dev = rule_device_idx[positions][None, :]
+                # operator 中的比较函数同样适用于 NumPy 数组，语义与逐条评估一致
+                hit = CONDITION_OPERATORS[condition](sample_values, thresholds[None, :])
+                hit &= (rule_dev == -1) | (rule_dev == sample_devices)
+                rows, cols = np.nonzero(hit)
+                for row, col in zip(rows.tolist(), cols.tolist()):
+                    pairs.append((int(sample_idx[row]), rules[positions[col]]))
+
+        self.matches += len(pairs)
+        # 与逐条评估保持相同顺序：按采样下标，同一采样内按规则优先级
+        pairs.sort(key=lambda pair: (pair[0], -pair[1].priority))
+        return pairs
+
+    def evaluate_samples(self, samples: List[AlertSample]) -> List[Tuple[int, CompiledRule, Any]]:
+        """
+        评估一批采样，返回触发的 (采样下标, 规则, 用于比较的值)
+        批次足够大且安装了numpy时阈值规则使用向量化评估，非数值采样始终逐条评估；
+        窗口类规则按采样顺序逐条更新状态
+        """
+        if not samples or not (self._rules or self._stateful):
+            return []
+        min_batch = settings.ALERT_VECTORIZE_MIN_BATCH
+        if np is None or min_batch <= 0 or len(samples) < min_batch or not self._rules:
+            return [
+                (i, rule, value)
+                for i, sample in enumerate(samples)
+                for rule, value in self.evaluate(sample.device_id, sample.metric_name, sample.value, sample.timestamp)
+            ]
+
+        devices: List[Any] = []
+        device_positions: Dict[Any, int] = {}
+        numeric: List[int] = []
+        device_idx: List[int] = []
+        metric_ids: List[int] = []
+        values: List[float] = []
+        pairs: List[Tuple[int, CompiledRule, Any]] = []
+        for i, sample in enumerate(samples):
+            if self._stateful:
+                pairs.extend(
+                    (i, rule, value)
+                    for rule, value in self._evaluate_stateful(sample.device_id, sample.metric_name, sample.value, sample.timestamp)
+                )
+            metric_id = self._metric_ids.get(sample.metric_name)
+            if metric_id is None:
+                continue
+            value = sample.value
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                pairs.extend(
+                    (i, rule, value) for rule in self.rules_for(sample.device_id, sample.metric_name) if rule.check(value)
+                )
+                continue
+            position = device_positions.get(sample.device_id)
+            if position is None:
+                position = device_positions[sample.device_id] = len(devices)
+                devices.append(sample.device_id)
+            numeric.append(i)
+            device_idx.append(position)
+            metric_ids.append(metric_id)
+            values.append(value)
+
+        if numeric:
+            pairs.extend(
+                (numeric[row], rule, samples[numeric[row]].value)
+                for row, rule in self.evaluate_columns(devices, device_idx, metric_ids, values)
+            )
+            pairs.sort(key=lambda pair: (pair[0], -pair[1].priority))
+        return pairs
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loaded": self.loaded,
+            "rules": self.rule_count,
+            "keys": len(self._rules) + len(self._stateful),
+            "window_states": len(self._states),
+            "rebuilds": self.rebuilds,
+            "evaluations": self.evaluations,
+            "matches": self.matches,
+            "vectorized": np is not None and settings.ALERT_VECTORIZE_MIN_BATCH > 0,
+        }
+
+
+# 全局告警规则索引
+alert_rule_index = AlertRuleIndex()
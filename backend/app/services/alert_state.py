@@ -0,0 +1,350 @@
+"""
+告警状态跟踪
+每个 (设备, 规则) 最多保持一条未恢复的告警：条件持续满足时只在内存中累加发生次数和最近触发时间，
+由后台任务周期性批量写库；值越过阈值并超出规则的滞回区间后告警自动恢复
+
+注意：状态只在评估告警的进程内维护，与 presence_tracker 相同，部署时只能有一个进程负责MQTT接入
+"""
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from datetime import datetime
+import logging
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, insert, text
+from app.models.monitoring import AlertRule, MonitoringAlert
+from app.services.alert_engine import AlertRuleIndex, AlertSample, CompiledRule, alert_rule_index, build_alert_row
+
+logger = logging.getLogger(__name__)
+
+
+class OpenAlert:
+    """未恢复的告警"""
+
+    __slots__ = ("id", "device_id", "rule_id", "metric_name", "pending", "last_seen", "persisted")
+
+    def __init__(
+        self, alert_id: str, device_id, rule_id: str, metric_name: str,
+        last_seen: Optional[datetime] = None, persisted: bool = True
+    ):
+        self.id = alert_id
+        self.device_id = device_id
+        self.rule_id = rule_id
+        self.metric_name = metric_name
+        # 尚未写入数据库的发生次数
+        self.pending = 0
+        self.last_seen = last_seen
+        # 告警行已提交；新建告警在所属批次提交前不能被 flush 更新
+        self.persisted = persisted
+
+
+class AlertBatch:
+    """一批采样产生的告警变化，由 persist 在调用方事务中写库"""
+
+    __slots__ = ("rows", "resolved", "touched", "now")
+
+    def __init__(self, now: datetime):
+        self.now = now
+        # 新告警 ID -> 待插入的行
+        self.rows: Dict[str, Dict[str, Any]] = {}
+        # 本批次恢复的已入库告警 (告警, 发生次数增量)
+        self.resolved: List[Tuple[OpenAlert, int]] = []
+        # 本批次累加了发生次数的已有告警 ID -> (告警, 本批次增量)，批次提交后才标记为待刷新
+        self.touched: Dict[str, Tuple[OpenAlert, int]] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.rows or self.resolved or self.touched)
+
+
+class AlertStateTracker:
+    """告警状态跟踪（进程内）"""
+
+    def __init__(self, rule_index: AlertRuleIndex):
+        self.rule_index = rule_index
+        self.loaded = False
+        # (device_id, rule_id) -> 未恢复的告警
+        self._open: Dict[Tuple[Any, str], OpenAlert] = {}
+        # (device_id, metric_name) -> {rule_id: 告警}，用于按采样检查恢复
+        self._by_metric: Dict[Tuple[Any, str], Dict[str, OpenAlert]] = {}
+        # 有待写入发生次数的已入库告警
+        self._dirty: Dict[str, OpenAlert] = {}
+        # 计数器
+        self.created = 0
+        self.coalesced = 0
+        self.resolved = 0
+        self.flushed_rows = 0
+
+    async def load(self, db: AsyncSession) -> None:
+        """
+        从数据库同步全部未恢复的告警（启动时、规则变更后调用；单条告警被修改后使用 sync_alert）
+        - 规则已删除或停用的告警在数据库中标记为恢复，不再跟踪
+        - 已在数据库中恢复或删除的告警不再跟踪
+        - 仍在跟踪的告警保留尚未写入的发生次数；所属批次尚未提交的新告警保持不变
+        同一 (设备, 规则) 有多条未恢复告警时只跟踪最新的一条
+        """
+        result = await db.execute(
+            select(MonitoringAlert.id, MonitoringAlert.device_id, MonitoringAlert.rule_id, AlertRule.metric_name,
+                   MonitoringAlert.last_seen_at)
+            .join(AlertRule, AlertRule.id == MonitoringAlert.rule_id)
+            .filter(MonitoringAlert.status != "resolved")
+            .order_by(MonitoringAlert.created_at)
+        )
+        latest: Dict[Tuple[Any, str], OpenAlert] = {}
+        for alert_id, device_id, rule_id, metric_name, last_seen_at in result.all():
+            latest[(device_id, rule_id)] = OpenAlert(alert_id, device_id, rule_id, metric_name, last_seen_at)
+
+        check_rules = self.rule_index.loaded
+        open_ids = set()
+        orphaned: Dict[str, Tuple[OpenAlert, int]] = {}
+        for key, loaded in latest.items():
+            current = self._open.get(key)
+            alert = current if current is not None and current.id == loaded.id else loaded
+            if check_rules and self.rule_index.get_rule(loaded.rule_id) is None:
+                orphaned[alert.id] = (alert, alert.pending)
+                continue
+            open_ids.add(alert.id)
+            if current is None or (current.persisted and current is not alert):
+                self._track(alert)
+
+        if orphaned:
+            await db.execute(
+                text(
+                    "UPDATE monitoring_alerts AS a SET status = 'resolved', resolved_at = :now, "
+                    "occurrence_count = a.occurrence_count + v.n, last_seen_at = COALESCE(v.seen, a.last_seen_at) "
+                    "FROM unnest(CAST(:ids AS varchar[]), CAST(:n AS integer[]), CAST(:seen AS timestamp[])) "
+                    "AS v(id, n, seen) WHERE a.id = v.id AND a.status <> 'resolved'"
+                ),
+                {
+                    "now": datetime.utcnow(),
+                    "ids": list(orphaned),
+                    "n": [n for _, n in orphaned.values()],
+                    "seen": [alert.last_seen for alert, _ in orphaned.values()],
+                }
+            )
+            await db.commit()
+            self.resolved += len(orphaned)
+            logger.info(f"Resolved {len(orphaned)} open alert(s) whose rule was removed or disabled")
+
+        # 已入库但不再是未恢复状态（或规则已失效）的告警停止跟踪
+        for alert in list(self._open.values()):
+            if alert.persisted and alert.id not in open_ids:
+                self._untrack(alert)
+                self._dirty.pop(alert.id, None)
+                alert.pending = 0
+        self.loaded = True
+        logger.info(f"Alert state tracker synced {len(self._open)} open alert(s)")
+
+    async def ensure_loaded(self, db: AsyncSession) -> None:
+        if not self.loaded:
+            await self.load(db)
+
+    def sync_alert(self, alert: MonitoringAlert) -> None:
+        """
+        按单条告警的数据库状态更新跟踪（接口修改了单条告警后调用，O(1)，不重新加载全部告警）
+        - 已恢复的告警停止跟踪，丢弃尚未写入的发生次数
+        - 未恢复且该 (设备, 规则) 没有在跟踪的告警开始跟踪（规则已删除或停用时除外）
+        """
+        if not self.loaded:
+            return
+        key = (alert.device_id, alert.rule_id)
+        current = self._open.get(key)
+        if alert.status == "resolved":
+            if current is not None and current.id == alert.id and current.persisted:
+                self._untrack(current)
+                self._dirty.pop(current.id, None)
+                current.pending = 0
+            return
+        if current is not None:
+            return
+        rule = self.rule_index.get_rule(alert.rule_id)
+        if rule is None:
+            return
+        self._track(OpenAlert(alert.id, alert.device_id, alert.rule_id, rule.metric_name, alert.last_seen_at))
+
+    def _track(self, alert: OpenAlert) -> None:
+        previous = self._open.get((alert.device_id, alert.rule_id))
+        if previous is not None:
+            self._untrack(previous)
+        self._open[(alert.device_id, alert.rule_id)] = alert
+        self._by_metric.setdefault((alert.device_id, alert.metric_name), {})[alert.rule_id] = alert
+
+    def _untrack(self, alert: OpenAlert) -> None:
+        self._open.pop((alert.device_id, alert.rule_id), None)
+        alerts = self._by_metric.get((alert.device_id, alert.metric_name))
+        if alerts is not None:
+            alerts.pop(alert.rule_id, None)
+            if not alerts:
+                del self._by_metric[(alert.device_id, alert.metric_name)]
+
+    def apply(
+        self,
+        samples: Sequence[AlertSample],
+        triggered: Sequence[Tuple[int, CompiledRule, Any]],
+        source: Callable[[int], Dict[str, Any]],
+        now: datetime,
+    ) -> AlertBatch:
+        """
+        按采样顺序处理评估结果
+        - 没有未恢复告警的 (设备, 规则) 新建告警
+        - 已有未恢复告警的只累加发生次数和最近触发时间
+        - 采样未触发且值已越过滞回区间的告警标记为恢复
+
+        Args:
+            samples: 本批次采样
+            triggered: 规则索引返回的 (采样下标, 规则, 用于比较的值)
+            source: 采样下标 -> 新告警引用的指标行（见 build_alert_row）
+            now: 本批次时间
+        """
+        batch = AlertBatch(now)
+        fired: Dict[int, Dict[str, Tuple[CompiledRule, Any]]] = {}
+        for sample_index, rule, value in triggered:
+            fired.setdefault(sample_index, {})[rule.id] = (rule, value)
+
+        touched: Dict[str, Tuple[OpenAlert, int]] = {}
+        for i, sample in enumerate(samples):
+            sample_fired = fired.get(i)
+            open_alerts = self._by_metric.get((sample.device_id, sample.metric_name))
+            if open_alerts:
+                for alert in list(open_alerts.values()):
+                    if sample_fired and alert.rule_id in sample_fired:
+                        continue
+                    if not alert.persisted:
+                        # 新建告警所属批次尚未提交，等待后续采样再判断恢复
+                        continue
+                    rule = self.rule_index.get_rule(alert.rule_id)
+                    if rule is None or not rule.recovered(self.rule_index.compared_value(rule, sample)):
+                        continue
+                    self._resolve(alert, batch)
+            if not sample_fired:
+                continue
+            for rule, value in sample_fired.values():
+                alert = self._open.get((sample.device_id, rule.id))
+                if alert is None:
+                    row = build_alert_row(rule, sample.device_id, value, source(i), now)
+                    alert = OpenAlert(row["id"], sample.device_id, rule.id, sample.metric_name, now, persisted=False)
+                    batch.rows[alert.id] = row
+                    self._track(alert)
+                    self.created += 1
+                    continue
+                alert.pending += 1
+                alert.last_seen = now
+                previous = touched.get(alert.id)
+                touched[alert.id] = (alert, previous[1] + 1 if previous else 1)
+                self.coalesced += 1
+
+        for alert_id, (alert, n) in touched.items():
+            row = batch.rows.get(alert_id)
+            if row is not None:
+                # 本批次新建的告警，发生次数随INSERT写入
+                row["occurrence_count"] += alert.pending
+                row["last_seen_at"] = alert.last_seen
+                alert.pending = 0
+            elif self._open.get((alert.device_id, alert.rule_id)) is alert:
+                # 仍未恢复的已有告警在批次提交后才标记为待刷新（本批次内恢复的告警，发生次数随恢复一起写入）
+                batch.touched[alert_id] = (alert, n)
+        return batch
+
+    def _resolve(self, alert: OpenAlert, batch: AlertBatch) -> None:
+        self._untrack(alert)
+        self.resolved += 1
+        row = batch.rows.get(alert.id)
+        if row is not None:
+            row["status"] = "resolved"
+            row["resolved_at"] = batch.now
+            return
+        self._dirty.pop(alert.id, None)
+        batch.resolved.append((alert, alert.pending))
+        alert.pending = 0
+
+    async def persist(self, db: AsyncSession, batch: AlertBatch) -> None:
+        """在调用方事务中写入新告警和恢复的告警（不提交）"""
+        if batch.rows:
+            await db.execute(insert(MonitoringAlert), list(batch.rows.values()))
+        if batch.resolved:
+            await db.execute(
+                text(
+                    "UPDATE monitoring_alerts AS a SET status = 'resolved', resolved_at = :now, "
+                    "occurrence_count = a.occurrence_count + v.n, last_seen_at = COALESCE(v.seen, a.last_seen_at) "
+                    "FROM unnest(CAST(:ids AS varchar[]), CAST(:n AS integer[]), CAST(:seen AS timestamp[])) "
+                    "AS v(id, n, seen) WHERE a.id = v.id AND a.status <> 'resolved'"
+                ),
+                {
+                    "now": batch.now,
+                    "ids": [alert.id for alert, _ in batch.resolved],
+                    "n": [n for _, n in batch.resolved],
+                    "seen": [alert.last_seen for alert, _ in batch.resolved],
+                }
+            )
+
+    def commit(self, batch: AlertBatch) -> None:
+        """批次已提交：新建的告警可以被刷新，累加了发生次数的告警标记为待刷新"""
+        for alert_id, row in batch.rows.items():
+            alert = self._open.get((row["device_id"], row["rule_id"]))
+            if alert is not None and alert.id == alert_id:
+                alert.persisted = True
+                if alert.pending:
+                    # 批次提交前由其他批次累加的发生次数
+                    self._dirty[alert_id] = alert
+        for alert_id, (alert, _) in batch.touched.items():
+            if self._open.get((alert.device_id, alert.rule_id)) is alert and alert.persisted:
+                self._dirty[alert_id] = alert
+
+    def discard(self, batch: AlertBatch) -> None:
+        """事务失败：撤销本批次新建的告警和累加的发生次数，恢复的告警重新视为未恢复"""
+        for alert, n in batch.touched.values():
+            alert.pending = max(0, alert.pending - n)
+        for alert_id, row in batch.rows.items():
+            alert = self._open.get((row["device_id"], row["rule_id"]))
+            if alert is not None and alert.id == alert_id:
+                self._untrack(alert)
+        for alert, n in batch.resolved:
+            if (alert.device_id, alert.rule_id) in self._open:
+                continue
+            alert.pending += n
+            self._track(alert)
+            if alert.pending:
+                self._dirty[alert.id] = alert
+
+    async def flush(self, db: AsyncSession) -> int:
+        """将累积的发生次数和最近触发时间用一条UPDATE批量写入数据库"""
+        if not self._dirty:
+            return 0
+        pending, self._dirty = self._dirty, {}
+        alerts = [(alert, alert.pending) for alert in pending.values()]
+        for alert, _ in alerts:
+            alert.pending = 0
+        try:
+            await db.execute(
+                text(
+                    "UPDATE monitoring_alerts AS a SET occurrence_count = a.occurrence_count + v.n, last_seen_at = v.seen "
+                    "FROM unnest(CAST(:ids AS varchar[]), CAST(:n AS integer[]), CAST(:seen AS timestamp[])) "
+                    "AS v(id, n, seen) WHERE a.id = v.id"
+                ),
+                {
+                    "ids": [alert.id for alert, _ in alerts],
+                    "n": [n for _, n in alerts],
+                    "seen": [alert.last_seen for alert, _ in alerts],
+                }
+            )
+            await db.commit()
+        except Exception:
+            # 写入失败，放回待刷新队列
+            for alert, n in alerts:
+                alert.pending += n
+                self._dirty.setdefault(alert.id, alert)
+            raise
+        self.flushed_rows += len(alerts)
+        return len(alerts)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loaded": self.loaded,
+            "open": len(self._open),
+            "pending": len(self._dirty),
+            "created": self.created,
+            "coalesced": self.coalesced,
+            "resolved": self.resolved,
+            "flushed_rows": self.flushed_rows,
+        }
+
+
+# 全局告警状态跟踪实例
+alert_state_tracker = AlertStateTracker(alert_rule_index)
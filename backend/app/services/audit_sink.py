@@ -0,0 +1,216 @@
+"""
+审计日志/安全事件批量写入
+记录先放入进程内有界队列，由后台任务每隔 AUDIT_FLUSH_INTERVAL_MS 毫秒（或攒满一批时）用多行INSERT写入，
+请求本身不再等待 add/commit/refresh；关键记录可以同步写入，应用关闭时清空队列
+"""
+from typing import Any, Dict, List, Tuple, Type
+from collections import deque
+import asyncio
+import json
+import logging
+from sqlalchemy import insert
+from sqlalchemy.exc import InterfaceError, OperationalError
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, Base
+
+logger = logging.getLogger(__name__)
+
+
+class PendingRecord:
+    """队列中的一条待写入记录"""
+    __slots__ = ("model", "row", "attempts")
+
+    def __init__(self, model: Type[Base], row: Dict[str, Any]):
+        self.model = model
+        self.row = row
+        # 单独写入失败的次数
+        self.attempts = 0
+
+
+def is_transient_error(error: Exception) -> bool:
+    """数据库连接类错误（与记录内容无关），记录保留重试，不计入失败次数"""
+    return isinstance(error, (OperationalError, InterfaceError, OSError, asyncio.TimeoutError))
+
+
+def has_foreign_keys(model: Type[Base], row: Dict[str, Any]) -> bool:
+    """记录是否引用了其他表的行（外键列非空），此类记录可能因引用不存在而写入失败"""
+    return any(row.get(column.name) is not None for column in model.__table__.columns if column.foreign_keys)
+
+
+class AuditSink:
+    """审计记录写入队列（进程内）"""
+
+    def __init__(self, maxsize: int = 10000, batch_size: int = 500, max_attempts: int = 3):
+        self.maxsize = max(1, maxsize)
+        self.batch_size = max(1, batch_size)
+        self.max_attempts = max(1, max_attempts)
+        self._queue: "deque[PendingRecord]" = deque()
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        # 后台写入任务运行中；未运行时（如脚本中使用服务层）记录直接写入
+        self.running = False
+        # 计数器
+        self.queued = 0
+        self.written = 0
+        self.batches = 0
+        self.sync_writes = 0
+        self.backpressure = 0
+        self.failures = 0
+        self.dead_lettered = 0
+        self.peak_depth = 0
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    async def submit(self, model: Type[Base], row: Dict[str, Any], sync: bool = False) -> None:
+        """
+        提交一条记录
+
+        Args:
+            model: SecurityAuditLog 或 SecurityEvent
+            row: 完整的列值（包括 id 和 created_at）
+            sync: 立即写入并等待提交，失败时抛出异常；引用其他表（外键列非空）的记录总是立即写入，
+                  由提交方得到写入失败的结果
+        """
+        if sync or not self.running or has_foreign_keys(model, row):
+            await self._write_now(model, row)
+            return
+        if len(self._queue) >= self.maxsize:
+            # 队列已满：由提交方先写出积压的记录，不丢弃审计记录
+            self.backpressure += 1
+            await self.flush()
+            if len(self._queue) >= self.maxsize:
+                # 仍无法写出（如数据库不可用）：本条记录直接写入，失败时只影响本次提交
+                await self._write_now(model, row)
+                return
+        self._queue.append(PendingRecord(model, row))
+        self.queued += 1
+        depth = len(self._queue)
+        if depth > self.peak_depth:
+            self.peak_depth = depth
+        if depth >= self.batch_size:
+            self._wakeup.set()
+
+    async def _write_now(self, model: Type[Base], row: Dict[str, Any]) -> None:
+        async with self._lock:
+            await self._write([PendingRecord(model, row)])
+        self.sync_writes += 1
+
+    async def wait(self, timeout: float) -> None:
+        """等待攒满一批或超时"""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def flush(self) -> int:
+        """
+        按批写出队列中的全部记录，返回写入条数
+        整批写入失败时逐条重试：单条记录失败 max_attempts 次后记录到错误日志并丢弃，
+        不阻塞后续记录；仍可重试的记录放回队首，在下一次刷新时写入
+        """
+        total = 0
+        async with self._lock:
+            while self._queue:
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                try:
+                    await self._write(batch)
+                    total += len(batch)
+                    continue
+                except asyncio.CancelledError:
+                    self._queue.extendleft(reversed(batch))
+                    raise
+                except Exception as e:
+                    self.failures += 1
+                    if is_transient_error(e):
+                        # 数据库暂不可用：整批放回队首，等待下一次刷新
+                        logger.warning(f"Failed to write {len(batch)} audit record(s), will retry: {e}")
+                        self._queue.extendleft(reversed(batch))
+                        break
+                    logger.warning(f"Failed to write {len(batch)} audit record(s) as a batch, retrying one by one: {e}")
+                written, retry = await self._write_each(batch)
+                total += written
+                if retry:
+                    # 逐条写入仍失败但未达到重试上限，或数据库暂不可用：保留记录等待下一次刷新
+                    self._queue.extendleft(reversed(retry))
+                    break
+        return total
+
+    async def _write_each(self, batch: List[PendingRecord]) -> Tuple[int, List[PendingRecord]]:
+        """逐条写入，返回 (写入条数, 需要重试的记录)"""
+        written = 0
+        retry: List[PendingRecord] = []
+        for index, record in enumerate(batch):
+            try:
+                await self._write([record])
+                written += 1
+            except asyncio.CancelledError:
+                self._queue.extendleft(reversed(retry + batch[index:]))
+                raise
+            except Exception as e:
+                if is_transient_error(e):
+                    return written, retry + batch[index:]
+                record.attempts += 1
+                if record.attempts >= self.max_attempts:
+                    self._dead_letter(record, e)
+                else:
+                    retry.append(record)
+        return written, retry
+
+    def _dead_letter(self, record: PendingRecord, error: Exception) -> None:
+        self.dead_lettered += 1
+        logger.error(
+            f"Dropping {record.model.__tablename__} record after {record.attempts} failed attempt(s): {error}; "
+            f"record: {json.dumps(record.row, default=str, ensure_ascii=False)}"
+        )
+
+    async def drain(self, attempts: int = 3) -> int:
+        """应用关闭时写出剩余记录（失败时重试）"""
+        total = 0
+        for attempt in range(1, attempts + 1):
+            try:
+                total += await self.flush()
+            except Exception as e:
+                logger.warning(f"Failed to drain audit queue (attempt {attempt}/{attempts}): {e}")
+            if not self._queue:
+                break
+            await asyncio.sleep(0.5 * attempt)
+        if self._queue:
+            logger.error(f"{len(self._queue)} audit record(s) could not be written on shutdown")
+        return total
+
+    async def _write(self, batch: List[PendingRecord]) -> None:
+        """按表分组，每张表一条多行INSERT，在同一事务中提交"""
+        grouped: Dict[Type[Base], List[Dict[str, Any]]] = {}
+        for record in batch:
+            grouped.setdefault(record.model, []).append(record.row)
+        async with AsyncSessionLocal() as db:
+            for model, rows in grouped.items():
+                await db.execute(insert(model), rows)
+            await db.commit()
+        self.written += len(batch)
+        self.batches += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "depth": len(self._queue),
+            "maxsize": self.maxsize,
+            "peak_depth": self.peak_depth,
+            "queued": self.queued,
+            "written": self.written,
+            "batches": self.batches,
+            "sync_writes": self.sync_writes,
+            "backpressure": self.backpressure,
+            "failures": self.failures,
+            "dead_lettered": self.dead_lettered,
+        }
+
+
+# 全局审计记录写入队列
+audit_sink = AuditSink(
+    maxsize=settings.AUDIT_QUEUE_SIZE,
+    batch_size=settings.AUDIT_BATCH_SIZE,
+    max_attempts=settings.AUDIT_MAX_ATTEMPTS
+)
@@ -1,10 +1,42 @@
-from typing import Optional, List
+from typing import Optional, List, Dict, Iterable, NamedTuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update, and_
 from app.models.device import Device, DeviceCertificate, DeviceLog
 from app.schemas.device import DeviceCreate, DeviceUpdate, DeviceCertificateCreate, DeviceLogCreate
+from app.core.cache import TTLCache, MISSING
+from app.core.config import settings
+from app.core.pagination import Cursor, apply_keyset
 from datetime import datetime
 
+
+class DeviceIdentity(NamedTuple):
+    """设备标识（MQTT主题中的device_id到主键的映射）"""
+    id: object
+    device_id: str
+    name: str
+    type: str
+
+
+# 设备标识缓存：device_id -> DeviceIdentity，不存在的设备缓存为 None
+device_identity_cache = TTLCache(
+    maxsize=settings.DEVICE_CACHE_SIZE,
+    ttl=settings.DEVICE_CACHE_TTL
+)
+
+
+# 缓存失效计数：查询期间发生过失效时，查询结果可能已过期，不写入缓存
+_identity_generation = 0
+
+
+def invalidate_device_identity(*device_ids: str) -> None:
+    """使设备标识缓存失效（设备创建、更新、删除提交后调用）"""
+    global _identity_generation
+    _identity_generation += 1
+    for device_id in device_ids:
+        if device_id:
+            device_identity_cache.pop(device_id)
+
+
 class DeviceService:
     def __init__(self, db: AsyncSession):
         self.db = db
@@ -25,6 +57,41 @@ class DeviceService:
         )
         return result.scalar_one_or_none()
 
+    async def resolve_identities(self, device_ids: Iterable[str]) -> Dict[str, DeviceIdentity]:
+        """
+        批量解析设备标识（优先使用缓存）
+        只有缓存未命中的设备才查询数据库，查询不到的设备也会被缓存，避免未知设备反复查库
+
+        Returns:
+            已存在设备的 device_id -> DeviceIdentity
+        """
+        found: Dict[str, DeviceIdentity] = {}
+        missing = []
+        for device_id in set(device_ids):
+            identity = device_identity_cache.get(device_id)
+            if identity is MISSING:
+                missing.append(device_id)
+            elif identity is not None:
+                found[device_id] = identity
+        
+        if missing:
+            generation = _identity_generation
+            result = await self.db.execute(
+                select(Device.id, Device.device_id, Device.name, Device.type)
+                .filter(Device.device_id.in_(missing))
+            )
+            # 查询期间有设备被创建、更新或删除：本次结果照常返回，但不写入缓存，避免缓存失效后又写回旧值
+            cacheable = generation == _identity_generation
+            for row in result.all():
+                identity = DeviceIdentity(row.id, row.device_id, row.name, row.type)
+                if cacheable:
+                    device_identity_cache.set(row.device_id, identity)
+                found[row.device_id] = identity
+            for device_id in missing:
+                if cacheable and device_id not in found:
+                    device_identity_cache.set(device_id, None, ttl=settings.DEVICE_CACHE_NEGATIVE_TTL)
+        return found
+
     async def get_multi(self, skip: int = 0, limit: int = 100) -> List[Device]:
         """获取多个设备"""
         result = await self.db.execute(
@@ -139,14 +206,15 @@ class DeviceService:
         return log
 
     async def get_device_logs(
-        self, device: Device, skip: int = 0, limit: int = 100
+        self, device: Device, skip: int = 0, limit: int = 100,
+        cursor: Optional[Cursor] = None
     ) -> List[DeviceLog]:
-        """获取设备日志"""
-        result = await self.db.execute(
-            select(DeviceLog)
-            .filter(DeviceLog.device_id == device.id)
-            .order_by(DeviceLog.created_at.desc())
-            .offset(skip)
-            .limit(limit)
+        """获取设备日志（传入游标时从游标位置继续读取，忽略 skip）"""
+        query = apply_keyset(
+            select(DeviceLog).filter(DeviceLog.device_id == device.id),
+            DeviceLog.created_at, DeviceLog.id, cursor
         )
+        if cursor is None and skip:
+            query = query.offset(skip)
+        result = await self.db.execute(query.limit(limit))
         return result.scalars().all()
\ No newline at end of file
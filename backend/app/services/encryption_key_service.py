@@ -105,7 +105,7 @@ class EncryptionKeyService:
             if decrypt:
                 # 解密密钥
                 try:
-                    key_hex = decrypt_certificate_data(encryption_key.key_encrypted)
+                    key_hex = decrypt_certificate_data(encryption_key.key_encrypted, is_key=True)
                     return key_hex
                 except Exception as e:
                     logger.error(f"解密密钥失败: {e}", exc_info=True)
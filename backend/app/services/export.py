@@ -0,0 +1,167 @@
+"""
+审计日志/安全事件批量导出
+使用服务端游标按块读取，逐块转换为 NDJSON / CSV 文本输出，内存占用与导出的时间范围无关；
+离线导出为 Parquet 时每块写入一个 row group（需要安装 pyarrow）
+"""
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Type
+from datetime import datetime
+import csv
+import io
+import ipaddress
+import json
+import logging
+import uuid
+from sqlalchemy import select
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, Base
+from app.models.security import SecurityAuditLog, SecurityEvent
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # 仅离线导出Parquet时需要
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+# 可导出的表
+EXPORT_MODELS: Dict[str, Type[Base]] = {
+    "audit_logs": SecurityAuditLog,
+    "events": SecurityEvent,
+}
+
+EXPORT_FORMATS = ("ndjson", "csv")
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def to_plain(value: Any) -> Any:
+    """数据库值 -> JSON可序列化的值"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (uuid.UUID, ipaddress.IPv4Address, ipaddress.IPv6Address,
+                          ipaddress.IPv4Interface, ipaddress.IPv6Interface)):
+        return str(value)
+    return value
+
+
+def build_export_query(
+    model: Type[Base],
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    **filters: Any
+):
+    """按时间范围和等值条件筛选，按 (created_at, id) 升序导出"""
+    query = select(*model.__table__.columns)
+    if start_time:
+        query = query.filter(model.created_at >= start_time)
+    if end_time:
+        query = query.filter(model.created_at <= end_time)
+    for name, value in filters.items():
+        if value is not None:
+            query = query.filter(getattr(model, name) == value)
+    return query.order_by(model.created_at, model.id)
+
+
+async def iter_row_chunks(query, chunk_size: Optional[int] = None) -> AsyncIterator[List[Sequence[Any]]]:
+    """使用服务端游标按块读取查询结果（使用独立会话，可在响应流中执行）"""
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=chunk_size))
+        async for rows in result.partitions(chunk_size):
+            yield rows
+
+
+def format_ndjson(columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> str:
+    return "".join(
+        json.dumps({name: to_plain(value) for name, value in zip(columns, row)}, ensure_ascii=False) + "\n"
+        for row in rows
+    )
+
+
+def format_csv(columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([
+            json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else
+            "" if value is None else to_plain(value)
+            for value in row
+        ])
+    return buffer.getvalue()
+
+
+async def stream_export(
+    model: Type[Base],
+    fmt: str,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    **filters: Any
+) -> AsyncIterator[str]:
+    """逐块生成导出内容（CSV首行为列名）"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}, expected one of {EXPORT_FORMATS}")
+    columns = [column.name for column in model.__table__.columns]
+    if fmt == "csv":
+        yield format_csv(columns, [columns])
+    formatter = format_ndjson if fmt == "ndjson" else format_csv
+    exported = 0
+    async for rows in iter_row_chunks(build_export_query(model, start_time, end_time, **filters)):
+        exported += len(rows)
+        yield formatter(columns, rows)
+    logger.info(f"Exported {exported} row(s) from {model.__tablename__} as {fmt}")
+
+
+def parquet_schema(model: Type[Base]):
+    """根据列类型生成Parquet schema（UUID/INET/JSON 以字符串保存）"""
+    fields = []
+    for column in model.__table__.columns:
+        type_name = column.type.__class__.__name__
+        if type_name == "DateTime":
+            arrow_type = pa.timestamp("us", tz="UTC" if column.type.timezone else None)
+        elif type_name == "Boolean":
+            arrow_type = pa.bool_()
+        elif type_name == "Integer":
+            arrow_type = pa.int64()
+        elif type_name == "Float":
+            arrow_type = pa.float64()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+
+def to_parquet_value(value: Any) -> Any:
+    if value is None or isinstance(value, (datetime, bool, int, float, str)):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+async def write_parquet(
+    model: Type[Base],
+    path: str,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    **filters: Any
+) -> int:
+    """离线导出为Parquet文件，每块数据写入一个 row group，返回导出行数"""
+    if pa is None:
+        raise RuntimeError("pyarrow is required for Parquet export: pip install pyarrow")
+    schema = parquet_schema(model)
+    exported = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        async for rows in iter_row_chunks(build_export_query(model, start_time, end_time, **filters)):
+            data = {
+                field.name: [to_parquet_value(row[i]) for row in rows]
+                for i, field in enumerate(schema)
+            }
+            writer.write_table(pa.table(data, schema=schema))
+            exported += len(rows)
+    logger.info(f"Exported {exported} row(s) from {model.__tablename__} to {path}")
+    return exported
@@ -0,0 +1,233 @@
+"""
+IP黑名单匹配
+黑名单（单个IP或CIDR网段）编译为IPv4/IPv6前缀树常驻内存，检查一个地址只需沿前缀树向下查找，不查询数据库；
+启动时从数据库加载，增删黑名单时增量更新，并通过Redis发布/订阅同步到其他API实例
+"""
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+from datetime import datetime, timezone
+import ipaddress
+import json
+import logging
+import time
+import uuid
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, or_
+from app.models.security import BlacklistedIP
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class BlacklistEntry(NamedTuple):
+    network: str
+    expires_at: Optional[float] = None  # Unix时间戳，None表示永久
+
+
+def parse_network(value: Any) -> Union[ipaddress.IPv4Network, ipaddress.IPv6Network]:
+    """单个IP或CIDR网段 -> 网络（主机位不为0的CIDR按所在网段处理）"""
+    return ipaddress.ip_network(str(value), strict=False)
+
+
+def to_timestamp(value: Optional[datetime]) -> Optional[float]:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        # naive datetime 按UTC处理
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class PrefixTrie:
+    """二进制前缀树，节点为 [0子节点, 1子节点, 条目]"""
+
+    __slots__ = ("bits", "root", "size")
+
+    def __init__(self, bits: int):
+        self.bits = bits
+        self.root: List[Any] = [None, None, None]
+        self.size = 0
+
+    def insert(self, value: int, prefixlen: int, entry: BlacklistEntry) -> None:
+        node = self.root
+        for shift in range(self.bits - 1, self.bits - 1 - prefixlen, -1):
+            bit = (value >> shift) & 1
+            child = node[bit]
+            if child is None:
+                child = node[bit] = [None, None, None]
+            node = child
+        if node[2] is None:
+            self.size += 1
+        node[2] = entry
+
+    def remove(self, value: int, prefixlen: int) -> bool:
+        path: List[Tuple[List[Any], int]] = []
+        node = self.root
+        for shift in range(self.bits - 1, self.bits - 1 - prefixlen, -1):
+            bit = (value >> shift) & 1
+            child = node[bit]
+            if child is None:
+                return False
+            path.append((node, bit))
+            node = child
+        if node[2] is None:
+            return False
+        node[2] = None
+        self.size -= 1
+        # 删除不再有条目的空分支
+        for parent, bit in reversed(path):
+            child = parent[bit]
+            if child[0] is None and child[1] is None and child[2] is None:
+                parent[bit] = None
+            else:
+                break
+        return True
+
+    def match(self, value: int, now: float) -> Optional[BlacklistEntry]:
+        """返回包含该地址的最短前缀中未过期的条目"""
+        node = self.root
+        shift = self.bits - 1
+        while node is not None:
+            entry = node[2]
+            if entry is not None and (entry.expires_at is None or entry.expires_at > now):
+                return entry
+            if shift < 0:
+                break
+            node = node[(value >> shift) & 1]
+            shift -= 1
+        return None
+
+
+class IPBlacklist:
+    """内存中的IP黑名单"""
+
+    def __init__(self):
+        self.loaded = False
+        self._tries: Dict[int, PrefixTrie] = {4: PrefixTrie(32), 6: PrefixTrie(128)}
+        # 用于Redis同步消息的实例标识，忽略自己发布的消息
+        self.instance_id = uuid.uuid4().hex
+        # Redis客户端（由 app.core.events 在连接成功后设置），None时不同步
+        self.redis = None
+        # 计数器
+        self.lookups = 0
+        self.hits = 0
+        self.reloads = 0
+        self.sync_received = 0
+        self.sync_published = 0
+
+    def build(self, rows: Iterable[Tuple[Any, Optional[datetime]]]) -> None:
+        """根据 (ip_address, expiry_at) 列表重建前缀树"""
+        tries = {4: PrefixTrie(32), 6: PrefixTrie(128)}
+        for ip_address, expiry_at in rows:
+            try:
+                network = parse_network(ip_address)
+            except ValueError:
+                logger.warning(f"Skipping invalid blacklist entry: {ip_address}")
+                continue
+            tries[network.version].insert(
+                int(network.network_address), network.prefixlen,
+                BlacklistEntry(str(network), to_timestamp(expiry_at))
+            )
+        self._tries = tries
+        self.loaded = True
+        self.reloads += 1
+
+    async def load(self, db: AsyncSession) -> None:
+        """从数据库加载未过期的黑名单（同时清除内存中已过期的条目）"""
+        result = await db.execute(
+            select(BlacklistedIP.ip_address, BlacklistedIP.expiry_at).filter(
+                or_(BlacklistedIP.expiry_at.is_(None), BlacklistedIP.expiry_at > datetime.now(timezone.utc))
+            )
+        )
+        self.build(result.all())
+        logger.info(f"IP blacklist loaded with {len(self)} entr(ies)")
+
+    async def ensure_loaded(self, db: AsyncSession) -> None:
+        if not self.loaded:
+            await self.load(db)
+
+    def __len__(self) -> int:
+        return sum(trie.size for trie in self._tries.values())
+
+    def add(self, ip_address: Any, expiry_at: Optional[datetime] = None) -> None:
+        network = parse_network(ip_address)
+        self._tries[network.version].insert(
+            int(network.network_address), network.prefixlen,
+            BlacklistEntry(str(network), to_timestamp(expiry_at))
+        )
+
+    def remove(self, ip_address: Any) -> bool:
+        network = parse_network(ip_address)
+        return self._tries[network.version].remove(int(network.network_address), network.prefixlen)
+
+    def match(self, ip: Any, now: Optional[float] = None) -> Optional[BlacklistEntry]:
+        """返回命中的黑名单条目；无法解析的地址视为未命中"""
+        self.lookups += 1
+        try:
+            address = ip if isinstance(ip, (ipaddress.IPv4Address, ipaddress.IPv6Address)) else ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if address.version == 6 and address.ipv4_mapped is not None:
+            # ::ffff:a.b.c.d 按IPv4地址匹配
+            address = address.ipv4_mapped
+        entry = self._tries[address.version].match(int(address), time.time() if now is None else now)
+        if entry is not None:
+            self.hits += 1
+        return entry
+
+    def is_blacklisted(self, ip: Any) -> bool:
+        return self.match(ip) is not None
+
+    # Redis同步
+    async def publish(self, action: str, ip_address: Any, expiry_at: Optional[datetime] = None) -> None:
+        """通知其他实例增量更新（Redis不可用时只更新本实例，由周期性重新加载兜底）"""
+        if self.redis is None:
+            return
+        message = {
+            "origin": self.instance_id,
+            "action": action,
+            "ip": str(parse_network(ip_address)),
+            "expiry_at": to_timestamp(expiry_at),
+        }
+        try:
+            await self.redis.publish(settings.IP_BLACKLIST_SYNC_CHANNEL, json.dumps(message))
+            self.sync_published += 1
+        except Exception as e:
+            logger.warning(f"Failed to publish IP blacklist update: {e}")
+
+    def apply_message(self, data: Any) -> None:
+        """处理其他实例发布的更新消息"""
+        try:
+            message = json.loads(data)
+            if message.get("origin") == self.instance_id:
+                return
+            action = message["action"]
+            if action == "add":
+                expiry_at = message.get("expiry_at")
+                self.add(
+                    message["ip"],
+                    datetime.fromtimestamp(expiry_at, tz=timezone.utc) if expiry_at is not None else None
+                )
+            elif action == "remove":
+                self.remove(message["ip"])
+            else:
+                return
+            self.sync_received += 1
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring invalid IP blacklist sync message: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loaded": self.loaded,
+            "ipv4_entries": self._tries[4].size,
+            "ipv6_entries": self._tries[6].size,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "reloads": self.reloads,
+            "sync_received": self.sync_received,
+            "sync_published": self.sync_published,
+            "sync_enabled": self.redis is not None,
+        }
+
+
+# 全局IP黑名单实例
+ip_blacklist = IPBlacklist()
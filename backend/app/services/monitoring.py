@@ -1,10 +1,14 @@
 from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_, or_, desc, func
 
 from app.models.monitoring import (
     DeviceMetrics as DeviceMetricsModel,
+    DeviceTelemetry as DeviceTelemetryModel,
+    DeviceMetricRollup as DeviceMetricRollupModel,
+    TELEMETRY_METRIC_COLUMNS,
+    ROLLUP_RESOLUTIONS,
     AlertRule as AlertRuleModel,
     MonitoringAlert as MonitoringAlertModel
 )
@@ -12,8 +16,21 @@ from app.schemas.monitoring import (
     DeviceMetricsCreate,
     AlertRuleCreate,
     AlertRuleUpdate,
-    SystemStatus
+    SystemStatus,
+    check_rule_parameters
 )
+from app.models.device import Device
+from app.core.cache import TTLCache, MISSING
+from app.core.config import settings
+from app.services.presence import presence_tracker
+from app.services.rollups import RollupAccumulator, RollupService, choose_resolution, metric_samples
+from app.services.alert_engine import alert_rule_index, AlertSample
+from app.services.alert_state import alert_state_tracker
+from app.core.pagination import Cursor, apply_keyset
+
+# 系统状态快照：由后台任务按 SYSTEM_STATUS_REFRESH_INTERVAL 刷新；
+# 刷新任务停止时快照过期，接口退回到按需计算
+system_status_cache = TTLCache(maxsize=1, ttl=settings.SYSTEM_STATUS_REFRESH_INTERVAL * 3)
 
 class MonitoringService:
     def __init__(self, db: AsyncSession):
@@ -25,7 +42,15 @@ class MonitoringService:
     ) -> DeviceMetricsModel:
         """创建设备指标记录"""
         metrics = DeviceMetricsModel(**metrics_in.model_dump())
+        metrics.timestamp = datetime.utcnow()
         self.db.add(metrics)
+
+        # 同步更新降采样数据
+        rollups = RollupAccumulator()
+        for name, value in metric_samples(metrics.metric_type, metrics.metrics):
+            rollups.add(metrics.device_id, name, value, metrics.timestamp)
+        await RollupService(self.db).apply(rollups)
+
         await self.db.commit()
         await self.db.refresh(metrics)
 
@@ -40,9 +65,24 @@ class MonitoringService:
         start_time: datetime,
         end_time: datetime,
         metric_type: Optional[str] = None,
-        limit: int = 100
+        limit: int = 100,
+        resolution: Optional[str] = None,
+        max_points: int = 500
     ) -> List[DeviceMetricsModel]:
-        """获取设备指标历史数据"""
+        """
+        获取设备指标历史数据
+
+        Args:
+            resolution: 为空或 raw 时读取原始数据；1m/5m/1h 读取降采样数据；
+                        auto 时短时间范围读取原始数据，否则按 max_points 自动选择粒度
+            max_points: 每个指标返回的最大时间桶数量（仅降采样数据）
+        """
+        if resolution == "auto":
+            span = (end_time - start_time).total_seconds()
+            resolution = "raw" if span <= settings.METRICS_RAW_MAX_RANGE else choose_resolution(start_time, end_time, max_points)
+        if resolution in ROLLUP_RESOLUTIONS:
+            return await self._get_rollup_metrics(device_id, start_time, end_time, metric_type, resolution, max_points)
+
         query = (
             select(DeviceMetricsModel)
             .filter(DeviceMetricsModel.device_id == device_id)
@@ -55,7 +95,93 @@ class MonitoringService:
         
         query = query.order_by(desc(DeviceMetricsModel.timestamp)).limit(limit)
         result = await self.db.execute(query)
-        return result.scalars().all()
+        metrics = list(result.scalars().all())
+
+        # 合并紧凑遥测表中的数据（按指标拆分为与 device_metrics 相同的形式）
+        if metric_type is None or metric_type in TELEMETRY_METRIC_COLUMNS:
+            metrics.extend(await self._get_telemetry_metrics(
+                device_id, start_time, end_time, metric_type, limit
+            ))
+            metrics.sort(key=lambda m: m.timestamp, reverse=True)
+            metrics = metrics[:limit]
+        return metrics
+
+    async def _get_telemetry_metrics(
+        self,
+        device_id: str,
+        start_time: datetime,
+        end_time: datetime,
+        metric_type: Optional[str],
+        limit: int
+    ) -> List[DeviceMetricsModel]:
+        """从紧凑遥测表读取数据，每个非空指标列转换为一条指标记录（不写入数据库）"""
+        columns = (metric_type,) if metric_type else TELEMETRY_METRIC_COLUMNS
+        query = (
+            select(DeviceTelemetryModel)
+            .filter(DeviceTelemetryModel.device_id == device_id)
+            .filter(DeviceTelemetryModel.timestamp >= start_time)
+            .filter(DeviceTelemetryModel.timestamp <= end_time)
+        )
+        if metric_type:
+            query = query.filter(getattr(DeviceTelemetryModel, metric_type).isnot(None))
+        query = query.order_by(desc(DeviceTelemetryModel.timestamp)).limit(limit)
+        result = await self.db.execute(query)
+
+        metrics = []
+        for row in result.scalars().all():
+            for name in columns:
+                value = getattr(row, name)
+                if value is None:
+                    continue
+                metrics.append(DeviceMetricsModel(
+                    id=f"{row.id}:{name}",
+                    device_id=row.device_id,
+                    metric_type=name,
+                    metrics={'value': value},
+                    timestamp=row.timestamp
+                ))
+        return metrics
+
+    async def _get_rollup_metrics(
+        self,
+        device_id: str,
+        start_time: datetime,
+        end_time: datetime,
+        metric_type: Optional[str],
+        resolution: str,
+        max_points: int
+    ) -> List[DeviceMetricsModel]:
+        """读取降采样数据，转换为指标记录（value 为桶内平均值，不写入数据库）"""
+        rollups = await RollupService(self.db).get_rollups(device_id, resolution, start_time, end_time, metric_type)
+        metrics = []
+        per_metric: Dict[str, int] = {}
+        for rollup in rollups:
+            # 每个指标最多 max_points 个桶（按时间倒序保留最新的）
+            count = per_metric.get(rollup.metric_name, 0)
+            if count >= max_points:
+                continue
+            per_metric[rollup.metric_name] = count + 1
+            metrics.append(self._rollup_to_metrics(rollup))
+        return metrics
+
+    @staticmethod
+    def _rollup_to_metrics(rollup: DeviceMetricRollupModel) -> DeviceMetricsModel:
+        avg = rollup.sum_value / rollup.sample_count if rollup.sample_count else None
+        return DeviceMetricsModel(
+            id=f"{rollup.resolution}:{rollup.metric_name}:{rollup.bucket:%Y%m%d%H%M}",
+            device_id=rollup.device_id,
+            metric_type=rollup.metric_name,
+            metrics={
+                'value': avg,
+                'min': rollup.min_value,
+                'max': rollup.max_value,
+                'avg': avg,
+                'count': rollup.sample_count,
+                'last': rollup.last_value,
+                'resolution': rollup.resolution,
+            },
+            timestamp=rollup.bucket
+        )
 
     # 告警规则管理
     async def create_alert_rule(
@@ -66,6 +192,8 @@ class MonitoringService:
         self.db.add(rule)
         await self.db.commit()
         await self.db.refresh(rule)
+        await alert_rule_index.reload(self.db)
+        await alert_state_tracker.load(self.db)
         return rule
 
     async def get_alert_rule(
@@ -98,19 +226,28 @@ class MonitoringService:
         rule: AlertRuleModel,
         rule_in: AlertRuleUpdate
     ) -> AlertRuleModel:
-        """更新告警规则"""
+        """更新告警规则（更新后的完整规则不满足规则类型的参数要求时抛出 ValueError）"""
         update_data = rule_in.model_dump(exclude_unset=True)
+        merged = {
+            field: update_data.get(field, getattr(rule, field))
+            for field in ("rule_type", "window_seconds", "consecutive_count")
+        }
+        check_rule_parameters(merged["rule_type"], merged["window_seconds"], merged["consecutive_count"])
         for field, value in update_data.items():
             setattr(rule, field, value)
         
         await self.db.commit()
         await self.db.refresh(rule)
+        await alert_rule_index.reload(self.db)
+        await alert_state_tracker.load(self.db)
         return rule
 
     async def delete_alert_rule(self, rule: AlertRuleModel) -> None:
         """删除告警规则"""
         await self.db.delete(rule)
         await self.db.commit()
+        await alert_rule_index.reload(self.db)
+        await alert_state_tracker.load(self.db)
 
     # 告警管理
     async def get_alert(
@@ -130,9 +267,10 @@ class MonitoringService:
         end_time: Optional[datetime] = None,
         severity: Optional[str] = None,
         status: Optional[str] = None,
-        limit: int = 100
+        limit: int = 100,
+        cursor: Optional[Cursor] = None
     ) -> List[MonitoringAlertModel]:
-        """获取告警列表"""
+        """获取告警列表（传入游标时从游标位置继续读取）"""
         query = select(MonitoringAlertModel)
         
         if device_id:
@@ -146,7 +284,7 @@ class MonitoringService:
         if status:
             query = query.filter(MonitoringAlertModel.status == status)
         
-        query = query.order_by(desc(MonitoringAlertModel.created_at)).limit(limit)
+        query = apply_keyset(query, MonitoringAlertModel.created_at, MonitoringAlertModel.id, cursor).limit(limit)
         result = await self.db.execute(query)
         return result.scalars().all()
 
@@ -154,44 +292,57 @@ class MonitoringService:
         self, alert: MonitoringAlertModel,
         user_id: str
     ) -> MonitoringAlertModel:
-        """确认告警"""
-        alert.status = "acknowledged"
+        """确认告警（已恢复的告警只记录确认人，不重新打开）"""
+        if alert.status != "resolved":
+            alert.status = "acknowledged"
         alert.acknowledged_by = user_id
         alert.acknowledged_at = datetime.utcnow()
         
         await self.db.commit()
         await self.db.refresh(alert)
+        # 只同步这一条告警的跟踪状态
+        alert_state_tracker.sync_alert(alert)
         return alert
 
     # 系统状态管理
     async def get_system_status(self) -> SystemStatus:
-        """获取系统整体状态"""
-        # 计算设备在线状态
-        now = datetime.utcnow()
-        threshold = now - timedelta(minutes=5)  # 5分钟内有数据视为在线
-        
-        online_devices = await self.db.execute(
-            select(func.count(DeviceMetricsModel.device_id.distinct()))
-            .filter(DeviceMetricsModel.timestamp >= threshold)
-        )
-        online_count = online_devices.scalar() or 0
+        """获取系统整体状态（优先返回后台任务刷新的快照）"""
+        status = system_status_cache.get("status")
+        if status is not MISSING:
+            return status
+        return await self.refresh_system_status()
 
-        # 获取未确认的告警统计
-        unacknowledged_alerts = await self.db.execute(
-            select(MonitoringAlertModel)
-            .filter(MonitoringAlertModel.status == "active")
-        )
-        alerts = unacknowledged_alerts.scalars().all()
-        
-        # 按严重程度统计告警
+    async def refresh_system_status(self) -> SystemStatus:
+        """重新计算系统状态并更新快照"""
+        status = await self._compute_system_status()
+        system_status_cache.set("status", status)
+        return status
+
+    async def _compute_system_status(self) -> SystemStatus:
+        """计算系统整体状态"""
+        # 在线设备数来自在线状态跟踪；跟踪器未加载时（如非MQTT接入进程）读取设备状态
+        if presence_tracker.loaded:
+            online_count = presence_tracker.online_count()
+        else:
+            online_devices = await self.db.execute(
+                select(func.count()).select_from(Device).filter(Device.status == "online")
+            )
+            online_count = online_devices.scalar() or 0
+
+        # 按严重程度统计未确认的告警
         alert_counts = {
             "critical": 0,
             "high": 0,
             "medium": 0,
             "low": 0
         }
-        for alert in alerts:
-            alert_counts[alert.severity] = alert_counts.get(alert.severity, 0) + 1
+        severity_counts = await self.db.execute(
+            select(MonitoringAlertModel.severity, func.count())
+            .filter(MonitoringAlertModel.status == "active")
+            .group_by(MonitoringAlertModel.severity)
+        )
+        for severity, count in severity_counts.all():
+            alert_counts[severity] = count
 
         # 获取最近的系统性能指标
         system_metrics = await self.db.execute(
@@ -204,7 +355,7 @@ class MonitoringService:
 
         return SystemStatus(
             online_devices=online_count,
-            total_active_alerts=len(alerts),
+            total_active_alerts=sum(alert_counts.values()),
             alert_severity_distribution=alert_counts,
             system_metrics=latest_metrics.metrics if latest_metrics else None,
             last_update=latest_metrics.timestamp if latest_metrics else None
@@ -212,62 +363,25 @@ class MonitoringService:
 
     # 内部方法
     async def _check_alert_rules(self, metrics: DeviceMetricsModel) -> None:
-        """检查指标是否触发告警规则"""
-        rules = await self.get_alert_rules(
-            device_id=metrics.device_id,
-            enabled=True
-        )
-
-        for rule in rules:
-            if self._evaluate_alert_condition(metrics, rule):
-                await self._create_alert(metrics, rule)
+        """检查指标是否触发告警规则（使用内存规则索引，不查询规则表；告警状态由 alert_state_tracker 维护）"""
+        await alert_rule_index.ensure_loaded(self.db)
+        await alert_state_tracker.ensure_loaded(self.db)
 
-    def _evaluate_alert_condition(
-        self, metrics: DeviceMetricsModel,
-        rule: AlertRuleModel
-    ) -> bool:
-        """评估告警条件"""
+        ts = metrics.timestamp.replace(tzinfo=timezone.utc).timestamp()
+        samples = [
+            AlertSample(metrics.device_id, metric_name, metric_value, ts)
+            for metric_name, metric_value in metrics.metrics.items()
+        ]
+        triggered = alert_rule_index.evaluate_samples(samples)
+        alert_batch = alert_state_tracker.apply(
+            samples, triggered, lambda _: {"metrics_id": metrics.id}, metrics.timestamp
+        )
+        if not alert_batch:
+            return
         try:
-            metric_value = metrics.metrics.get(rule.metric_name)
-            if metric_value is None:
-                return False
-
-            threshold = rule.threshold
-            condition = rule.condition
-
-            if condition == "gt":
-                return metric_value > threshold
-            elif condition == "gte":
-                return metric_value >= threshold
-            elif condition == "lt":
-                return metric_value < threshold
-            elif condition == "lte":
-                return metric_value <= threshold
-            elif condition == "eq":
-                return metric_value == threshold
-            elif condition == "neq":
-                return metric_value != threshold
-            else:
-                return False
+            await alert_state_tracker.persist(self.db, alert_batch)
+            await self.db.commit()
         except Exception:
-            return False
-
-    async def _create_alert(
-        self, metrics: DeviceMetricsModel,
-        rule: AlertRuleModel
-    ) -> None:
-        """创建告警"""
-        alert = MonitoringAlertModel(
-            device_id=metrics.device_id,
-            rule_id=rule.id,
-            severity=rule.severity,
-            message=rule.message.format(
-                value=metrics.metrics.get(rule.metric_name),
-                threshold=rule.threshold
-            ),
-            metrics_id=metrics.id,
-            status="active"
-        )
-        
-        self.db.add(alert)
-        await self.db.commit()
\ No newline at end of file
+            alert_state_tracker.discard(alert_batch)
+            raise
+        alert_state_tracker.commit(alert_batch)
@@ -0,0 +1,150 @@
+"""
+指标表分区管理
+device_metrics / device_telemetry 按 timestamp 做范围分区：提前创建后续分区，超过保留期的分区整表删除
+"""
+from typing import List, Optional, Tuple, Iterator, Dict, Any
+from datetime import datetime, timedelta
+import logging
+import re
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# 按时间范围分区的表
+PARTITIONED_TABLES = ("device_metrics", "device_telemetry")
+
+PARTITION_INTERVALS = ("daily", "weekly")
+
+_BOUND_PATTERN = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def period_start(ts: datetime, interval: str) -> datetime:
+    """时间点所在分区的起始时间（weekly 以周一为起点）"""
+    start = ts.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+    if interval == "weekly":
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+def period_end(start: datetime, interval: str) -> datetime:
+    return start + timedelta(days=7 if interval == "weekly" else 1)
+
+
+def iter_partition_ranges(start: datetime, end: datetime, interval: str) -> Iterator[Tuple[datetime, datetime]]:
+    """生成覆盖 [start, end) 的分区范围"""
+    current = period_start(start, interval)
+    while current < end:
+        upper = period_end(current, interval)
+        yield current, upper
+        current = upper
+
+
+def partition_name(table: str, start: datetime) -> str:
+    return f"{table}_p{start:%Y%m%d}"
+
+
+def create_partition_sql(table: str, start: datetime, end: datetime) -> str:
+    """创建分区的DDL（DDL不支持绑定参数，边界由程序生成）"""
+    return (
+        f'CREATE TABLE IF NOT EXISTS "{partition_name(table, start)}" PARTITION OF "{table}" '
+        f"FOR VALUES FROM ('{start:%Y-%m-%d %H:%M:%S}') TO ('{end:%Y-%m-%d %H:%M:%S}')"
+    )
+
+
+class PartitionManager:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def is_partitioned(self, table: str) -> bool:
+        """表是否已经是分区表（未执行迁移时跳过维护）"""
+        result = await self.db.execute(
+            text(
+                "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+                "WHERE c.relname = :table AND c.relnamespace = 'public'::regnamespace"
+            ),
+            {"table": table}
+        )
+        return result.scalar() is not None
+
+    async def get_partitions(self, table: str) -> List[Tuple[str, datetime, datetime]]:
+        """获取表的范围分区 (name, start, end)，不包括默认分区"""
+        result = await self.db.execute(
+            text(
+                "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+                "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = (SELECT oid FROM pg_class "
+                "WHERE relname = :table AND relnamespace = 'public'::regnamespace)"
+            ),
+            {"table": table}
+        )
+        partitions = []
+        for name, bound in result.all():
+            match = _BOUND_PATTERN.search(bound or "")
+            if match:
+                partitions.append((
+                    name,
+                    datetime.fromisoformat(match.group(1)),
+                    datetime.fromisoformat(match.group(2))
+                ))
+        return sorted(partitions, key=lambda p: p[1])
+
+    async def ensure_partitions(
+        self, table: str, interval: str, ahead: int,
+        partitions: Optional[List[Tuple[str, datetime, datetime]]] = None
+    ) -> List[str]:
+        """创建从当前分区起的 ahead 个后续分区，跳过与已有分区重叠的范围"""
+        if partitions is None:
+            partitions = await self.get_partitions(table)
+        now = datetime.utcnow()
+        end = period_start(now, interval)
+        for _ in range(ahead + 1):
+            end = period_end(end, interval)
+
+        created = []
+        for start, upper in iter_partition_ranges(now, end, interval):
+            if any(start < p_end and p_start < upper for _, p_start, p_end in partitions):
+                continue
+            try:
+                # 默认分区中已有该范围的数据时创建会失败，只跳过这一个分区
+                async with self.db.begin_nested():
+                    await self.db.execute(text(create_partition_sql(table, start, upper)))
+                created.append(partition_name(table, start))
+            except Exception as e:
+                logger.warning(f"Failed to create partition {partition_name(table, start)}: {e}")
+        await self.db.commit()
+        return created
+
+    async def drop_expired(
+        self, table: str, retention_days: int,
+        partitions: Optional[List[Tuple[str, datetime, datetime]]] = None
+    ) -> List[str]:
+        """删除上界早于保留期的分区（整表删除，不逐行DELETE）"""
+        if retention_days <= 0:
+            return []
+        if partitions is None:
+            partitions = await self.get_partitions(table)
+        cutoff = datetime.utcnow() - timedelta(days=retention_days)
+        dropped = []
+        for name, _, upper in partitions:
+            if upper <= cutoff:
+                await self.db.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+                dropped.append(name)
+        await self.db.commit()
+        return dropped
+
+    async def maintain(self, interval: str, ahead: int, retention_days: int) -> Dict[str, Any]:
+        """对所有分区表执行一次维护"""
+        if interval not in PARTITION_INTERVALS:
+            raise ValueError(f"Unknown partition interval: {interval}, expected one of {PARTITION_INTERVALS}")
+        summary = {}
+        for table in PARTITIONED_TABLES:
+            if not await self.is_partitioned(table):
+                logger.debug(f"Table {table} is not partitioned, skipping partition maintenance")
+                continue
+            partitions = await self.get_partitions(table)
+            summary[table] = {
+                "created": await self.ensure_partitions(table, interval, ahead, partitions),
+                "dropped": await self.drop_expired(table, retention_days, partitions),
+            }
+        return summary
@@ -0,0 +1,178 @@
+"""
+设备在线状态跟踪
+在内存中记录设备最近在线时间，只有状态变化时立即写库，其余按周期批量刷新 last_online_at；
+离线判定由按截止时间排序的最小堆驱动，每次只处理已到期的设备
+
+注意：在线状态只在接收MQTT消息的进程内维护，部署时只能有一个进程负责MQTT接入
+"""
+from typing import Dict, Any, Iterable, List, Optional
+from datetime import datetime, timedelta, timezone
+import heapq
+import itertools
+import logging
+import time
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, or_, text
+from app.models.device import Device
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceTracker:
+    """设备在线状态跟踪（进程内）"""
+
+    def __init__(self, offline_timeout: float = 90):
+        self.offline_timeout = offline_timeout
+        self.loaded = False
+        # 已知在线设备 -> 最近在线时间
+        self._online: Dict[Any, datetime] = {}
+        # 尚未写入数据库的最近在线时间
+        self._dirty: Dict[Any, datetime] = {}
+        # 离线截止时间最小堆 (deadline, seq, device_id)，每个设备最多一个有效条目
+        self._deadlines: List[tuple] = []
+        # 设备当前在堆中的截止时间，用于识别过期条目
+        self._scheduled: Dict[Any, float] = {}
+        self._seq = itertools.count()
+        # 计数器
+        self.immediate_writes = 0
+        self.coalesced_touches = 0
+        self.flushed_rows = 0
+        self.expired = 0
+        self.rescheduled = 0
+
+    async def load(self, db: AsyncSession) -> None:
+        """从数据库加载当前在线的设备"""
+        result = await db.execute(
+            select(Device.id, Device.last_online_at).filter(Device.status == "online")
+        )
+        for device_id, last_online_at in result.all():
+            self._online[device_id] = last_online_at
+            self._schedule(device_id, self._deadline(last_online_at))
+        self.loaded = True
+        logger.info(f"Presence tracker loaded {len(self._online)} online device(s)")
+
+    def touch(self, device_id, seen_at: datetime) -> bool:
+        """
+        记录设备在线
+        返回 True 表示设备状态发生变化（离线 -> 在线），调用方需要立即写库
+        """
+        if device_id in self._online:
+            # 堆中的旧截止时间到期时再按最新在线时间重新排期，这里无需改动堆
+            self._online[device_id] = seen_at
+            self._dirty[device_id] = seen_at
+            self.coalesced_touches += 1
+            return False
+        self._online[device_id] = seen_at
+        self._dirty.pop(device_id, None)
+        self._schedule(device_id, self._deadline(seen_at))
+        self.immediate_writes += 1
+        return True
+
+    def mark_offline(self, device_ids: Iterable) -> None:
+        """设备已被标记为离线（或在线状态写库失败），下次上报时需要立即写库"""
+        for device_id in device_ids:
+            self._online.pop(device_id, None)
+            self._dirty.pop(device_id, None)
+            # 堆中的条目保留，出堆时发现已不在 _scheduled 中即丢弃
+            self._scheduled.pop(device_id, None)
+
+    def is_online(self, device_id) -> bool:
+        return device_id in self._online
+
+    def online_count(self) -> int:
+        return len(self._online)
+
+    def _deadline(self, seen_at: Optional[datetime]) -> float:
+        """离线截止时间（Unix时间戳）；没有在线时间的设备立即到期"""
+        if seen_at is None:
+            return 0.0
+        if seen_at.tzinfo is None:
+            # naive datetime 按UTC处理
+            seen_at = seen_at.replace(tzinfo=timezone.utc)
+        return seen_at.timestamp() + self.offline_timeout
+
+    def _schedule(self, device_id, deadline: float) -> None:
+        self._scheduled[device_id] = deadline
+        heapq.heappush(self._deadlines, (deadline, next(self._seq), device_id))
+
+    def expire(self, now: Optional[float] = None) -> List:
+        """
+        取出已超过离线截止时间的设备，并从在线集合中移除
+        只处理堆顶已到期的条目；期间收到过消息的设备按最新在线时间重新排期
+        """
+        now = time.time() if now is None else now
+        expired = []
+        while self._deadlines and self._deadlines[0][0] <= now:
+            deadline, _, device_id = heapq.heappop(self._deadlines)
+            if self._scheduled.get(device_id) != deadline:
+                continue
+            actual = self._deadline(self._online.get(device_id))
+            if actual > now:
+                self._schedule(device_id, actual)
+                self.rescheduled += 1
+                continue
+            # 保留 _dirty 中的最近在线时间，由下次 flush 写入
+            del self._scheduled[device_id]
+            self._online.pop(device_id, None)
+            expired.append(device_id)
+        self.expired += len(expired)
+        return expired
+
+    async def apply_offline(self, db: AsyncSession, device_ids: List) -> None:
+        """
+        用一条UPDATE将到期设备标记为离线
+        只更新最近在线时间确实已超时的行，避免覆盖在此期间重新上线的设备
+        """
+        if not device_ids:
+            return
+        cutoff = datetime.utcnow() - timedelta(seconds=self.offline_timeout)
+        await db.execute(
+            update(Device)
+            .where(Device.id.in_(device_ids))
+            .where(Device.status == "online")
+            .where(or_(Device.last_online_at.is_(None), Device.last_online_at <= cutoff))
+            .values(status="offline")
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+    async def flush(self, db: AsyncSession) -> int:
+        """将累积的最近在线时间用一条UPDATE批量写入数据库"""
+        if not self._dirty:
+            return 0
+        pending, self._dirty = self._dirty, {}
+        ids: List = list(pending.keys())
+        try:
+            await db.execute(
+                text(
+                    "UPDATE devices AS d SET last_online_at = v.seen_at "
+                    "FROM unnest(CAST(:ids AS uuid[]), CAST(:seen AS timestamptz[])) AS v(id, seen_at) "
+                    "WHERE d.id = v.id"
+                ),
+                {"ids": ids, "seen": [pending[i] for i in ids]}
+            )
+            await db.commit()
+        except Exception:
+            # 写入失败，放回待刷新队列（保留更新的时间）
+            for device_id, seen_at in pending.items():
+                self._dirty.setdefault(device_id, seen_at)
+            raise
+        self.flushed_rows += len(ids)
+        return len(ids)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "online": len(self._online),
+            "pending": len(self._dirty),
+            "scheduled": len(self._deadlines),
+            "expired": self.expired,
+            "rescheduled": self.rescheduled,
+            "immediate_writes": self.immediate_writes,
+            "coalesced_touches": self.coalesced_touches,
+            "flushed_rows": self.flushed_rows,
+        }
+
+
+# 全局在线状态跟踪实例
+presence_tracker = PresenceTracker(offline_timeout=settings.DEVICE_OFFLINE_TIMEOUT)
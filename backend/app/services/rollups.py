@@ -0,0 +1,177 @@
+"""
+设备指标降采样
+写入原始指标时同步维护 1m/5m/1h 粒度的 min/max/avg/count/last；
+查询长时间范围时按点数预算选择合适的粒度，避免读取大量原始数据
+"""
+from typing import List, Dict, Any, Tuple, Iterable, Optional
+from datetime import datetime, timedelta
+import logging
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete, case, func, or_, desc
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.models.monitoring import DeviceMetricRollup, ROLLUP_RESOLUTIONS
+
+logger = logging.getLogger(__name__)
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def bucket_start(ts: datetime, seconds: int) -> datetime:
+    """时间点所在桶的起点（naive UTC）"""
+    ts = ts.replace(tzinfo=None, microsecond=0)
+    offset = int((ts - _EPOCH).total_seconds()) % seconds
+    return ts - timedelta(seconds=offset)
+
+
+def escape_like(value: str) -> str:
+    """转义 LIKE 模式中的通配符（配合 escape="\\" 使用）"""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def choose_resolution(start_time: datetime, end_time: datetime, max_points: int) -> str:
+    """选择桶数量不超过 max_points 的最细粒度；范围过大时使用最粗粒度"""
+    span = max((end_time - start_time).total_seconds(), 0)
+    for name, seconds in sorted(ROLLUP_RESOLUTIONS.items(), key=lambda item: item[1]):
+        if span / seconds <= max_points:
+            return name
+    return max(ROLLUP_RESOLUTIONS, key=ROLLUP_RESOLUTIONS.get)
+
+
+def metric_samples(metric_type: str, metrics: Dict[str, Any]) -> Iterable[Tuple[str, float]]:
+    """
+    从 device_metrics 记录中提取数值采样
+    {'value': v} 形式按 metric_type 命名，其余数值字段命名为 metric_type.字段名
+    """
+    for key, value in metrics.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        yield (metric_type if key == "value" else f"{metric_type}.{key}"), float(value)
+
+
+class RollupAccumulator:
+    """在内存中预聚合一批采样，每个 (设备, 粒度, 指标, 桶) 只生成一行 UPSERT"""
+
+    def __init__(self):
+        self._rows: Dict[tuple, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, device_id, metric_name: str, value: float, ts: datetime) -> None:
+        for resolution, seconds in ROLLUP_RESOLUTIONS.items():
+            key = (device_id, resolution, metric_name, bucket_start(ts, seconds))
+            row = self._rows.get(key)
+            if row is None:
+                self._rows[key] = {
+                    "device_id": device_id,
+                    "resolution": resolution,
+                    "metric_name": metric_name,
+                    "bucket": key[3],
+                    "min_value": value,
+                    "max_value": value,
+                    "sum_value": value,
+                    "sample_count": 1,
+                    "last_value": value,
+                    "last_at": ts,
+                }
+                continue
+            row["min_value"] = min(row["min_value"], value)
+            row["max_value"] = max(row["max_value"], value)
+            row["sum_value"] += value
+            row["sample_count"] += 1
+            if ts >= row["last_at"]:
+                row["last_value"] = value
+                row["last_at"] = ts
+
+    def rows(self) -> List[Dict[str, Any]]:
+        # 固定顺序写入，减少并发批次之间的行锁死锁
+        return [self._rows[key] for key in sorted(self._rows, key=lambda k: (str(k[0]), k[1], k[2], k[3]))]
+
+
+# asyncpg 单条语句最多 32767 个绑定参数；多行 UPSERT 按列数分块，留出余量
+MAX_BIND_PARAMS = 30000
+ROLLUP_COLUMNS = len(DeviceMetricRollup.__table__.columns)
+UPSERT_CHUNK_ROWS = MAX_BIND_PARAMS // ROLLUP_COLUMNS
+
+
+def upsert_chunks(rows: List[Dict[str, Any]], chunk_rows: int = UPSERT_CHUNK_ROWS) -> Iterable[List[Dict[str, Any]]]:
+    """按块拆分降采样行，保持 rows() 的固定顺序"""
+    for start in range(0, len(rows), chunk_rows):
+        yield rows[start:start + chunk_rows]
+
+
+def build_upsert(rows: List[Dict[str, Any]]):
+    """多行 UPSERT：与已有的桶合并 min/max/sum/count/last"""
+    stmt = pg_insert(DeviceMetricRollup).values(rows)
+    excluded = stmt.excluded
+    return stmt.on_conflict_do_update(
+        index_elements=["device_id", "resolution", "metric_name", "bucket"],
+        set_={
+            "min_value": func.least(DeviceMetricRollup.min_value, excluded.min_value),
+            "max_value": func.greatest(DeviceMetricRollup.max_value, excluded.max_value),
+            "sum_value": DeviceMetricRollup.sum_value + excluded.sum_value,
+            "sample_count": DeviceMetricRollup.sample_count + excluded.sample_count,
+            "last_value": case(
+                (excluded.last_at >= DeviceMetricRollup.last_at, excluded.last_value),
+                else_=DeviceMetricRollup.last_value
+            ),
+            "last_at": func.greatest(DeviceMetricRollup.last_at, excluded.last_at),
+        }
+    )
+
+
+class RollupService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def apply(self, accumulator: RollupAccumulator) -> int:
+        """将预聚合结果合并进降采样表（不提交事务，由调用方与原始数据一起提交）"""
+        rows = accumulator.rows()
+        for chunk in upsert_chunks(rows):
+            await self.db.execute(build_upsert(chunk))
+        return len(rows)
+
+    async def get_rollups(
+        self,
+        device_id: str,
+        resolution: str,
+        start_time: datetime,
+        end_time: datetime,
+        metric_type: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> List[DeviceMetricRollup]:
+        """按时间倒序读取降采样数据"""
+        query = (
+            select(DeviceMetricRollup)
+            .filter(DeviceMetricRollup.device_id == device_id)
+            .filter(DeviceMetricRollup.resolution == resolution)
+            .filter(DeviceMetricRollup.bucket >= bucket_start(start_time, ROLLUP_RESOLUTIONS[resolution]))
+            .filter(DeviceMetricRollup.bucket <= end_time)
+        )
+        if metric_type:
+            query = query.filter(or_(
+                DeviceMetricRollup.metric_name == metric_type,
+                DeviceMetricRollup.metric_name.like(f"{escape_like(metric_type)}.%", escape="\\")
+            ))
+        query = query.order_by(desc(DeviceMetricRollup.bucket), DeviceMetricRollup.metric_name)
+        if limit:
+            query = query.limit(limit)
+        result = await self.db.execute(query)
+        return list(result.scalars().all())
+
+    async def prune(self, retention_days: Dict[str, int], now: Optional[datetime] = None) -> Dict[str, int]:
+        """按粒度删除超过保留期的降采样数据并提交，返回各粒度删除的行数"""
+        now = now or datetime.utcnow()
+        deleted = {}
+        for resolution in ROLLUP_RESOLUTIONS:
+            days = retention_days.get(resolution, 0)
+            if days <= 0:
+                continue
+            result = await self.db.execute(
+                delete(DeviceMetricRollup)
+                .where(DeviceMetricRollup.resolution == resolution)
+                .where(DeviceMetricRollup.bucket < now - timedelta(days=days))
+            )
+            deleted[resolution] = result.rowcount or 0
+        await self.db.commit()
+        return deleted
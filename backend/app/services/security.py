@@ -1,6 +1,7 @@
 from typing import Optional, List, Dict, Any
+import asyncio
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, or_, desc, func
+from sqlalchemy import select, and_, or_, desc, func, JSON
 from app.models.security import (
     SecurityEvent, AccessControlPolicy,
     SecurityAuditLog, BlacklistedIP
@@ -8,22 +9,39 @@ from app.models.security import (
 from app.schemas.security import (
     SecurityEventCreate, AccessControlPolicyCreate,
     AccessControlPolicyUpdate, SecurityAuditLogCreate,
-    BlacklistedIPCreate
+    BlacklistedIPCreate, SecurityEvent as SecurityEventSchema
 )
+from app.core.cache import TTLCache, MISSING
+from app.services.ip_blacklist import ip_blacklist
+from app.services.audit_sink import audit_sink
+from app.core.pagination import Cursor, apply_keyset
+from app.core.config import settings
 from datetime import datetime, timedelta
+import uuid
+
+SEVERITY_LEVELS = ("low", "medium", "high", "critical")
+
+# 安全统计快照缓存（仪表盘轮询在TTL内直接返回）
+security_stats_cache = TTLCache(maxsize=1, ttl=settings.SECURITY_STATS_CACHE_TTL)
+_security_stats_lock = asyncio.Lock()
 
 class SecurityService:
     def __init__(self, db: AsyncSession):
         self.db = db
 
     # 安全事件管理
-    async def create_event(self, event_in: SecurityEventCreate) -> SecurityEvent:
-        """创建安全事件"""
-        event = SecurityEvent(**event_in.model_dump())
-        self.db.add(event)
-        await self.db.commit()
-        await self.db.refresh(event)
-        return event
+    async def create_event(self, event_in: SecurityEventCreate, sync: Optional[bool] = None) -> SecurityEvent:
+        """
+        创建安全事件（放入批量写入队列，不在当前请求中提交）
+
+        Args:
+            sync: 是否立即写库；默认仅 critical 级别的事件立即写入（关联设备的事件总是立即写入，设备不存在时在当前请求中报错）
+        """
+        row = {**event_in.model_dump(), "id": uuid.uuid4(), "handled": False, "created_at": datetime.utcnow()}
+        if sync is None:
+            sync = row["severity"] == "critical"
+        await audit_sink.submit(SecurityEvent, row, sync=sync)
+        return SecurityEvent(**row)
 
     async def get_event(self, event_id: str) -> Optional[SecurityEvent]:
         """获取安全事件"""
@@ -37,15 +55,19 @@ class SecurityService:
         skip: int = 0,
         limit: int = 100,
         severity: Optional[str] = None,
-        handled: Optional[bool] = None
+        handled: Optional[bool] = None,
+        cursor: Optional[Cursor] = None
     ) -> List[SecurityEvent]:
-        """获取安全事件列表"""
+        """获取安全事件列表（传入游标时从游标位置继续读取，忽略 skip）"""
         query = select(SecurityEvent)
         if severity:
             query = query.filter(SecurityEvent.severity == severity)
         if handled is not None:
             query = query.filter(SecurityEvent.handled == handled)
-        query = query.order_by(desc(SecurityEvent.created_at)).offset(skip).limit(limit)
+        query = apply_keyset(query, SecurityEvent.created_at, SecurityEvent.id, cursor)
+        if cursor is None and skip:
+            query = query.offset(skip)
+        query = query.limit(limit)
         result = await self.db.execute(query)
         return result.scalars().all()
 
@@ -110,14 +132,17 @@ class SecurityService:
 
     # 审计日志管理
     async def create_audit_log(
-        self, log_in: SecurityAuditLogCreate
+        self, log_in: SecurityAuditLogCreate, sync: bool = False
     ) -> SecurityAuditLog:
-        """创建审计日志"""
-        log = SecurityAuditLog(**log_in.model_dump())
-        self.db.add(log)
-        await self.db.commit()
-        await self.db.refresh(log)
-        return log
+        """
+        创建审计日志（放入批量写入队列，不在当前请求中提交）
+
+        Args:
+            sync: 是否立即写库（用于必须在响应前落库的关键记录）
+        """
+        row = {**log_in.model_dump(), "id": uuid.uuid4(), "created_at": datetime.utcnow()}
+        await audit_sink.submit(SecurityAuditLog, row, sync=sync)
+        return SecurityAuditLog(**row)
 
     async def get_audit_logs(
         self,
@@ -125,9 +150,10 @@ class SecurityService:
         limit: int = 100,
         log_type: Optional[str] = None,
         start_time: Optional[datetime] = None,
-        end_time: Optional[datetime] = None
+        end_time: Optional[datetime] = None,
+        cursor: Optional[Cursor] = None
     ) -> List[SecurityAuditLog]:
-        """获取审计日志"""
+        """获取审计日志（传入游标时从游标位置继续读取，忽略 skip）"""
         query = select(SecurityAuditLog)
         if log_type:
             query = query.filter(SecurityAuditLog.log_type == log_type)
@@ -135,7 +161,10 @@ class SecurityService:
             query = query.filter(SecurityAuditLog.created_at >= start_time)
         if end_time:
             query = query.filter(SecurityAuditLog.created_at <= end_time)
-        query = query.order_by(desc(SecurityAuditLog.created_at)).offset(skip).limit(limit)
+        query = apply_keyset(query, SecurityAuditLog.created_at, SecurityAuditLog.id, cursor)
+        if cursor is None and skip:
+            query = query.offset(skip)
+        query = query.limit(limit)
         result = await self.db.execute(query)
         return result.scalars().all()
 
@@ -143,15 +172,20 @@ class SecurityService:
     async def add_to_blacklist(
         self, blacklist_in: BlacklistedIPCreate
     ) -> BlacklistedIP:
-        """添加IP到黑名单"""
-        blacklist = BlacklistedIP(**blacklist_in.model_dump())
+        """添加IP或CIDR网段到黑名单"""
+        data = blacklist_in.model_dump()
+        # INET列同时支持单个地址和网段，统一以字符串写入
+        data["ip_address"] = str(data["ip_address"])
+        blacklist = BlacklistedIP(**data)
         self.db.add(blacklist)
         await self.db.commit()
         await self.db.refresh(blacklist)
+        ip_blacklist.add(data["ip_address"], blacklist.expiry_at)
+        await ip_blacklist.publish("add", data["ip_address"], blacklist.expiry_at)
         return blacklist
 
     async def remove_from_blacklist(self, ip: str) -> None:
-        """从黑名单中移除IP"""
+        """从黑名单中移除IP或CIDR网段"""
         result = await self.db.execute(
             select(BlacklistedIP).filter(BlacklistedIP.ip_address == ip)
         )
@@ -159,89 +193,96 @@ class SecurityService:
         if blacklist:
             await self.db.delete(blacklist)
             await self.db.commit()
+            ip_blacklist.remove(ip)
+            await ip_blacklist.publish("remove", ip)
 
     async def is_ip_blacklisted(self, ip: str) -> bool:
-        """检查IP是否在黑名单中"""
-        result = await self.db.execute(
-            select(BlacklistedIP).filter(
-                and_(
-                    BlacklistedIP.ip_address == ip,
-                    or_(
-                        BlacklistedIP.expiry_at.is_(None),
-                        BlacklistedIP.expiry_at > datetime.utcnow()
-                    )
-                )
-            )
-        )
-        return result.scalar_one_or_none() is not None
+        """检查IP是否在黑名单中（包括所在网段被拉黑），使用内存前缀树匹配"""
+        await ip_blacklist.ensure_loaded(self.db)
+        return ip_blacklist.is_blacklisted(ip)
 
     # 安全统计
     async def get_security_stats(self) -> Dict[str, Any]:
-        """获取安全统计信息"""
-        # 获取事件总数和未处理事件数
-        total_events_query = await self.db.execute(select(SecurityEvent))
-        total_events = total_events_query.scalars().all()
-        total_count = len(total_events)
-        unhandled_count = len([e for e in total_events if not e.handled])
-
-        # 获取严重程度分布
-        severity_dist = {}
-        for severity in ["low", "medium", "high", "critical"]:
-            count = await self.db.execute(
-                select(SecurityEvent).filter(SecurityEvent.severity == severity)
-            )
-            severity_dist[severity] = len(count.scalars().all())
-
-        # 获取24小时内的事件数量
-        recent_events_query = await self.db.execute(
-            select(SecurityEvent)
-            .filter(SecurityEvent.created_at >= datetime.utcnow() - timedelta(days=1))
-        )
-        recent_events_count = len(recent_events_query.scalars().all())
+        """获取安全统计信息（短时间内重复调用返回缓存的快照）"""
+        if settings.SECURITY_STATS_CACHE_TTL <= 0:
+            return await self._compute_security_stats()
+        stats = security_stats_cache.get("stats")
+        if stats is not MISSING:
+            return stats
+        # 缓存失效时只让一个请求查询数据库，其余请求等待结果
+        async with _security_stats_lock:
+            stats = security_stats_cache.get("stats")
+            if stats is MISSING:
+                stats = await self._compute_security_stats()
+                security_stats_cache.set("stats", stats)
+        return stats
 
-        # 获取最近5个事件
-        recent_events = await self.db.execute(
-            select(SecurityEvent)
-            .order_by(desc(SecurityEvent.created_at))
-            .limit(5)
-        )
+    async def _compute_security_stats(self) -> Dict[str, Any]:
+        """用聚合查询计算安全统计（一次聚合查询 + 一次最近事件查询）"""
+        now = datetime.utcnow()
 
-        # 获取活跃黑名单数量和即将过期的黑名单数量
-        active_blacklist = await self.db.execute(
-            select(BlacklistedIP).filter(
-                or_(
-                    BlacklistedIP.expiry_at.is_(None),
-                    BlacklistedIP.expiry_at > datetime.utcnow()
-                )
-            )
+        # 黑名单和审计日志统计作为标量子查询，与事件统计合并为一条SQL
+        active_blacklist = (
+            select(func.count())
+            .select_from(BlacklistedIP)
+            .filter(or_(BlacklistedIP.expiry_at.is_(None), BlacklistedIP.expiry_at > now))
+            .scalar_subquery()
         )
-        expiring_soon = await self.db.execute(
-            select(BlacklistedIP).filter(
+        expiring_blacklist = (
+            select(func.count())
+            .select_from(BlacklistedIP)
+            .filter(
                 and_(
                     BlacklistedIP.expiry_at.isnot(None),
-                    BlacklistedIP.expiry_at <= datetime.utcnow() + timedelta(days=7),
-                    BlacklistedIP.expiry_at > datetime.utcnow()
+                    BlacklistedIP.expiry_at <= now + timedelta(days=7),
+                    BlacklistedIP.expiry_at > now
                 )
             )
+            .scalar_subquery()
+        )
+        audit_counts = (
+            select(SecurityAuditLog.log_type, func.count().label("count"))
+            .filter(SecurityAuditLog.created_at >= now - timedelta(days=7))
+            .group_by(SecurityAuditLog.log_type)
+            .subquery()
         )
+        audit_log_types = (
+            select(func.json_object_agg(audit_counts.c.log_type, audit_counts.c.count, type_=JSON))
+            .scalar_subquery()
+        )
+
+        result = await self.db.execute(
+            select(
+                func.count().label("total"),
+                func.count().filter(SecurityEvent.handled.isnot(True)).label("unhandled"),
+                func.count().filter(SecurityEvent.created_at >= now - timedelta(days=1)).label("recent_24h"),
+                *[
+                    func.count().filter(SecurityEvent.severity == severity).label(severity)
+                    for severity in SEVERITY_LEVELS
+                ],
+                active_blacklist.label("active_blacklist"),
+                expiring_blacklist.label("expiring_blacklist"),
+                audit_log_types.label("audit_log_types"),
+            ).select_from(SecurityEvent)
+        )
+        row = result.one()
 
-        # 获取审计日志统计
-        audit_logs_query = await self.db.execute(
-            select(SecurityAuditLog)
-            .filter(SecurityAuditLog.created_at >= datetime.utcnow() - timedelta(days=7))
+        # 获取最近5个事件（转换为schema对象：统计快照在请求之间共享，不能持有会话已关闭的ORM实例）
+        recent_events = await self.db.execute(
+            select(SecurityEvent)
+            .order_by(desc(SecurityEvent.created_at))
+            .limit(5)
         )
-        audit_logs = audit_logs_query.scalars().all()
-        audit_log_types = {}
-        for log in audit_logs:
-            audit_log_types[log.log_type] = audit_log_types.get(log.log_type, 0) + 1
 
         return {
-            "total_events": total_count,
-            "unhandled_events": unhandled_count,
-            "severity_distribution": severity_dist,
-            "recent_events": recent_events.scalars().all(),
-            "recent_24h_events": recent_events_count,
-            "active_blacklist_count": len(active_blacklist.scalars().all()),
-            "expiring_blacklist_count": len(expiring_soon.scalars().all()),
-            "audit_log_types_7d": audit_log_types
+            "total_events": row.total,
+            "unhandled_events": row.unhandled,
+            "severity_distribution": {severity: row._mapping[severity] for severity in SEVERITY_LEVELS},
+            "recent_events": [
+                SecurityEventSchema.model_validate(event) for event in recent_events.scalars().all()
+            ],
+            "recent_24h_events": row.recent_24h,
+            "active_blacklist_count": row.active_blacklist,
+            "expiring_blacklist_count": row.expiring_blacklist,
+            "audit_log_types_7d": row.audit_log_types or {}
         }
\ No newline at end of file
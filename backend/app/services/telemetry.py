@@ -0,0 +1,226 @@
+"""
+设备遥测批量写入服务
+将一批MQTT消息按设备分组，在同一个会话中完成设备查询、状态更新和指标写入
+"""
+from typing import List, Dict, Any, Tuple, Iterable
+from datetime import datetime, timezone
+import json
+import logging
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import update, insert, select, func
+from app.models.device import Device
+from app.models.monitoring import (
+    DeviceMetrics, DeviceTelemetry,
+    TELEMETRY_NUMERIC_COLUMNS, TELEMETRY_TEXT_COLUMNS
+)
+from app.core.config import settings
+from app.core.id import generate_id
+from app.services.presence import presence_tracker
+from app.services.device import DeviceService
+from app.services.rollups import RollupAccumulator, RollupService, metric_samples
+from app.services.alert_engine import alert_rule_index, AlertSample
+from app.services.alert_state import alert_state_tracker
+
+logger = logging.getLogger(__name__)
+
+# 需要处理的消息类型（devices/{device_id}/{message_type}）
+HANDLED_MESSAGE_TYPES = ("status", "heartbeat", "sensor")
+
+
+def parse_topic(topic: str) -> Tuple[str, str]:
+    """
+    解析主题，返回 (device_id, message_type)
+    非 devices/ 前缀的主题返回 (None, None)
+    """
+    topic_parts = topic.split('/')
+    if len(topic_parts) >= 2 and topic_parts[0] == 'devices':
+        message_type = topic_parts[2] if len(topic_parts) > 2 else None
+        return topic_parts[1], message_type
+    return None, None
+
+
+def extract_sensor_metrics(sensor_data: Dict[str, Any]) -> Dict[str, Any]:
+    """提取温度、湿度等指标（支持设备发送的所有字段）"""
+    metrics = {}
+    # 基础传感器数据
+    for name in ("temperature", "humidity", "voltage", "battery", "air_quality"):
+        if name in sensor_data:
+            metrics[name] = sensor_data[name]
+    # 状态信息（如果有）
+    status = sensor_data.get('status')
+    if isinstance(status, dict):
+        if 'wifi' in status:
+            metrics['wifi_status'] = status['wifi']
+        if 'mqtt' in status:
+            metrics['mqtt_status'] = status['mqtt']
+        if 'uptime' in status:
+            metrics['uptime'] = status['uptime']
+    return metrics
+
+
+def build_telemetry_columns(metrics: Dict[str, Any]) -> Dict[str, Any]:
+    """将提取出的指标转换为紧凑遥测表的列值，无法转换的值忽略"""
+    columns = {}
+    for name in TELEMETRY_NUMERIC_COLUMNS:
+        value = metrics.get(name)
+        if value is None or isinstance(value, bool):
+            continue
+        try:
+            columns[name] = int(value) if name == "uptime" else float(value)
+        except (TypeError, ValueError):
+            logger.debug(f"[MQTT] Ignoring non-numeric {name}: {value!r}")
+    for name in TELEMETRY_TEXT_COLUMNS:
+        value = metrics.get(name)
+        if value is not None:
+            columns[name] = str(value)[:20]
+    return columns
+
+
+class TelemetryService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def ingest_batch(self, messages: Iterable[Tuple[str, bytes]]) -> Dict[str, int]:
+        """
+        批量处理MQTT消息
+
+        Args:
+            messages: (topic, payload) 列表
+
+        Returns:
+            处理统计：messages / devices / unknown_devices / metrics（写入行数） / status_changes / rollups（降采样行数） / alerts
+        """
+        # 按设备分组
+        grouped: Dict[str, List[Tuple[str, str]]] = {}
+        for topic, payload in messages:
+            device_id, message_type = parse_topic(topic)
+            if device_id is None or message_type not in HANDLED_MESSAGE_TYPES:
+                logger.debug(f"[MQTT] Unhandled message type: {message_type}")
+                continue
+            try:
+                text = payload.decode() if isinstance(payload, (bytes, bytearray)) else (payload or "")
+            except UnicodeDecodeError as e:
+                logger.error(f"[MQTT] Failed to decode message payload from {topic}: {e}")
+                continue
+            grouped.setdefault(device_id, []).append((message_type, text))
+
+        stats = {
+            "messages": sum(len(v) for v in grouped.values()),
+            "devices": 0,
+            "unknown_devices": 0,
+            "metrics": 0,
+            "status_changes": 0,
+            "rollups": 0,
+            "alerts": 0,
+        }
+        if not grouped:
+            return stats
+
+        # 解析设备标识（缓存未命中的设备一次查询）
+        identities = await DeviceService(self.db).resolve_identities(grouped.keys())
+        devices = {device_id: identity.id for device_id, identity in identities.items()}
+        unknown = set(grouped) - set(devices)
+        if unknown:
+            logger.warning(f"[MQTT] {len(unknown)} device(s) not found in database: {sorted(unknown)[:10]}")
+        stats["devices"] = len(devices)
+        stats["unknown_devices"] = len(unknown)
+        if not devices:
+            return stats
+
+        now = datetime.utcnow()
+        compact = settings.TELEMETRY_STORAGE_MODE == "compact"
+        metric_rows = []
+        rollups = RollupAccumulator()
+        # 待评估告警的采样，以及每个采样对应的指标行下标
+        samples: List[AlertSample] = []
+        sample_rows: List[int] = []
+        sample_ts = now.replace(tzinfo=timezone.utc).timestamp()
+        await alert_rule_index.ensure_loaded(self.db)
+        await alert_state_tracker.ensure_loaded(self.db)
+        for device_id, device_uuid in devices.items():
+            for message_type, text in grouped[device_id]:
+                if message_type != 'sensor':
+                    continue
+                try:
+                    sensor_data = json.loads(text) if text else {}
+                except json.JSONDecodeError as e:
+                    logger.error(f"[MQTT] Failed to parse JSON payload from {device_id}: {e}, payload: {text[:200]}")
+                    continue
+                if not isinstance(sensor_data, dict):
+                    continue
+                metrics = extract_sensor_metrics(sensor_data)
+                if compact:
+                    # 每个采样一行
+                    columns = build_telemetry_columns(metrics)
+                    if columns:
+                        metric_rows.append({"device_id": device_uuid, "timestamp": now, **columns})
+                        for name in TELEMETRY_NUMERIC_COLUMNS:
+                            if name in columns:
+                                rollups.add(device_uuid, name, float(columns[name]), now)
+                                samples.append(AlertSample(device_uuid, name, columns[name], sample_ts))
+                                sample_rows.append(len(metric_rows) - 1)
+                        # 文本指标不做降采样，但与 legacy 模式一样参与告警评估
+                        for name in TELEMETRY_TEXT_COLUMNS:
+                            if name in columns:
+                                samples.append(AlertSample(device_uuid, name, metrics[name], sample_ts))
+                                sample_rows.append(len(metric_rows) - 1)
+                    continue
+                for metric_name, metric_value in metrics.items():
+                    for rollup_name, rollup_value in metric_samples(metric_name, {'value': metric_value}):
+                        rollups.add(device_uuid, rollup_name, rollup_value, now)
+                    samples.append(AlertSample(device_uuid, metric_name, metric_value, sample_ts))
+                    sample_rows.append(len(metric_rows))
+                    metric_rows.append({
+                        "id": generate_id(),
+                        "device_id": device_uuid,
+                        "metric_type": metric_name,
+                        "metrics": {'value': metric_value},
+                        "timestamp": now,
+                    })
+
+        # 整批评估告警规则（批次较大时向量化）
+        triggered = alert_rule_index.evaluate_samples(samples)
+
+        # 只有状态发生变化（离线 -> 在线）的设备立即写库，
+        # 其余设备的在线时间由 presence_tracker 周期性批量刷新
+        changed = [device_uuid for device_uuid in devices.values() if presence_tracker.touch(device_uuid, now)]
+        alert_batch = None
+        try:
+            if changed:
+                await self.db.execute(
+                    update(Device)
+                    .where(Device.id.in_(changed))
+                    .values(status="online", last_online_at=now)
+                )
+            if triggered and compact:
+                # 告警需要引用遥测行ID，预先从序列中分配
+                ids = await self.db.execute(
+                    select(func.nextval("device_telemetry_id_seq"))
+                    .select_from(func.generate_series(1, len(metric_rows)))
+                )
+                for row, row_id in zip(metric_rows, ids.scalars()):
+                    row["id"] = row_id
+            # 多行INSERT写入指标
+            if metric_rows:
+                await self.db.execute(insert(DeviceTelemetry if compact else DeviceMetrics), metric_rows)
+            # 降采样数据与原始数据在同一事务中更新
+            stats["rollups"] = await RollupService(self.db).apply(rollups)
+            # 同一 (设备, 规则) 只保留一条未恢复告警，重复触发只在内存中计数
+            def alert_source(sample_index: int) -> Dict[str, Any]:
+                row = metric_rows[sample_rows[sample_index]]
+                return {"telemetry_id": row["id"]} if compact else {"metrics_id": row["id"]}
+
+            alert_batch = alert_state_tracker.apply(samples, triggered, alert_source, now)
+            await alert_state_tracker.persist(self.db, alert_batch)
+            stats["alerts"] = len(alert_batch.rows)
+            await self.db.commit()
+        except Exception:
+            presence_tracker.mark_offline(changed)
+            if alert_batch is not None:
+                alert_state_tracker.discard(alert_batch)
+            raise
+        alert_state_tracker.commit(alert_batch)
+
+        stats["metrics"] = len(metric_rows)
+        stats["status_changes"] = len(changed)
+        return stats
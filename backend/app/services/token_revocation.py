@@ -0,0 +1,196 @@
+"""
+令牌吊销
+按令牌ID（jti）记录已吊销的令牌，Redis中每条记录的过期时间等于令牌剩余有效期；
+本进程维护一份内存镜像，认证依赖只做一次字典查找，不访问Redis或数据库。
+另外支持按用户吊销：用户的吊销时间点之前签发的令牌全部失效（用于停用被盗用的账号）。
+其他实例的吊销通过Redis发布/订阅同步；Redis不可用时只在本实例生效
+"""
+from typing import Any, Dict, List
+import json
+import logging
+import time
+import uuid
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+TOKEN_KEY_PREFIX = "auth:revoked_token:"
+USER_KEY_PREFIX = "auth:revoked_user:"
+
+
+class TokenRevocationStore:
+    """已吊销令牌（Redis + 本地镜像）"""
+
+    def __init__(self):
+        # jti -> 令牌过期时间（Unix时间戳），过期后记录无需保留
+        self._tokens: Dict[str, float] = {}
+        # 用户名 -> (吊销时间点, 记录过期时间)
+        self._users: Dict[str, tuple] = {}
+        # 用于Redis同步消息的实例标识，忽略自己发布的消息
+        self.instance_id = uuid.uuid4().hex
+        # Redis客户端（由 app.core.events 在连接成功后设置），None时只在本实例生效
+        self.redis = None
+        # 本地记录数超过该值时清除已过期的记录（均摊到每次吊销）
+        self._purge_at = 1024
+        # 计数器
+        self.checks = 0
+        self.rejected = 0
+        self.revoked = 0
+        self.sync_received = 0
+
+    def is_revoked(self, payload: Dict[str, Any]) -> bool:
+        """检查已解码的令牌是否被吊销（O(1)）"""
+        self.checks += 1
+        now = time.time()
+        jti = payload.get("jti")
+        if jti is not None:
+            expires_at = self._tokens.get(jti)
+            if expires_at is not None:
+                if expires_at > now:
+                    self.rejected += 1
+                    return True
+                del self._tokens[jti]
+        username = payload.get("sub")
+        entry = self._users.get(username) if username is not None else None
+        if entry is not None:
+            revoked_at, expires_at = entry
+            if expires_at <= now:
+                del self._users[username]
+            elif payload.get("iat", 0) <= revoked_at:
+                # 没有 iat 的旧令牌视为在吊销之前签发
+                self.rejected += 1
+                return True
+        return False
+
+    async def revoke_token(self, payload: Dict[str, Any]) -> bool:
+        """
+        吊销单个令牌（按 jti），记录保留到令牌过期
+
+        Returns:
+            本次调用是否完成吊销；令牌已被吊销（包括其他实例抢先吊销）时返回 False，
+            刷新令牌轮换时据此保证每个刷新令牌只能使用一次
+        """
+        jti = payload.get("jti")
+        expires_at = float(payload.get("exp", 0))
+        if jti is None or expires_at <= time.time():
+            return False
+        if jti in self._tokens:
+            return False
+        self._add_token(jti, expires_at)
+        if self.redis is not None:
+            try:
+                stored = await self.redis.set(
+                    TOKEN_KEY_PREFIX + jti,
+                    json.dumps({"value": expires_at, "exp": expires_at}),
+                    ex=self._ttl(expires_at),
+                    nx=True
+                )
+                if not stored:
+                    return False
+                await self._publish({"kind": "token", "id": jti, "exp": expires_at})
+            except Exception as e:
+                logger.warning(f"Failed to store token revocation in Redis: {e}")
+        self.revoked += 1
+        return True
+
+    async def revoke_user(self, username: str) -> None:
+        """吊销用户在此之前签发的全部令牌，记录保留到最长的令牌（刷新令牌）过期"""
+        revoked_at = time.time()
+        expires_at = revoked_at + settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400
+        self._users[username] = (revoked_at, expires_at)
+        self.revoked += 1
+        if self.redis is not None:
+            try:
+                await self.redis.set(
+                    USER_KEY_PREFIX + username,
+                    json.dumps({"value": revoked_at, "exp": expires_at}),
+                    ex=self._ttl(expires_at)
+                )
+                await self._publish({"kind": "user", "id": username, "at": revoked_at, "exp": expires_at})
+            except Exception as e:
+                logger.warning(f"Failed to store user token revocation in Redis: {e}")
+
+    def _add_token(self, jti: str, expires_at: float) -> None:
+        self._tokens[jti] = expires_at
+        if len(self._tokens) > self._purge_at:
+            self.purge_expired()
+            self._purge_at = max(1024, 2 * len(self._tokens))
+
+    @staticmethod
+    def _ttl(expires_at: float) -> int:
+        return max(1, int(expires_at - time.time()) + 1)
+
+    async def _publish(self, message: Dict[str, Any]) -> None:
+        await self.redis.publish(
+            settings.TOKEN_REVOCATION_CHANNEL,
+            json.dumps({"origin": self.instance_id, **message})
+        )
+
+    async def load(self) -> None:
+        """从Redis加载未过期的吊销记录"""
+        if self.redis is None:
+            return
+        tokens: Dict[str, float] = {}
+        users: Dict[str, tuple] = {}
+        for prefix in (TOKEN_KEY_PREFIX, USER_KEY_PREFIX):
+            keys: List = [key async for key in self.redis.scan_iter(match=f"{prefix}*", count=1000)]
+            for start in range(0, len(keys), 1000):
+                chunk = keys[start:start + 1000]
+                for key, raw in zip(chunk, await self.redis.mget(chunk)):
+                    if raw is None:
+                        continue
+                    key = key.decode() if isinstance(key, bytes) else key
+                    try:
+                        record = json.loads(raw)
+                        if prefix == TOKEN_KEY_PREFIX:
+                            tokens[key[len(prefix):]] = float(record["exp"])
+                        else:
+                            users[key[len(prefix):]] = (float(record["value"]), float(record["exp"]))
+                    except (ValueError, KeyError, TypeError):
+                        continue
+        self._tokens = tokens
+        self._users = users
+        self._purge_at = max(1024, 2 * len(tokens))
+        logger.info(f"Loaded {len(tokens)} revoked token(s) and {len(users)} revoked user(s)")
+
+    def apply_message(self, data: Any) -> None:
+        """处理其他实例发布的吊销消息"""
+        try:
+            message = json.loads(data)
+            if message.get("origin") == self.instance_id:
+                return
+            if message["kind"] == "token":
+                self._add_token(message["id"], float(message["exp"]))
+            elif message["kind"] == "user":
+                self._users[message["id"]] = (float(message["at"]), float(message["exp"]))
+            else:
+                return
+            self.sync_received += 1
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring invalid token revocation message: {e}")
+
+    def purge_expired(self) -> int:
+        """清除已过期的吊销记录"""
+        now = time.time()
+        expired_tokens = [jti for jti, expires_at in self._tokens.items() if expires_at <= now]
+        for jti in expired_tokens:
+            del self._tokens[jti]
+        expired_users = [username for username, (_, expires_at) in self._users.items() if expires_at <= now]
+        for username in expired_users:
+            del self._users[username]
+        return len(expired_tokens) + len(expired_users)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "revoked_tokens": len(self._tokens),
+            "revoked_users": len(self._users),
+            "checks": self.checks,
+            "rejected": self.rejected,
+            "revoked": self.revoked,
+            "sync_received": self.sync_received,
+            "sync_enabled": self.redis is not None,
+        }
+
+
+# 全局令牌吊销实例
+token_revocation = TokenRevocationStore()
@@ -3,7 +3,21 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update
 from app.models.user import User, Role, UserRole
 from app.schemas.user import UserCreate, UserUpdate
-from app.core.security import get_password_hash, verify_password
+from app.core.security import get_password_hash_async, verify_password_async
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.services.token_revocation import token_revocation
+
+# 已校验用户缓存（用户名 -> schemas.User），认证依赖在稳定状态下不查询数据库
+current_user_cache = TTLCache(maxsize=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL)
+
+
+def invalidate_user_cache(*usernames: str) -> None:
+    """使用户缓存失效（用户信息变更、停用、删除后调用）"""
+    for username in usernames:
+        if username:
+            current_user_cache.pop(username)
+
 
 class UserService:
     def __init__(self, db: AsyncSession):
@@ -29,7 +43,7 @@ class UserService:
         user = User(
             username=user_in.username,
             email=user_in.email,
-            hashed_password=get_password_hash(user_in.password),
+            hashed_password=await get_password_hash_async(user_in.password),
             full_name=user_in.full_name,
             mobile=user_in.mobile
         )
@@ -40,9 +54,12 @@ class UserService:
 
     async def update(self, user: User, user_in: UserUpdate) -> User:
         """更新用户信息"""
+        old_username = user.username
         update_data = user_in.model_dump(exclude_unset=True)
+        # 修改密码或停用账号时，已签发的令牌全部失效
+        revoke_tokens = bool(update_data.get("password")) or update_data.get("is_active") is False
         if update_data.get("password"):
-            update_data["hashed_password"] = get_password_hash(update_data.pop("password"))
+            update_data["hashed_password"] = await get_password_hash_async(update_data.pop("password"))
         
         for field, value in update_data.items():
             setattr(user, field, value)
@@ -50,14 +67,24 @@ class UserService:
         self.db.add(user)
         await self.db.commit()
         await self.db.refresh(user)
+        invalidate_user_cache(old_username, user.username)
+        if revoke_tokens:
+            await token_revocation.revoke_user(old_username)
         return user
 
+    async def delete(self, user: User) -> None:
+        """删除用户"""
+        await self.db.delete(user)
+        await self.db.commit()
+        invalidate_user_cache(user.username)
+        await token_revocation.revoke_user(user.username)
+
     async def authenticate(self, username: str, password: str) -> Optional[User]:
         """用户认证"""
         user = await self.get_by_username(username)
         if not user:
             return None
-        if not verify_password(password, user.hashed_password):
+        if not await verify_password_async(password, user.hashed_password):
             return None
         return user
 
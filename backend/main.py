@@ -4,6 +4,7 @@ from app.core.config import settings
 from app.api.api_v1.api import api_router
 from app.core.events import startup_handler, shutdown_handler
 from app.core.database import check_pool_health, close_pool
+from app.core.middleware import IPBlacklistMiddleware
 import logging
 
 # 配置日志
@@ -27,8 +28,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# IP黑名单拦截（最后注册的中间件最先执行，在路由、认证和数据库会话之前拒绝黑名单IP）
+app.add_middleware(IPBlacklistMiddleware)
+
 # 注册路由
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
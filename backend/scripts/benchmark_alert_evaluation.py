@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+告警评估性能对比
+对同一批随机采样分别使用：
+  1. 原逐条评估（每条规则 if/elif 判断条件）
+  2. 规则索引逐条评估（预编译比较函数）
+  3. NumPy 向量化评估
+并检查三种方式触发的 (采样, 规则) 是否一致
+"""
+import sys
+import random
+import time
+import uuid
+from pathlib import Path
+from types import SimpleNamespace
+
+# 添加backend目录到路径
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app.services.alert_engine import AlertRuleIndex, AlertSample, np
+
+DEVICES = 2000
+METRICS = ("temperature", "humidity", "voltage", "battery", "air_quality")
+# 条件 -> 阈值范围（采样值服从 N(50, 10)，告警只在尾部触发）
+CONDITIONS = {"gt": (70, 100), "gte": (70, 100), "lt": (0, 30), "lte": (0, 30), "eq": (0, 100)}
+GLOBAL_RULES = 50
+DEVICE_RULES = 500
+BATCH_SIZES = (200, 1000, 10000)
+REPEAT = 5
+
+
+def make_rules(device_ids):
+    """随机生成全局规则和设备规则"""
+    rules = []
+    for i in range(GLOBAL_RULES + DEVICE_RULES):
+        condition = random.choice(list(CONDITIONS))
+        rules.append(SimpleNamespace(
+            id=f"rule-{i}",
+            device_id=None if i < GLOBAL_RULES else random.choice(device_ids),
+            metric_name=random.choice(METRICS),
+            condition=condition,
+            threshold=float(random.randint(*CONDITIONS[condition])),
+            severity="high",
+            message="{value} / {threshold}",
+            enabled=True,
+            priority=random.randint(0, 100),
+        ))
+    return rules
+
+
+def legacy_evaluate(value, rule):
+    """原 MonitoringService._evaluate_alert_condition 的判断方式"""
+    try:
+        if value is None:
+            return False
+        threshold = rule.threshold
+        condition = rule.condition
+        if condition == "gt":
+            return value > threshold
+        elif condition == "gte":
+            return value >= threshold
+        elif condition == "lt":
+            return value < threshold
+        elif condition == "lte":
+            return value <= threshold
+        elif condition == "eq":
+            return value == threshold
+        elif condition == "neq":
+            return value != threshold
+        else:
+            return False
+    except Exception:
+        return False
+
+
+def run_legacy(samples, rules):
+    """逐条评估：每个采样遍历该设备的全部规则（对应原先每次查询设备规则）"""
+    by_device = {}
+    for rule in rules:
+        by_device.setdefault(rule.device_id, []).append(rule)
+    pairs = []
+    for i, sample in enumerate(samples):
+        for rule in by_device.get(sample.device_id, []) + by_device.get(None, []):
+            if rule.metric_name == sample.metric_name and legacy_evaluate(sample.value, rule):
+                pairs.append((i, rule.id))
+    return pairs
+
+
+def run_indexed(index, samples):
+    return [(i, rule.id) for i, sample in enumerate(samples)
+            for rule, _ in index.evaluate(sample.device_id, sample.metric_name, sample.value)]
+
+
+def run_vectorized(index, samples):
+    devices = []
+    positions = {}
+    device_idx, metric_ids, values = [], [], []
+    for sample in samples:
+        position = positions.get(sample.device_id)
+        if position is None:
+            position = positions[sample.device_id] = len(devices)
+            devices.append(sample.device_id)
+        device_idx.append(position)
+        metric_ids.append(index.metric_id(sample.metric_name))
+        values.append(sample.value)
+    return [(i, rule.id) for i, rule in index.evaluate_columns(devices, device_idx, metric_ids, values)]
+
+
+def best_of(func, *args):
+    best = None
+    result = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    """主函数"""
+    if np is None:
+        print("❌ 未安装numpy，无法运行向量化评估")
+        return 1
+
+    random.seed(42)
+    device_ids = [uuid.uuid4() for _ in range(DEVICES)]
+    rules = make_rules(device_ids)
+    index = AlertRuleIndex()
+    index.build(rules)
+
+    print("=" * 60)
+    print(f"告警评估性能对比（{len(rules)} 条规则，{DEVICES} 个设备）")
+    print("=" * 60)
+    print(f"{'批次大小':>8} {'原逐条(ms)':>12} {'索引逐条(ms)':>14} {'向量化(ms)':>12} {'触发数':>8}")
+
+    consistent = True
+    for batch_size in BATCH_SIZES:
+        samples = [
+            AlertSample(random.choice(device_ids), random.choice(METRICS), round(random.gauss(50, 10), 1))
+            for _ in range(batch_size)
+        ]
+        legacy_time, legacy_pairs = best_of(run_legacy, samples, rules)
+        indexed_time, indexed_pairs = best_of(run_indexed, index, samples)
+        vector_time, vector_pairs = best_of(run_vectorized, index, samples)
+        if not (set(legacy_pairs) == set(indexed_pairs) == set(vector_pairs)):
+            consistent = False
+        print(
+            f"{batch_size:>8} {legacy_time * 1000:>12.2f} {indexed_time * 1000:>14.2f} "
+            f"{vector_time * 1000:>12.2f} {len(vector_pairs):>8}"
+        )
+
+    print("-" * 60)
+    if consistent:
+        print("✅ 三种评估方式结果一致")
+        return 0
+    print("❌ 评估结果不一致")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
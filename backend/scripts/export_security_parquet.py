@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+离线导出审计日志/安全事件为Parquet文件（需要安装 pyarrow）
+
+用法:
+    python scripts/export_security_parquet.py audit_logs audit_2026q3.parquet --start 2026-07-01 --end 2026-10-01
+    python scripts/export_security_parquet.py events events.parquet --severity critical
+"""
+import sys
+import argparse
+import asyncio
+import logging
+from datetime import datetime
+from pathlib import Path
+
+# 添加backend目录到路径
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app.services.export import EXPORT_MODELS, write_parquet
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="导出审计日志/安全事件为Parquet文件")
+    parser.add_argument("table", choices=sorted(EXPORT_MODELS), help="导出的表")
+    parser.add_argument("output", help="输出文件路径")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="开始时间（ISO格式）")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="结束时间（ISO格式）")
+    parser.add_argument("--log-type", help="审计日志类型（仅 audit_logs）")
+    parser.add_argument("--severity", help="事件级别（仅 events）")
+    return parser.parse_args()
+
+
+async def run(args) -> int:
+    filters = {}
+    if args.table == "audit_logs" and args.log_type:
+        filters["log_type"] = args.log_type
+    if args.table == "events" and args.severity:
+        filters["severity"] = args.severity
+    return await write_parquet(
+        EXPORT_MODELS[args.table], args.output,
+        start_time=args.start, end_time=args.end, **filters
+    )
+
+
+def main():
+    """主函数"""
+    args = parse_args()
+    try:
+        count = asyncio.run(run(args))
+    except Exception as e:
+        logger.error(f"导出失败: {e}")
+        return 1
+    logger.info(f"导出完成: {count} 行 -> {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+测试内存IP黑名单匹配（单个IP、CIDR网段、IPv6、过期、增删、同步消息），不需要数据库
+"""
+import sys
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+# 添加backend目录到路径
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app.services.ip_blacklist import IPBlacklist
+
+LOOKUPS = 100000
+
+
+def check(name, actual, expected):
+    if actual == expected:
+        print(f"✅ {name}")
+        return True
+    print(f"❌ {name}: 期望 {expected}，实际 {actual}")
+    return False
+
+
+def test_matching():
+    """测试单个IP和CIDR网段匹配"""
+    print("=" * 60)
+    print("测试单个IP和CIDR网段匹配")
+    print("=" * 60)
+
+    now = datetime.now(timezone.utc)
+    blacklist = IPBlacklist()
+    blacklist.build([
+        ("192.168.1.10", None),
+        ("10.0.0.0/8", None),
+        ("2001:db8::/32", None),
+        ("172.16.0.1", now - timedelta(minutes=1)),
+        ("172.16.0.2", now + timedelta(minutes=10)),
+    ])
+    results = [
+        check("单个IP命中", blacklist.is_blacklisted("192.168.1.10"), True),
+        check("相邻IP未命中", blacklist.is_blacklisted("192.168.1.11"), False),
+        check("网段内地址命中", blacklist.is_blacklisted("10.20.30.40"), True),
+        check("网段外地址未命中", blacklist.is_blacklisted("11.0.0.1"), False),
+        check("IPv6网段命中", blacklist.is_blacklisted("2001:db8:1::5"), True),
+        check("IPv6网段外未命中", blacklist.is_blacklisted("2001:db9::1"), False),
+        check("IPv4映射的IPv6地址按IPv4匹配", blacklist.is_blacklisted("::ffff:10.1.2.3"), True),
+        check("已过期条目未命中", blacklist.is_blacklisted("172.16.0.1"), False),
+        check("未过期条目命中", blacklist.is_blacklisted("172.16.0.2"), True),
+        check("无效地址未命中", blacklist.is_blacklisted("not-an-ip"), False),
+    ]
+    return all(results)
+
+
+def test_incremental_updates():
+    """测试增量增删和同步消息"""
+    print("\n" + "=" * 60)
+    print("测试增量更新和同步消息")
+    print("=" * 60)
+
+    blacklist = IPBlacklist()
+    blacklist.build([])
+    blacklist.add("203.0.113.0/24")
+    results = [check("添加网段后命中", blacklist.is_blacklisted("203.0.113.7"), True)]
+    blacklist.remove("203.0.113.0/24")
+    results.append(check("移除网段后未命中", blacklist.is_blacklisted("203.0.113.7"), False))
+    results.append(check("移除后前缀树为空", len(blacklist), 0))
+
+    blacklist.apply_message(json.dumps({"origin": "other", "action": "add", "ip": "198.51.100.1/32", "expiry_at": None}))
+    results.append(check("其他实例的添加消息生效", blacklist.is_blacklisted("198.51.100.1"), True))
+    blacklist.apply_message(json.dumps({"origin": blacklist.instance_id, "action": "remove", "ip": "198.51.100.1/32"}))
+    results.append(check("忽略本实例发布的消息", blacklist.is_blacklisted("198.51.100.1"), True))
+    blacklist.apply_message(json.dumps({"origin": "other", "action": "remove", "ip": "198.51.100.1"}))
+    results.append(check("其他实例的移除消息生效", blacklist.is_blacklisted("198.51.100.1"), False))
+    blacklist.apply_message(b"not json")
+    results.append(check("无效消息被忽略", len(blacklist), 0))
+    return all(results)
+
+
+def test_lookup_speed():
+    """测试匹配耗时"""
+    print("\n" + "=" * 60)
+    print("测试匹配耗时")
+    print("=" * 60)
+
+    blacklist = IPBlacklist()
+    blacklist.build(
+        [(f"10.{i // 256}.{i % 256}.0/24", None) for i in range(5000)]
+        + [(f"192.168.{i // 256}.{i % 256}", None) for i in range(5000)]
+    )
+    addresses = [f"172.{i % 256}.{(i // 256) % 256}.1" for i in range(1000)]
+    start = time.perf_counter()
+    for i in range(LOOKUPS):
+        blacklist.is_blacklisted(addresses[i % len(addresses)])
+    per_lookup = (time.perf_counter() - start) / LOOKUPS * 1e6
+    print(f"{len(blacklist)} 条黑名单，平均每次匹配 {per_lookup:.2f} 微秒")
+    return check("平均匹配耗时低于50微秒", per_lookup < 50, True)
+
+
+def main():
+    """主函数"""
+    results = [
+        ("单个IP和CIDR网段匹配", test_matching()),
+        ("增量更新和同步消息", test_incremental_updates()),
+        ("匹配耗时", test_lookup_speed()),
+    ]
+
+    # 汇总结果
+    print("\n" + "=" * 60)
+    print("测试结果汇总")
+    print("=" * 60)
+
+    passed = 0
+    total = len(results)
+
+    for test_name, result in results:
+        status = "✅ 通过" if result else "❌ 失败"
+        print(f"{test_name}: {status}")
+        if result:
+            passed += 1
+
+    print("\n" + "-" * 60)
+    print(f"总计: {passed}/{total} 测试通过")
+    print("-" * 60)
+
+    if passed == total:
+        print("\n🎉 所有测试通过！")
+        return 0
+    else:
+        print(f"\n⚠️  {total - passed} 个测试失败")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
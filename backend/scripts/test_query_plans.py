@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+测试列表查询的执行计划
+在本地PostgreSQL中写入测试数据（事务结束时回滚），检查指标/告警/安全事件/审计日志查询是否走索引
+需要先执行 alembic upgrade head
+"""
+import sys
+import json
+import uuid
+from pathlib import Path
+
+# 添加backend目录到路径
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from sqlalchemy import text
+from app.core.database import sync_engine
+
+# 每张表写入的测试数据行数
+SEED_ROWS = 50000
+SEED_DEVICES = 20
+
+INDEX_NODE_TYPES = ("Index Scan", "Index Only Scan", "Bitmap Index Scan")
+
+# (名称, 查询SQL（与服务层查询一致）, 可接受的索引)
+QUERY_CASES = [
+    (
+        "设备指标（设备 + 指标类型 + 时间范围）",
+        "SELECT * FROM device_metrics WHERE device_id = :device AND timestamp >= now() - interval '1 day' "
+        "AND timestamp <= now() AND metric_type = 'temperature' ORDER BY timestamp DESC LIMIT 100",
+        ("ix_device_metrics_device_id_metric_type_timestamp",),
+    ),
+    (
+        "告警列表（状态 + 级别）",
+        "SELECT * FROM monitoring_alerts WHERE severity = 'high' AND status = 'active' "
+        "ORDER BY created_at DESC LIMIT 100",
+        ("ix_monitoring_alerts_status_severity_created_at", "ix_monitoring_alerts_active_created_at"),
+    ),
+    (
+        "告警列表（设备）",
+        "SELECT * FROM monitoring_alerts WHERE device_id = :device ORDER BY created_at DESC LIMIT 100",
+        ("ix_monitoring_alerts_device_id_created_at",),
+    ),
+    (
+        "安全事件（级别 + 未处理）",
+        "SELECT * FROM security_events WHERE severity = 'high' AND handled = false "
+        "ORDER BY created_at DESC OFFSET 0 LIMIT 100",
+        ("ix_security_events_severity_handled_created_at", "ix_security_events_unhandled_created_at"),
+    ),
+    (
+        "安全事件（无筛选）",
+        "SELECT * FROM security_events ORDER BY created_at DESC OFFSET 0 LIMIT 100",
+        ("ix_security_events_created_at",),
+    ),
+    (
+        "审计日志（类型）",
+        "SELECT * FROM security_audit_logs WHERE log_type = 'login' ORDER BY created_at DESC OFFSET 0 LIMIT 100",
+        ("ix_security_audit_logs_log_type_created_at",),
+    ),
+    (
+        "审计日志（无筛选）",
+        "SELECT * FROM security_audit_logs ORDER BY created_at DESC OFFSET 0 LIMIT 100",
+        ("ix_security_audit_logs_created_at",),
+    ),
+    (
+        "审计日志（游标翻页）",
+        "SELECT * FROM security_audit_logs WHERE created_at <= now() - interval '2 days' "
+        "AND (created_at < now() - interval '2 days' OR id < gen_random_uuid()) "
+        "ORDER BY created_at DESC, id DESC LIMIT 100",
+        ("ix_security_audit_logs_created_at",),
+    ),
+    (
+        "告警列表（游标翻页）",
+        "SELECT * FROM monitoring_alerts WHERE created_at <= now() - interval '2 days' "
+        "AND (created_at < now() - interval '2 days' OR id < 'plan-check-25000') "
+        "ORDER BY created_at DESC, id DESC LIMIT 100",
+        ("ix_monitoring_alerts_created_at",),
+    ),
+]
+
+
+def seed(conn, device_ids):
+    """写入测试数据"""
+    conn.execute(
+        text(
+            "INSERT INTO devices (id, device_id, name, type, status, created_at) "
+            "SELECT id, 'plan-check-' || id, 'plan check', 'sensor', 'online', now() "
+            "FROM unnest(CAST(:ids AS uuid[])) AS id"
+        ),
+        {"ids": device_ids}
+    )
+    rule_id = f"plan-check-{uuid.uuid4()}"
+    conn.execute(
+        text(
+            "INSERT INTO alert_rules (id, name, metric_type, metric_name, condition, threshold, severity, "
+            "message, enabled, priority, created_at, updated_at) "
+            "VALUES (:id, 'plan check', 'sensor', 'temperature', 'gt', 0, 'high', "
+            "'{value} > {threshold}', true, 0, now(), now())"
+        ),
+        {"id": rule_id}
+    )
+    conn.execute(
+        text(
+            "INSERT INTO device_metrics (id, device_id, metric_type, metrics, timestamp) "
+            "SELECT 'plan-check-' || g, (CAST(:ids AS uuid[]))[g % :devices + 1], "
+            "(ARRAY['temperature', 'humidity', 'voltage', 'battery'])[g % 4 + 1], "
+            "CAST('{\"value\": 1}' AS json), now() - g * interval '10 seconds' "
+            "FROM generate_series(1, :rows) AS g"
+        ),
+        {"ids": device_ids, "devices": len(device_ids), "rows": SEED_ROWS}
+    )
+    conn.execute(
+        text(
+            "INSERT INTO monitoring_alerts (id, device_id, rule_id, metrics_id, severity, message, status, created_at) "
+            "SELECT 'plan-check-' || g, (CAST(:ids AS uuid[]))[g % :devices + 1], :rule, 'plan-check-' || g, "
+            "(ARRAY['critical', 'high', 'medium', 'low'])[g % 4 + 1], 'plan check', "
+            "CASE WHEN g % 20 = 0 THEN 'active' ELSE 'resolved' END, now() - g * interval '10 seconds' "
+            "FROM generate_series(1, :rows) AS g"
+        ),
+        {"ids": device_ids, "devices": len(device_ids), "rule": rule_id, "rows": SEED_ROWS}
+    )
+    conn.execute(
+        text(
+            "INSERT INTO security_events (id, event_type, severity, description, handled, created_at) "
+            "SELECT gen_random_uuid(), 'plan_check', (ARRAY['critical', 'high', 'medium', 'low'])[g % 4 + 1], "
+            "'plan check', g % 20 <> 0, now() - g * interval '10 seconds' "
+            "FROM generate_series(1, :rows) AS g"
+        ),
+        {"rows": SEED_ROWS}
+    )
+    conn.execute(
+        text(
+            "INSERT INTO security_audit_logs (id, log_type, action, status, created_at) "
+            "SELECT gen_random_uuid(), (ARRAY['login', 'device', 'certificate', 'policy', 'user'])[g % 5 + 1], "
+            "'plan_check', 'success', now() - g * interval '10 seconds' "
+            "FROM generate_series(1, :rows) AS g"
+        ),
+        {"rows": SEED_ROWS}
+    )
+    for table in ("devices", "device_metrics", "monitoring_alerts", "security_events", "security_audit_logs"):
+        conn.execute(text(f"ANALYZE {table}"))
+
+
+def accepted_index_names(conn, index_names):
+    """可接受的索引名，包括分区表上各分区继承的子索引"""
+    names = set(index_names)
+    result = conn.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = ANY(:names)"
+        ),
+        {"names": list(index_names)}
+    )
+    names.update(row[0] for row in result)
+    return names
+
+
+def collect_scans(plan, scans):
+    """递归收集执行计划中的扫描节点 (节点类型, 表名, 索引名)"""
+    scans.append((plan.get("Node Type"), plan.get("Relation Name"), plan.get("Index Name")))
+    for child in plan.get("Plans", []):
+        collect_scans(child, scans)
+    return scans
+
+
+def check_plan(conn, name, sql, index_names, params):
+    """检查单个查询的执行计划"""
+    print("\n" + "=" * 60)
+    print(f"测试执行计划: {name}")
+    print("=" * 60)
+
+    plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"), params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    scans = collect_scans(plan[0]["Plan"], [])
+    accepted = accepted_index_names(conn, index_names)
+
+    used = [index for node_type, _, index in scans if node_type in INDEX_NODE_TYPES and index in accepted]
+    seq_scans = [relation for node_type, relation, _ in scans if node_type == "Seq Scan"]
+    for node_type, relation, index in scans:
+        if node_type and ("Scan" in node_type):
+            print(f"  {node_type}: {relation or ''} {index or ''}")
+
+    if used and not seq_scans:
+        print(f"✅ 使用索引: {', '.join(sorted(set(used)))}")
+        return True
+    print(f"❌ 未使用预期索引 {', '.join(index_names)}")
+    return False
+
+
+def main():
+    """主函数"""
+    print("\n" + "=" * 60)
+    print("列表查询执行计划测试")
+    print("=" * 60)
+
+    device_ids = [str(uuid.uuid4()) for _ in range(SEED_DEVICES)]
+    results = []
+    with sync_engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            seed(conn, device_ids)
+            params = {"device": device_ids[0]}
+            for name, sql, index_names in QUERY_CASES:
+                results.append((name, check_plan(conn, name, sql, index_names, params)))
+        finally:
+            # 测试数据不保留
+            trans.rollback()
+
+    # 汇总结果
+    print("\n" + "=" * 60)
+    print("测试结果汇总")
+    print("=" * 60)
+
+    passed = 0
+    total = len(results)
+
+    for test_name, result in results:
+        status = "✅ 通过" if result else "❌ 失败"
+        print(f"{test_name}: {status}")
+        if result:
+            passed += 1
+
+    print("\n" + "-" * 60)
+    print(f"总计: {passed}/{total} 测试通过")
+    print("-" * 60)
+
+    if passed == total:
+        print("\n🎉 所有测试通过！")
+        return 0
+    else:
+        print(f"\n⚠️  {total - passed} 个测试失败")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+测试令牌吊销（按jti吊销、刷新令牌只能使用一次、按用户吊销、过期清除、同步消息），不需要Redis
+"""
+import sys
+import json
+import time
+import asyncio
+from pathlib import Path
+
+# 添加backend目录到路径
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app.services.token_revocation import TokenRevocationStore
+
+
+def check(name, actual, expected):
+    if actual == expected:
+        print(f"✅ {name}")
+        return True
+    print(f"❌ {name}: 期望 {expected}，实际 {actual}")
+    return False
+
+
+def make_payload(jti, sub="alice", ttl=3600, iat=None):
+    now = time.time()
+    return {"jti": jti, "sub": sub, "iat": now if iat is None else iat, "exp": now + ttl}
+
+
+async def test_revoke_token():
+    """测试按jti吊销和刷新令牌轮换"""
+    print("=" * 60)
+    print("测试按jti吊销和刷新令牌轮换")
+    print("=" * 60)
+
+    store = TokenRevocationStore()
+    token = make_payload("a1")
+    other = make_payload("b2")
+    results = [
+        check("未吊销的令牌通过", store.is_revoked(token), False),
+        check("首次吊销成功", await store.revoke_token(token), True),
+        check("已吊销的令牌被拒绝", store.is_revoked(token), True),
+        check("同一刷新令牌不能再次使用", await store.revoke_token(token), False),
+        check("其他令牌不受影响", store.is_revoked(other), False),
+        check("已过期的令牌无需吊销", await store.revoke_token(make_payload("c3", ttl=-1)), False),
+    ]
+    return all(results)
+
+
+async def test_revoke_user():
+    """测试按用户吊销"""
+    print("\n" + "=" * 60)
+    print("测试按用户吊销")
+    print("=" * 60)
+
+    store = TokenRevocationStore()
+    before = make_payload("a1", iat=time.time() - 10)
+    await store.revoke_user("alice")
+    after = make_payload("a2", iat=time.time() + 1)
+    results = [
+        check("吊销之前签发的令牌被拒绝", store.is_revoked(before), True),
+        check("吊销之后签发的令牌通过", store.is_revoked(after), False),
+        check("其他用户不受影响", store.is_revoked(make_payload("b1", sub="bob")), False),
+    ]
+    return all(results)
+
+
+def test_sync_and_purge():
+    """测试同步消息和过期清除"""
+    print("\n" + "=" * 60)
+    print("测试同步消息和过期清除")
+    print("=" * 60)
+
+    store = TokenRevocationStore()
+    now = time.time()
+    store.apply_message(json.dumps({"origin": "other", "kind": "token", "id": "x1", "exp": now + 60}))
+    store.apply_message(json.dumps({"origin": store.instance_id, "kind": "token", "id": "x2", "exp": now + 60}))
+    store.apply_message("not json")
+    store.apply_message(json.dumps({"origin": "other", "kind": "token", "id": "x3", "exp": now - 1}))
+    results = [
+        check("其他实例吊销的令牌被拒绝", store.is_revoked({"jti": "x1", "sub": "alice"}), True),
+        check("忽略自己发布的消息", store.stats()["sync_received"], 2),
+        check("已过期的记录在查找时清除", store.is_revoked({"jti": "x3", "sub": "alice"}), False),
+    ]
+    store.apply_message(json.dumps({"origin": "other", "kind": "token", "id": "x4", "exp": now - 1}))
+    results.append(check("过期记录批量清除", store.purge_expired(), 1))
+    results.append(check("剩余吊销记录数", store.stats()["revoked_tokens"], 1))
+    return all(results)
+
+
+def main():
+    """主函数"""
+    results = [
+        ("按jti吊销和刷新令牌轮换", asyncio.run(test_revoke_token())),
+        ("按用户吊销", asyncio.run(test_revoke_user())),
+        ("同步消息和过期清除", test_sync_and_purge()),
+    ]
+
+    # 汇总结果
+    print("\n" + "=" * 60)
+    print("测试结果汇总")
+    print("=" * 60)
+
+    passed = 0
+    total = len(results)
+
+    for test_name, result in results:
+        status = "✅ 通过" if result else "❌ 失败"
+        print(f"{test_name}: {status}")
+        if result:
+            passed += 1
+
+    print("\n" + "-" * 60)
+    print(f"总计: {passed}/{total} 测试通过")
+    print("-" * 60)
+
+    if passed == total:
+        print("\n🎉 所有测试通过！")
+        return 0
+    else:
+        print(f"\n⚠️  {total - passed} 个测试失败")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())